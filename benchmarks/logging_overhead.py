@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measures the per request cost of debug logging on the request path with
+debug logging turned off, comparing eager str.format calls against
+commissaire_http.util.log.debug.
+
+Example: PYTHONPATH=src python3 benchmarks/logging_overhead.py --hosts 100
+"""
+
+import argparse
+import logging
+import timeit
+import uuid
+
+from commissaire_http.util import log
+
+LOGGER = logging.getLogger('Handlers')
+
+
+def make_request(hosts):
+    """
+    Creates the message, route and result a list_hosts call would log.
+
+    :param hosts: Number of hosts in the result.
+    :type hosts: int
+    :returns: Tuple of (jsonrpc message, route dict, jsonrpc result)
+    :rtype: tuple
+    """
+    message = {
+        'jsonrpc': '2.0',
+        'id': str(uuid.uuid4()),
+        'method': 'GET',
+        'params': {},
+    }
+    route_dict = {'controller': 'list_hosts', '_': '/'}
+    result = {
+        'jsonrpc': '2.0',
+        'id': message['id'],
+        'result': [{
+            'address': '10.0.{}.{}'.format(x // 256, x % 256),
+            'status': 'active',
+            'os': 'atomic',
+            'cpus': 4,
+            'memory': 8192,
+            'space': 1000000,
+            'last_check': '2016-01-01T00:00:00',
+        } for x in range(hosts)],
+    }
+    return message, route_dict, result
+
+
+def eager(message, route_dict, result):
+    """
+    The request path logging as it was written before util.log existed.
+    """
+    LOGGER.debug('Using controller {}->{}'.format(route_dict, 'list_hosts'))
+    LOGGER.debug('Request transformed to "{}"'.format(message))
+    LOGGER.debug('Handler {} returned "{}"'.format('list_hosts', result))
+
+
+def lazy(message, route_dict, result):
+    """
+    The request path logging using util.log.
+    """
+    log.debug(LOGGER, 'Using controller {}->{}', route_dict, 'list_hosts')
+    log.debug(LOGGER, 'Request transformed to "{}"', message)
+    log.debug(LOGGER, 'Handler {} returned "{}"', 'list_hosts', result)
+
+
+def main():
+    """
+    Main entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--hosts', type=int, default=100,
+        help='Number of hosts returned by the simulated handler')
+    parser.add_argument(
+        '--number', type=int, default=2000,
+        help='Requests per timing run')
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='Timing runs (best is used)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    request = make_request(args.hosts)
+
+    results = {}
+    for func in (eager, lazy):
+        timings = timeit.repeat(
+            lambda: func(*request), number=args.number, repeat=args.repeat)
+        results[func.__name__] = min(timings) / args.number * 1000000
+
+    print('hosts per response: {}'.format(args.hosts))
+    for name, usec in sorted(results.items()):
+        print('{:>6}: {:10.2f} us/request'.format(name, usec))
+    print(' saved: {:10.2f} us/request'.format(
+        results['eager'] - results['lazy']))
+
+
+if __name__ == '__main__':
+    main()
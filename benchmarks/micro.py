@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Microbenchmarks of the helpers every request goes through.
+
+'run' times each benchmark over several runs, calibrating the loops per
+run first, and can save the results as a baseline. 'compare' reports the
+change of each benchmark against a baseline and exits with 1 when one
+got slower by more than the threshold.
+
+Example: PYTHONPATH=src python3 benchmarks/micro.py run -o baseline.json
+         PYTHONPATH=src python3 benchmarks/micro.py run -o new.json
+         PYTHONPATH=src python3 benchmarks/micro.py compare baseline.json \\
+             new.json --threshold 0.1
+"""
+
+import argparse
+import base64
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+
+from collections import OrderedDict
+
+from commissaire_http.authentication import Authenticator, decode_basic_auth
+from commissaire_http.handlers import (
+    JSONRPC_Handler, create_jsonrpc_response, get_params,
+    parse_query_string)
+from commissaire_http.server.routing import ROUTER
+from commissaire_http.util.wsgi import FakeStartResponse
+
+#: Hosts returned by the benchmarked JSON-RPC handler
+HOSTS = [{
+    'address': '10.0.0.{}'.format(index),
+    'status': 'active',
+    'os': 'rhel',
+    'cpus': 4,
+    'memory': 8192,
+    'space': 1000000,
+    'last_check': '2016-01-01T00:00:00',
+} for index in range(20)]
+
+
+def list_hosts(message, bus):
+    """
+    JSON-RPC handler returning a canned host list.
+    """
+    return create_jsonrpc_response(message['id'], HOSTS)
+
+
+class PassingAuthenticator(Authenticator):
+    """
+    Authenticator accepting every request.
+    """
+
+    def authenticate(self, environ, start_response):
+        return True
+
+
+class OwningAuthenticator(Authenticator):
+    """
+    Authenticator accepting every request with its own response, so the
+    headers are merged.
+    """
+
+    def authenticate(self, environ, start_response):
+        start_response('200 OK', [('Set-Cookie', 'token=abc')])
+        return True
+
+
+def app(environ, start_response):
+    """
+    WSGI app behind the benchmarked authenticators.
+    """
+    start_response('200 OK', [('content-type', 'application/json')])
+    return [b'[]']
+
+
+def make_environ(method, path, query='', body=None):
+    """
+    Creates a routed WSGI environment.
+
+    :param method: The HTTP method.
+    :type method: str
+    :param path: The request path.
+    :type path: str
+    :param query: The query string.
+    :type query: str
+    :param body: The JSON body.
+    :type body: bytes or None
+    :rtype: dict
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'commissaire.bus': None,
+    }
+    if body is not None:
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ['wsgi.input'] = io.BytesIO(body)
+    environ['commissaire.routematch'] = ROUTER.routematch(path, environ)
+    return environ
+
+
+def make_benchmarks():
+    """
+    Creates the benchmarks.
+
+    :returns: Map of benchmark names to callables taking no arguments.
+    :rtype: OrderedDict
+    """
+    benchmarks = OrderedDict()
+    get_environ = make_environ(
+        'GET', '/api/v0/hosts/', 'status=active&os=rhel&os=fedora')
+    body = json.dumps({'type': 'kubernetes', 'network': 'default'}).encode()
+    put_environ = make_environ('PUT', '/api/v0/cluster/c1/', body=body)
+
+    def get_params_put():
+        # The body is read, so every call needs a fresh input
+        put_environ['wsgi.input'] = io.BytesIO(body)
+        get_params(put_environ)
+
+    benchmarks['get_params_get'] = lambda: get_params(get_environ)
+    benchmarks['get_params_put'] = get_params_put
+    benchmarks['parse_query_string'] = lambda: parse_query_string(
+        'status=active&os=rhel&os=fedora&name=a%20b')
+    error = ValueError('Bad request')
+    benchmarks['create_jsonrpc_response_result'] = (
+        lambda: create_jsonrpc_response('id', HOSTS))
+    benchmarks['create_jsonrpc_response_error'] = (
+        lambda: create_jsonrpc_response('id', error=error, error_code=-32602))
+
+    handler = JSONRPC_Handler(list_hosts)
+    handler_environ = make_environ('GET', '/api/v0/hosts/')
+    benchmarks['jsonrpc_handler_call'] = (
+        lambda: handler(handler_environ, FakeStartResponse()))
+
+    match_environ = {'REQUEST_METHOD': 'GET'}
+    benchmarks['router_match'] = lambda: ROUTER.match(
+        '/api/v0/cluster/c1/hosts/10.0.0.1/', environ=match_environ)
+    benchmarks['router_match_miss'] = lambda: ROUTER.match(
+        '/api/v0/nothing/here/', environ=match_environ)
+
+    auth = 'Basic ' + base64.b64encode(b'user:password').decode()
+    logger = logging.getLogger('authentication')
+    benchmarks['decode_basic_auth'] = lambda: decode_basic_auth(logger, auth)
+
+    auth_environ = {'REQUEST_METHOD': 'GET', 'HTTP_AUTHORIZATION': auth}
+    passing = PassingAuthenticator(app)
+    owning = OwningAuthenticator(app)
+    benchmarks['authenticator_call'] = (
+        lambda: passing(auth_environ, FakeStartResponse()))
+    benchmarks['authenticator_call_owned'] = (
+        lambda: owning(auth_environ, FakeStartResponse()))
+    return benchmarks
+
+
+def time_loops(func, loops):
+    """
+    Times calls of a function.
+
+    :param func: The function to call.
+    :type func: callable
+    :param loops: Number of calls.
+    :type loops: int
+    :returns: Seconds per call.
+    :rtype: float
+    """
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - started) / loops
+
+
+def calibrate(func, min_time):
+    """
+    Finds the number of loops making a run last at least min_time.
+
+    :param func: The function to call.
+    :type func: callable
+    :param min_time: Seconds a run should last.
+    :type min_time: float
+    :rtype: int
+    """
+    loops = 1
+    while time_loops(func, loops) * loops < min_time:
+        loops *= 2
+    return loops
+
+
+def bench(func, runs, warmups, min_time):
+    """
+    Times a function over several runs.
+
+    :param func: The function to call.
+    :type func: callable
+    :param runs: Number of measured runs.
+    :type runs: int
+    :param warmups: Number of runs before measuring.
+    :type warmups: int
+    :param min_time: Seconds each run should last.
+    :type min_time: float
+    :returns: The loops per run, seconds per call of each run and their
+              median, mean and standard deviation.
+    :rtype: dict
+    """
+    loops = calibrate(func, min_time)
+    for _ in range(warmups):
+        time_loops(func, loops)
+    values = [time_loops(func, loops) for _ in range(runs)]
+    return {
+        'loops': loops,
+        'values': values,
+        'median': statistics.median(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def format_time(seconds):
+    """
+    Formats seconds per call for humans.
+
+    :param seconds: Seconds.
+    :type seconds: float
+    :rtype: str
+    """
+    if seconds >= 1e-3:
+        return '{:.2f} ms'.format(seconds * 1e3)
+    if seconds >= 1e-6:
+        return '{:.2f} us'.format(seconds * 1e6)
+    return '{:.0f} ns'.format(seconds * 1e9)
+
+
+def metadata():
+    """
+    Describes where the benchmarks ran. Results are only comparable when
+    this matches.
+
+    :rtype: dict
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'hostname': platform.node(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Compares results against a baseline.
+
+    :param baseline: The baseline results.
+    :type baseline: dict
+    :param current: The new results.
+    :type current: dict
+    :param threshold: Fraction a median may grow before it is a
+                      regression (IE: 0.1 for 10%).
+    :type threshold: float
+    :returns: Lines to print and the names of the regressed benchmarks.
+    :rtype: tuple
+    """
+    lines = []
+    regressions = []
+    for key in ('python', 'implementation', 'platform', 'hostname'):
+        before = baseline['metadata'].get(key)
+        after = current['metadata'].get(key)
+        if before != after:
+            lines.append('warning: {} differs: {} != {}'.format(
+                key, before, after))
+    for name, result in sorted(current['benchmarks'].items()):
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            lines.append('{:32} {:>10} (new)'.format(
+                name, format_time(result['median'])))
+            continue
+        change = result['median'] / base['median'] - 1
+        verdict = ''
+        if change > threshold:
+            verdict = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            verdict = 'faster'
+        lines.append('{:32} {:>10} -> {:>10} {:+7.1%} {}'.format(
+            name, format_time(base['median']),
+            format_time(result['median']), change, verdict).rstrip())
+    return lines, regressions
+
+
+def load(path):
+    """
+    Loads saved results.
+
+    :param path: Path of the results.
+    :type path: str
+    :rtype: dict
+    """
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def run_command(args):
+    """
+    Runs the benchmarks.
+
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace
+    :returns: Exit code.
+    :rtype: int
+    """
+    benchmarks = make_benchmarks()
+    names = args.benchmark or list(benchmarks)
+    unknown = set(names).difference(benchmarks)
+    if unknown:
+        sys.stderr.write('Unknown benchmarks: {}\n'.format(
+            ', '.join(sorted(unknown))))
+        return 2
+
+    results = {'metadata': metadata(), 'benchmarks': {}}
+    for name in names:
+        result = bench(
+            benchmarks[name], args.runs, args.warmups, args.min_time)
+        results['benchmarks'][name] = result
+        print('{:32} {:>10} +- {}'.format(
+            name, format_time(result['median']),
+            format_time(result['stdev'])))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+            output.write('\n')
+    if args.compare:
+        return compare_results(load(args.compare), results, args.threshold)
+    return 0
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Prints the comparison of results against a baseline.
+
+    :param baseline: The baseline results.
+    :type baseline: dict
+    :param current: The new results.
+    :type current: dict
+    :param threshold: Fraction a median may grow before it is a
+                      regression.
+    :type threshold: float
+    :returns: Exit code, 1 if any benchmark regressed.
+    :rtype: int
+    """
+    lines, regressions = compare(baseline, current, threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print('{} of {} benchmarks regressed by more than {:.0%}'.format(
+            len(regressions), len(current['benchmarks']), threshold))
+        return 1
+    return 0
+
+
+def main():
+    """
+    Main entry point.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument(
+        'benchmark', nargs='*', help='Benchmarks to run. Defaults to all.')
+    run_parser.add_argument(
+        '--runs', type=int, default=20, help='Measured runs per benchmark')
+    run_parser.add_argument(
+        '--warmups', type=int, default=1, help='Runs before measuring')
+    run_parser.add_argument(
+        '--min-time', type=float, default=0.1,
+        help='Seconds each run should last')
+    run_parser.add_argument(
+        '-o', '--output', help='Save the results, IE: as a baseline')
+    run_parser.add_argument(
+        '--compare', metavar='BASELINE',
+        help='Compare the results against a baseline')
+    run_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Slowdown of the median counted as a regression')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compare saved results against a baseline')
+    compare_parser.add_argument('baseline', help='The baseline results')
+    compare_parser.add_argument('current', help='The new results')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Slowdown of the median counted as a regression')
+    args = parser.parse_args()
+
+    # Keep logging off the measurements, as in production
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == 'run':
+        sys.exit(run_command(args))
+    sys.exit(compare_results(
+        load(args.baseline), load(args.current), args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Soak test of CommissaireHttpServer, backed by stand-in bus services,
+looking for resources growing without bound.
+
+Clients send a mix of valid requests, authentication failures, malformed
+bodies, requests for unknown routes and records, and requests to a
+handler which raises. RSS, threads, open file descriptors and gc state
+are sampled as JSON lines. Once done the later samples are compared
+against the earlier ones and the exit code is 1 if any grew past its
+tolerance.
+
+Example: PYTHONPATH=src python3 benchmarks/soak.py --duration 14400
+"""
+
+import argparse
+import base64
+import gc
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from collections import Counter
+
+from commissaire_http.authentication import (
+    CREDENTIAL_BASIC, AuthenticationManager, Authenticator,
+    decode_basic_auth)
+from commissaire_http.server.routing import DISPATCHER, ROUTER
+
+from standin import Fault, StandInResponder, StandInStorage, start_server
+from throughput import MIXES, rss_bytes
+
+#: Credentials accepted by the soak authenticator
+USER, PASSWORD = 'soak', 'soak'
+
+#: Route of the handler which always raises
+CRASH_PATH = '/soak/crash/'
+
+#: Weighted kinds of requests as (weight, kind)
+KINDS = [
+    (70, 'valid'),
+    (8, 'bad_credentials'),
+    (4, 'no_credentials'),
+    (6, 'malformed_body'),
+    (4, 'unknown_route'),
+    (4, 'unknown_record'),
+    (4, 'handler_exception'),
+]
+
+#: Growth tolerated per resource as (absolute, fraction of the start)
+TOLERANCES = {
+    'rss_bytes': (16 * 1024 * 1024, 0.10),
+    'threads': (4, 0.0),
+    'fds': (8, 0.0),
+    'gc_objects': (10000, 0.10),
+    'gc_garbage': (0, 0.0),
+}
+
+
+class SoakAuthenticator(Authenticator):
+    """
+    Accepts the soak credentials given with basic authentication.
+    """
+
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_BASIC,)
+
+    def authenticate(self, environ, start_response):
+        """
+        Checks the credentials of a request.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: True if the soak credentials were given.
+        :rtype: bool
+        """
+        return decode_basic_auth(
+            None, environ.get('HTTP_AUTHORIZATION')) == (USER, PASSWORD)
+
+
+def crash(environ, start_response):
+    """
+    Handler which always raises, to be caught by Dispatcher.dispatch.
+    """
+    raise RuntimeError('Raised by the soak test')
+
+
+def basic_auth(user, password):
+    """
+    Returns a basic authentication header value.
+
+    :param user: The user name.
+    :type user: str
+    :param password: The password.
+    :type password: str
+    :rtype: str
+    """
+    return 'Basic ' + base64.b64encode(
+        '{}:{}'.format(user, password).encode()).decode()
+
+
+class Client(threading.Thread):
+    """
+    Client thread sending the soak mix until stopped. Only counts are
+    kept so its memory use does not grow with the duration.
+    """
+
+    def __init__(self, address, hosts, clusters, stop):
+        """
+        Initializes a new Client instance.
+
+        :param address: The (host, port) of the server.
+        :type address: tuple
+        :param hosts: Number of seeded hosts.
+        :type hosts: int
+        :param clusters: Number of seeded clusters.
+        :type clusters: int
+        :param stop: Set to stop the client.
+        :type stop: threading.Event
+        """
+        super(Client, self).__init__(daemon=True)
+        self.address = address
+        self.hosts = hosts
+        self.clusters = clusters
+        self.stop = stop
+        self.random = random.Random()
+        self.valid = [request[1:] for request in MIXES['mixed']]
+        self.valid_weights = [request[0] for request in MIXES['mixed']]
+        self.kinds = [kind for _, kind in KINDS]
+        self.kind_weights = [weight for weight, _ in KINDS]
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    @property
+    def counts(self):
+        """
+        Responses sent so far by (kind, status).
+
+        :rtype: Counter
+        """
+        with self._lock:
+            return Counter(self._counts)
+
+    def next_request(self):
+        """
+        Picks the next request.
+
+        :returns: Tuple of (kind, method, path, body, headers)
+        :rtype: tuple
+        """
+        kind = self.random.choices(self.kinds, self.kind_weights)[0]
+        host = StandInStorage.host_address(
+            self.random.randrange(max(self.hosts, 1)))
+        cluster = StandInStorage.cluster_name(
+            self.random.randrange(max(self.clusters, 1)))
+        headers = {'Authorization': basic_auth(USER, PASSWORD)}
+        body = None
+        if kind == 'valid':
+            method, path, body = self.random.choices(
+                self.valid, self.valid_weights)[0]
+            path = path.format(
+                host=host, cluster=cluster, n=self.random.randrange(10))
+            if body is not None:
+                body = json.dumps(body)
+        elif kind in ('bad_credentials', 'no_credentials'):
+            method, path = 'GET', '/api/v0/host/{}/'.format(host)
+            if kind == 'bad_credentials':
+                headers['Authorization'] = basic_auth(USER, 'wrong')
+            else:
+                del headers['Authorization']
+        elif kind == 'malformed_body':
+            method, path = 'PUT', '/api/v0/cluster/{}/'.format(cluster)
+            body = '{"type": "kubernetes", '
+        elif kind == 'unknown_route':
+            method, path = 'GET', '/api/v0/nothing/{}/'.format(host)
+        elif kind == 'unknown_record':
+            method, path = 'GET', '/api/v0/host/192.0.2.{}/'.format(
+                self.random.randrange(256))
+        else:
+            method, path = 'GET', CRASH_PATH
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        return kind, method, path, body, headers
+
+    def run(self):
+        """
+        Sends requests until stopped.
+        """
+        connection = http.client.HTTPConnection(*self.address, timeout=60)
+        while not self.stop.is_set():
+            kind, method, path, body, headers = self.next_request()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = 'error'
+            with self._lock:
+                self._counts[(kind, status)] += 1
+        connection.close()
+
+
+def sample():
+    """
+    Samples the resources of the process.
+
+    :returns: RSS, threads, open file descriptors and gc state.
+    :rtype: dict
+    """
+    rss, _ = rss_bytes()
+    try:
+        fds = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        fds = None
+    return {
+        'rss_bytes': rss,
+        'threads': threading.active_count(),
+        'fds': fds,
+        'gc_objects': len(gc.get_objects()),
+        'gc_garbage': len(gc.garbage),
+        'gc_counts': list(gc.get_count()),
+        'gc_collections': [stats['collections'] for stats in gc.get_stats()],
+    }
+
+
+def check_growth(samples, tolerances=TOLERANCES):
+    """
+    Compares the median of the last third of the samples of each
+    resource against the median of the first third.
+
+    :param samples: The samples taken after the warm up, in order.
+    :type samples: list
+    :param tolerances: Growth tolerated per resource as (absolute,
+                       fraction of the start).
+    :type tolerances: dict
+    :returns: Growth per resource with its slope per hour and if it
+              grew past its tolerance. Empty with too few samples.
+    :rtype: dict
+    """
+    third = len(samples) // 3
+    if third < 2:
+        return {}
+    hours = (samples[-1]['time'] - samples[0]['time']) / 3600
+    results = {}
+    for name, (absolute, fraction) in sorted(tolerances.items()):
+        values = [entry[name] for entry in samples]
+        if None in values:
+            continue
+        first = statistics.median(values[:third])
+        last = statistics.median(values[-third:])
+        allowed = max(absolute, first * fraction)
+        results[name] = {
+            'first': first,
+            'last': last,
+            'growth': last - first,
+            'allowed': allowed,
+            'per_hour': (values[-1] - values[0]) / hours if hours else 0.0,
+            'failed': last - first > allowed,
+        }
+    return results
+
+
+def main():
+    """
+    Main entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--duration', type=float, default=3600.0,
+        help='Seconds to run for, after the warm up')
+    parser.add_argument(
+        '--warmup', type=float, default=60.0,
+        help='Seconds to run before samples count')
+    parser.add_argument(
+        '--sample-interval', type=float, default=30.0,
+        help='Seconds between samples')
+    parser.add_argument(
+        '--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument(
+        '--hosts', type=int, default=100, help='Number of hosts to seed')
+    parser.add_argument(
+        '--clusters', type=int, default=10,
+        help='Number of clusters to seed')
+    parser.add_argument(
+        '--fault', action='append', type=Fault.parse,
+        help='Fault injected by the stand-in services, as for '
+             'throughput.py. Defaults to storage.get,error=0.01')
+    parser.add_argument(
+        '--output', help='Also write the samples and results to this file')
+    args = parser.parse_args()
+
+    # Handler exceptions are expected, keep their tracebacks out.
+    # start_server drops the access log.
+    logging.basicConfig(level=logging.CRITICAL)
+    faults = args.fault or [Fault('storage.get', error_rate=0.01)]
+    responder = StandInResponder(
+        StandInStorage(args.hosts, args.clusters), faults=faults)
+    responder.start()
+    ROUTER.connect(CRASH_PATH, controller=crash, conditions={'method': 'GET'})
+    DISPATCHER.dispatch = AuthenticationManager(
+        DISPATCHER.dispatch, [SoakAuthenticator(None)])
+    server, address = start_server(DISPATCHER)
+
+    output = open(args.output, 'w') if args.output else None
+
+    def emit(entry):
+        line = json.dumps(entry, sort_keys=True)
+        print(line, flush=True)
+        if output is not None:
+            output.write(line + '\n')
+            output.flush()
+
+    stop = threading.Event()
+    clients = [
+        Client(address, args.hosts, args.clusters, stop)
+        for _ in range(args.concurrency)]
+    for client in clients:
+        client.start()
+
+    started = time.monotonic()
+    samples = []
+    try:
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= args.warmup + args.duration:
+                break
+            time.sleep(min(
+                args.sample_interval,
+                args.warmup + args.duration - elapsed))
+            entry = sample()
+            entry['time'] = time.monotonic() - started
+            entry['requests'] = sum(
+                sum(client.counts.values()) for client in clients)
+            entry['warmup'] = entry['time'] < args.warmup
+            emit(entry)
+            if not entry['warmup']:
+                samples.append(entry)
+    finally:
+        stop.set()
+        for client in clients:
+            client.join()
+        server._httpd.shutdown()
+        responder.stop()
+
+    counts = Counter()
+    for client in clients:
+        counts.update(client.counts)
+    growth = check_growth(samples)
+    failed = sorted(name for name, result in growth.items()
+                    if result['failed'])
+    emit({
+        'responses': {
+            '{} {}'.format(*key): value
+            for key, value in sorted(counts.items(), key=str)},
+        'injected': dict(responder.injected),
+        'growth': growth,
+        'failed': failed,
+        'passed': bool(growth) and not failed,
+    })
+    if output is not None:
+        output.close()
+    if not growth:
+        sys.stderr.write('Too few samples to judge growth\n')
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,601 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Stand-in bus services for benchmarks.
+
+StandInResponder answers the storage, container manager and job requests
+the handlers make over the bus from in memory records. With kombu's
+memory:// transport the server and the responder run in one process, so
+the HTTP layer can be measured without any other commissaire services.
+
+Faults can be injected per routing key: answers delayed by a latency
+distribution, answered with an error, or never answered so the server
+waits out the bus timeout.
+"""
+
+import fnmatch
+import heapq
+import itertools
+import logging
+import random
+import socket
+import threading
+import time
+
+from collections import Counter
+
+from kombu import Consumer
+
+from commissaire import models
+from commissaire_http import (
+    CommissaireHttpServer, CommissaireRequestHandler)
+from commissaire_http.bus import Bus
+
+#: Exchange the stand-in services listen on
+EXCHANGE_NAME = 'commissaire'
+
+#: Kombu connection url shared by the server and the stand-in services
+CONNECTION_URL = 'memory://'
+
+#: Seconds kombu's virtual transports sleep between polls. The default of
+#: one second would dominate every bus request.
+POLLING_INTERVAL = 0.001
+
+#: Queues of the stand-in services
+QUEUES = [
+    {'name': 'standin.storage', 'routing_key': 'storage.*'},
+    {'name': 'standin.container', 'routing_key': 'container.*'},
+    {'name': 'standin.jobs', 'routing_key': 'jobs.*'},
+]
+
+#: JSON-RPC error code returned for missing records
+NOT_FOUND = -32602
+
+#: JSON-RPC error code returned for injected errors
+INJECTED_ERROR = -32603
+
+#: Delay distributions by name, taking parameters in milliseconds
+DELAYS = {
+    'fixed': lambda rng, ms: ms,
+    'uniform': lambda rng, low, high: rng.uniform(low, high),
+    'exp': lambda rng, mean: rng.expovariate(1.0 / mean),
+    'lognormal': lambda rng, median, sigma: (
+        median * rng.lognormvariate(0, sigma)),
+    'pareto': lambda rng, minimum, alpha: minimum * rng.paretovariate(alpha),
+}
+
+
+class StandInError(Exception):
+    """
+    Raised by a stand-in service to answer with a JSON-RPC error.
+    """
+
+    def __init__(self, message, code=NOT_FOUND):
+        """
+        Initializes a new StandInError instance.
+
+        :param message: The error message.
+        :type message: str
+        :param code: The JSON-RPC error code.
+        :type code: int
+        """
+        super(StandInError, self).__init__(message)
+        self.code = code
+
+
+class Fault:
+    """
+    Faults injected into the answers to requests whose routing key
+    matches a pattern.
+    """
+
+    def __init__(self, pattern, delay=None, error_rate=0.0,
+                 timeout_rate=0.0):
+        """
+        Initializes a new Fault instance.
+
+        :param pattern: Shell style routing key pattern (IE: storage.*).
+        :type pattern: str
+        :param delay: Distribution name and parameters in milliseconds
+                      (IE: ('lognormal', 5, 1)). None answers at once.
+        :type delay: tuple or None
+        :param error_rate: Fraction of requests answered with an error.
+        :type error_rate: float
+        :param timeout_rate: Fraction of requests never answered.
+        :type timeout_rate: float
+        :raises: ValueError
+        """
+        if delay is not None and delay[0] not in DELAYS:
+            raise ValueError('Unknown delay distribution {}'.format(
+                delay[0]))
+        if error_rate + timeout_rate > 1:
+            raise ValueError('Error and timeout rates add up to over 1')
+        self.pattern = pattern
+        self.delay = delay
+        self.error_rate = float(error_rate)
+        self.timeout_rate = float(timeout_rate)
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Parses a fault from the command line.
+
+        :param value: IE: storage.get,delay=exp:20,error=0.01,timeout=0.001
+        :type value: str
+        :returns: The fault.
+        :rtype: Fault
+        :raises: ValueError
+        """
+        pattern, *options = value.split(',')
+        kwargs = {}
+        for option in options:
+            name, _, setting = option.partition('=')
+            if name == 'delay':
+                distribution, *params = setting.split(':')
+                kwargs['delay'] = (distribution,) + tuple(
+                    float(param) for param in params)
+            elif name in ('error', 'timeout'):
+                kwargs[name + '_rate'] = float(setting)
+            else:
+                raise ValueError('Unknown fault option {}'.format(option))
+        return cls(pattern, **kwargs)
+
+    def matches(self, routing_key):
+        """
+        Checks if the fault applies to a routing key.
+
+        :param routing_key: The routing key of a request.
+        :type routing_key: str
+        :rtype: bool
+        """
+        return fnmatch.fnmatchcase(routing_key, self.pattern)
+
+    def sample(self, rng):
+        """
+        Decides how to answer a request.
+
+        :param rng: The random number generator.
+        :type rng: random.Random
+        :returns: Tuple of (outcome, delay in seconds) where outcome is
+                  'answer', 'error' or 'timeout'.
+        :rtype: tuple
+        """
+        outcome = 'answer'
+        roll = rng.random()
+        if roll < self.timeout_rate:
+            outcome = 'timeout'
+        elif roll < self.timeout_rate + self.error_rate:
+            outcome = 'error'
+        delay = 0.0
+        if self.delay is not None:
+            distribution, *params = self.delay
+            delay = max(DELAYS[distribution](rng, *params), 0.0) / 1000
+        return outcome, delay
+
+
+class StandInStorage:
+    """
+    In memory storage seeded with hosts, clusters, networks and container
+    managers. Records are kept as dicts by model type and primary key.
+    """
+
+    def __init__(self, hosts=100, clusters=10):
+        """
+        Initializes a new StandInStorage instance.
+
+        :param hosts: Number of hosts to seed.
+        :type hosts: int
+        :param clusters: Number of clusters to seed. Hosts are spread
+                         across them.
+        :type clusters: int
+        """
+        self._lock = threading.Lock()
+        self.records = {}
+        self.seed(hosts, clusters)
+
+    @staticmethod
+    def host_address(index):
+        """
+        Returns the address of a seeded host.
+
+        :param index: The index of the host.
+        :type index: int
+        :rtype: str
+        """
+        return '10.{}.{}.{}'.format(
+            index // 65536 % 256, index // 256 % 256, index % 256)
+
+    @staticmethod
+    def cluster_name(index):
+        """
+        Returns the name of a seeded cluster.
+
+        :param index: The index of the cluster.
+        :type index: int
+        :rtype: str
+        """
+        return 'cluster{}'.format(index)
+
+    def seed(self, hosts, clusters):
+        """
+        Replaces all records with freshly seeded ones.
+
+        :param hosts: Number of hosts to seed.
+        :type hosts: int
+        :param clusters: Number of clusters to seed.
+        :type clusters: int
+        """
+        records = {}
+
+        def add(model):
+            records.setdefault(model.__class__.__name__, {})[
+                getattr(model, model._primary_key)] = model.to_dict()
+
+        add(models.Network.new(name='default', type='flannel_etcd'))
+        add(models.ContainerManagerConfig.new(
+            name='openshift', type='openshift',
+            options={'server_url': 'https://127.0.0.1:8443/'}))
+        hostsets = [[] for _ in range(clusters)]
+        for index in range(hosts):
+            address = self.host_address(index)
+            add(models.Host.new(
+                address=address, status='active', os='rhel', cpus=4,
+                memory=8192, space=1000000,
+                last_check='2016-01-01T00:00:00',
+                ssh_priv_key='', remote_user='root'))
+            if clusters:
+                hostsets[index % clusters].append(address)
+        for index, hostset in enumerate(hostsets):
+            add(models.Cluster.new(
+                name=self.cluster_name(index), status='ok', type='kubernetes',
+                network='default', hostset=hostset,
+                container_manager='openshift' if index % 2 else ''))
+        with self._lock:
+            self.records = records
+
+    def _key(self, model_type_name, data):
+        """
+        Returns the primary key of a record.
+
+        :param model_type_name: The model class name.
+        :type model_type_name: str
+        :param data: The record.
+        :type data: dict
+        :rtype: str
+        """
+        model_class = getattr(models, model_type_name)
+        return data[model_class._primary_key]
+
+    def get(self, model_type_name, data):
+        """
+        Returns a stored record.
+
+        :param model_type_name: The model class name.
+        :type model_type_name: str
+        :param data: A record holding at least the primary key.
+        :type data: dict
+        :rtype: dict
+        :raises: StandInError
+        """
+        key = self._key(model_type_name, data)
+        with self._lock:
+            try:
+                return dict(self.records[model_type_name][key])
+            except KeyError:
+                raise StandInError('No {} {} stored'.format(
+                    model_type_name, key))
+
+    def save(self, model_type_name, data):
+        """
+        Stores a record.
+
+        :param model_type_name: The model class name.
+        :type model_type_name: str
+        :param data: The record.
+        :type data: dict
+        :rtype: dict
+        """
+        key = self._key(model_type_name, data)
+        with self._lock:
+            self.records.setdefault(model_type_name, {})[key] = dict(data)
+        return data
+
+    def delete(self, model_type_name, data):
+        """
+        Removes a record.
+
+        :param model_type_name: The model class name.
+        :type model_type_name: str
+        :param data: A record holding at least the primary key.
+        :type data: dict
+        :rtype: dict
+        """
+        key = self._key(model_type_name, data)
+        with self._lock:
+            self.records.get(model_type_name, {}).pop(key, None)
+        return {}
+
+    def list(self, model_type_name):
+        """
+        Returns all records of a list model's item type.
+
+        :param model_type_name: The list model class name (IE: Hosts).
+        :type model_type_name: str
+        :rtype: dict
+        """
+        list_class = getattr(models, model_type_name)
+        with self._lock:
+            items = list(self.records.get(
+                list_class._list_class.__name__, {}).values())
+        return {list_class._list_attr: items}
+
+    def handle(self, method, params):
+        """
+        Answers a storage request.
+
+        :param method: The storage method (get, save, delete or list).
+        :type method: str
+        :param params: The request parameters.
+        :type params: dict
+        :returns: The JSON-RPC result.
+        :rtype: mixed
+        :raises: StandInError
+        """
+        model_type_name = params['model_type_name']
+        if method == 'list':
+            return self.list(model_type_name)
+        if method not in ('get', 'save', 'delete'):
+            raise StandInError(
+                'Unknown storage method {}'.format(method), -32601)
+        data = params.get('model_json_data', {})
+        func = getattr(self, method)
+        if isinstance(data, list):
+            return [func(model_type_name, item) for item in data]
+        return func(model_type_name, data)
+
+
+class StandInResponder:
+    """
+    Answers bus requests on a background thread.
+    """
+
+    #: Logger for StandInResponder
+    logger = logging.getLogger('StandInResponder')
+
+    def __init__(self, storage, exchange_name=EXCHANGE_NAME,
+                 connection_url=CONNECTION_URL, faults=()):
+        """
+        Initializes a new StandInResponder instance.
+
+        :param storage: The records to answer storage requests from.
+        :type storage: StandInStorage
+        :param exchange_name: Name of the topic exchange.
+        :type exchange_name: str
+        :param connection_url: Kombu connection url.
+        :type connection_url: str
+        :param faults: Faults to inject. The first matching one applies.
+        :type faults: list
+        """
+        self.storage = storage
+        self.bus = Bus(exchange_name, connection_url, QUEUES)
+        self.faults = list(faults)
+        #: Requests answered by routing key
+        self.answered = {}
+        #: Injected faults by outcome (delayed, error, timeout)
+        self.injected = Counter()
+        self.random = random.Random()
+        # Delayed answers as a heap of (due, sequence, queue, id, answer)
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts answering and waits until the queues are consumed, so no
+        request published afterwards is dropped.
+        """
+        self._stop.clear()
+        self._ready.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='StandInResponder', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        """
+        Stops answering.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """
+        Consumes requests until stopped.
+        """
+        self.bus.connect()
+        self.bus.connection.transport.polling_interval = POLLING_INTERVAL
+        with Consumer(self.bus._channel, queues=self.bus._queues,
+                      callbacks=[self._on_message], accept=['json']):
+            self._ready.set()
+            while not self._stop.is_set():
+                timeout = 0.1
+                if self._delayed:
+                    timeout = min(max(
+                        self._delayed[0][0] - time.monotonic(), 0), timeout)
+                try:
+                    self.bus.connection.drain_events(timeout=timeout)
+                except socket.timeout:
+                    pass
+                self._send_due()
+        self.bus.connection.release()
+        self.bus.connection = None
+
+    @property
+    def pending(self):
+        """
+        Number of delayed answers not sent yet.
+
+        :rtype: int
+        """
+        return len(self._delayed)
+
+    def _send_due(self):
+        """
+        Sends the delayed answers which are due.
+        """
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, queue_name, id, answer = heapq.heappop(self._delayed)
+            self.reply(queue_name, id, **answer)
+
+    def fault_for(self, routing_key):
+        """
+        Returns the fault applying to a routing key.
+
+        :param routing_key: The routing key of a request.
+        :type routing_key: str
+        :rtype: Fault or None
+        """
+        for fault in self.faults:
+            if fault.matches(routing_key):
+                return fault
+        return None
+
+    def handle(self, routing_key, method, params):
+        """
+        Answers a request.
+
+        :param routing_key: The routing key of the request.
+        :type routing_key: str
+        :param method: The JSON-RPC method.
+        :type method: str
+        :param params: The JSON-RPC parameters.
+        :type params: dict or list
+        :returns: The JSON-RPC result.
+        :rtype: mixed
+        :raises: StandInError
+        """
+        service = routing_key.split('.', 1)[0]
+        if service == 'storage':
+            return self.storage.handle(method, params)
+        if routing_key == 'container.get_node_status':
+            return {'status': 'ok'}
+        # Container manager and job requests only need an answer
+        return []
+
+    def _on_message(self, body, message):
+        """
+        Answers a consumed request.
+
+        :param body: The JSON-RPC request.
+        :type body: dict
+        :param message: The kombu message.
+        :type message: kombu.message.Message
+        """
+        message.ack()
+        routing_key = message.delivery_info.get('routing_key', '')
+        method = body.get('method') or routing_key.rsplit('.', 1)[-1]
+        self.answered[routing_key] = self.answered.get(routing_key, 0) + 1
+        outcome, delay = 'answer', 0.0
+        fault = self.fault_for(routing_key)
+        if fault is not None:
+            outcome, delay = fault.sample(self.random)
+        if outcome == 'timeout':
+            self.injected['timeout'] += 1
+            return
+
+        try:
+            if outcome == 'error':
+                self.injected['error'] += 1
+                raise StandInError('Injected fault', INJECTED_ERROR)
+            answer = {'result': self.handle(
+                routing_key, method, body.get('params', {}))}
+        except StandInError as error:
+            answer = {'error': {
+                'code': error.code,
+                'message': str(error),
+                'data': {'exception': str(type(error))},
+            }}
+
+        if delay > 0:
+            self.injected['delayed'] += 1
+            heapq.heappush(self._delayed, (
+                time.monotonic() + delay, next(self._sequence),
+                message.properties['reply_to'], body['id'], answer))
+        else:
+            self.reply(message.properties['reply_to'], body['id'], **answer)
+
+    def reply(self, queue_name, id, result=None, error=None):
+        """
+        Sends a JSON-RPC result or error back to a request.
+
+        :param queue_name: The reply queue of the request.
+        :type queue_name: str
+        :param id: The unique request id.
+        :type id: str
+        :param result: The result.
+        :type result: mixed
+        :param error: The error. Takes the place of the result when given.
+        :type error: dict or None
+        """
+        if error is None:
+            self.bus.respond(queue_name, id, result)
+            return
+        send_queue = self.bus.connection.SimpleQueue(queue_name)
+        send_queue.put({'jsonrpc': '2.0', 'id': id, 'error': error})
+        send_queue.close()
+
+
+class QuietRequestHandler(CommissaireRequestHandler):
+    """
+    CommissaireRequestHandler which does not write the access log.
+    """
+
+    def log_message(self, format, *args):
+        """
+        Override to drop the message instead of writing it to stderr.
+        """
+        pass
+
+
+def start_server(dispatcher, bind_host='127.0.0.1', bind_port=0):
+    """
+    Connects the dispatcher to the stand-in bus and serves it on a
+    background thread without an access log.
+
+    :param dispatcher: The dispatcher to serve.
+    :type dispatcher: commissaire_http.dispatcher.Dispatcher
+    :param bind_host: Host adapter to listen on.
+    :type bind_host: str
+    :param bind_port: Port to listen on. 0 picks a free one.
+    :type bind_port: int
+    :returns: The server and the (host, port) it listens on.
+    :rtype: tuple
+    """
+    dispatcher.setup_bus(EXCHANGE_NAME, CONNECTION_URL, [
+        {'name': 'simple', 'routing_key': 'simple.*'}])
+    dispatcher._bus.connection.transport.polling_interval = POLLING_INTERVAL
+    server = CommissaireHttpServer(
+        bind_host, bind_port, dispatcher, listen_sockets=[])
+    # The access log goes straight to stderr, not through logging
+    server._httpd.RequestHandlerClass = QuietRequestHandler
+    threading.Thread(
+        target=server.serve_forever, name='CommissaireHttpServer',
+        daemon=True).start()
+    return server, server._httpd.server_address[:2]
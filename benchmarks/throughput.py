@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measures end to end throughput of CommissaireHttpServer serving the real
+routes, backed by stand-in bus services on kombu's memory:// transport.
+Client threads drive a weighted mix of host, cluster, network and
+container manager calls and the results are printed as JSON.
+
+With --fault the stand-in services answer slowly, with errors or not at
+all, and the results add a timeline of throughput, p99 latency, threads,
+requests in flight and bus answers pending, to see how the server
+degrades.
+
+Example: PYTHONPATH=src python3 benchmarks/throughput.py --mix read
+         PYTHONPATH=src python3 benchmarks/throughput.py \\
+             --fault 'storage.*,delay=lognormal:5:1,error=0.01' \\
+             --fault 'container.*,delay=pareto:50:1.5,timeout=0.005'
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import random
+import resource
+import threading
+import time
+
+from collections import Counter
+
+from commissaire_http.dispatcher import IN_FLIGHT
+from commissaire_http.server.routing import DISPATCHER
+
+from standin import Fault, StandInResponder, StandInStorage, start_server
+
+#: Weighted requests per mix as (weight, method, path, body)
+MIXES = {
+    'read': [
+        (20, 'GET', '/api/v0/hosts/', None),
+        (25, 'GET', '/api/v0/host/{host}/', None),
+        (10, 'GET', '/api/v0/host/{host}/status/', None),
+        (10, 'GET', '/api/v0/clusters/', None),
+        (15, 'GET', '/api/v0/cluster/{cluster}/', None),
+        (5, 'GET', '/api/v0/cluster/{cluster}/hosts/', None),
+        (5, 'GET', '/api/v0/cluster/{cluster}/hosts/{host}/', None),
+        (3, 'GET', '/api/v0/networks/', None),
+        (3, 'GET', '/api/v0/network/default/', None),
+        (2, 'GET', '/api/v0/containermanagers/', None),
+        (2, 'GET', '/api/v0/containermanager/openshift/', None),
+    ],
+    'mixed': [
+        (15, 'GET', '/api/v0/hosts/', None),
+        (20, 'GET', '/api/v0/host/{host}/', None),
+        (10, 'GET', '/api/v0/host/{host}/status/', None),
+        (10, 'GET', '/api/v0/clusters/', None),
+        (15, 'GET', '/api/v0/cluster/{cluster}/', None),
+        (5, 'GET', '/api/v0/networks/', None),
+        (5, 'GET', '/api/v0/containermanagers/', None),
+        (5, 'PUT', '/api/v0/cluster/{cluster}/hosts/{host}/', None),
+        (5, 'PUT', '/api/v0/network/bench{n}/',
+         {'type': 'flannel_etcd', 'options': {}}),
+        (5, 'DELETE', '/api/v0/network/bench{n}/', None),
+        (5, 'GET', '/api/v0/network/bench{n}/', None),
+    ],
+}
+
+#: Headers sent with every request
+HEADERS = {'Connection': 'keep-alive', 'Content-Type': 'application/json'}
+
+
+class Worker(threading.Thread):
+    """
+    Client thread sending requests over a keep-alive connection,
+    reconnecting whenever the server closes it.
+    """
+
+    def __init__(self, address, mix, hosts, clusters, deadline, measure_from,
+                 timeout=60):
+        """
+        Initializes a new Worker instance.
+
+        :param address: The (host, port) of the server.
+        :type address: tuple
+        :param mix: The weighted requests to send.
+        :type mix: list
+        :param hosts: Number of seeded hosts.
+        :type hosts: int
+        :param clusters: Number of seeded clusters.
+        :type clusters: int
+        :param deadline: Time at which to stop.
+        :type deadline: float
+        :param measure_from: Time before which results are not kept.
+        :type measure_from: float
+        :param timeout: Seconds to wait for a response.
+        :type timeout: float
+        """
+        super(Worker, self).__init__(daemon=True)
+        self.address = address
+        self.requests = [request[1:] for request in mix]
+        self.weights = [request[0] for request in mix]
+        self.hosts = hosts
+        self.clusters = clusters
+        self.deadline = deadline
+        self.measure_from = measure_from
+        self.timeout = timeout
+        self.random = random.Random()
+        #: Seconds taken by each measured request
+        self.latencies = []
+        #: Time each measured request finished
+        self.finished = []
+        #: Measured responses by status, 'error' for failed requests
+        self.statuses = Counter()
+        #: Connections opened by measured requests
+        self.connections = 0
+
+    def next_request(self):
+        """
+        Picks the next request from the mix.
+
+        :returns: Tuple of (method, path, body)
+        :rtype: tuple
+        """
+        method, path, body = self.random.choices(
+            self.requests, self.weights)[0]
+        path = path.format(
+            host=StandInStorage.host_address(
+                self.random.randrange(max(self.hosts, 1))),
+            cluster=StandInStorage.cluster_name(
+                self.random.randrange(max(self.clusters, 1))),
+            n=self.random.randrange(10))
+        if body is not None:
+            body = json.dumps(body)
+        return method, path, body
+
+    def run(self):
+        """
+        Sends requests until the deadline.
+        """
+        connection = http.client.HTTPConnection(
+            *self.address, timeout=self.timeout)
+        while True:
+            started = time.perf_counter()
+            if started >= self.deadline:
+                break
+            method, path, body = self.next_request()
+            reconnect = connection.sock is None
+            try:
+                connection.request(method, path, body=body, headers=HEADERS)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = 'error'
+            if started >= self.measure_from:
+                finished = time.perf_counter()
+                self.latencies.append(finished - started)
+                self.finished.append(finished)
+                self.statuses[status] += 1
+                self.connections += reconnect
+        connection.close()
+
+
+class Sampler(threading.Thread):
+    """
+    Samples thread usage and queueing while the clients run.
+    """
+
+    def __init__(self, responder, interval):
+        """
+        Initializes a new Sampler instance.
+
+        :param responder: The stand-in services.
+        :type responder: standin.StandInResponder
+        :param interval: Seconds between samples.
+        :type interval: float
+        """
+        super(Sampler, self).__init__(daemon=True)
+        self.responder = responder
+        self.interval = interval
+        #: Samples of (time, threads, requests in flight, answers pending)
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        """
+        Samples until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            self.samples.append((
+                time.perf_counter(), threading.active_count(),
+                sum(value.value for _, value in IN_FLIGHT.items()),
+                self.responder.pending))
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest rank percentile of sorted values.
+
+    :param values: The sorted values.
+    :type values: list
+    :param fraction: The percentile as a fraction (IE: 0.99).
+    :type fraction: float
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values), max(
+        1, int(math.ceil(fraction * len(values))))) - 1]
+
+
+def rss_bytes():
+    """
+    Returns the current and peak resident set size of the process.
+
+    :returns: Tuple of (current, peak) bytes. Current is None where
+              /proc is not available.
+    :rtype: tuple
+    """
+    current = None
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    return current, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def timeline(workers, samples, measure_from, duration, interval):
+    """
+    Summarizes the results per interval.
+
+    :param workers: The finished client threads.
+    :type workers: list
+    :param samples: The Sampler samples.
+    :type samples: list
+    :param measure_from: Time measuring started.
+    :type measure_from: float
+    :param duration: Seconds measured.
+    :type duration: float
+    :param interval: Seconds per interval.
+    :type interval: float
+    :returns: Per interval throughput, p99 latency and the peak threads,
+              requests in flight and bus answers pending.
+    :rtype: list
+    """
+    intervals = max(int(math.ceil(duration / interval)), 1)
+    latencies = [[] for _ in range(intervals)]
+    for worker in workers:
+        for finished, latency in zip(worker.finished, worker.latencies):
+            index = int((finished - measure_from) // interval)
+            latencies[min(max(index, 0), intervals - 1)].append(latency)
+    peaks = [(0, 0, 0) for _ in range(intervals)]
+    for sampled, threads, in_flight, pending in samples:
+        index = int((sampled - measure_from) // interval)
+        if 0 <= index < intervals:
+            peaks[index] = tuple(
+                max(pair) for pair in zip(
+                    peaks[index], (threads, in_flight, pending)))
+
+    results = []
+    for index in range(intervals):
+        values = sorted(latencies[index])
+        results.append({
+            'start': index * interval,
+            'requests_per_second': len(values) / interval,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'threads': peaks[index][0],
+            'in_flight': peaks[index][1],
+            'bus_pending': peaks[index][2],
+        })
+    return results
+
+
+def run(address, mix, concurrency, duration, warmup, hosts, clusters,
+        timeout=60, sampler=None):
+    """
+    Drives the server with client threads and summarizes the results.
+
+    :param address: The (host, port) of the server.
+    :type address: tuple
+    :param mix: The name of the request mix.
+    :type mix: str
+    :param concurrency: Number of client threads.
+    :type concurrency: int
+    :param duration: Seconds to measure for.
+    :type duration: float
+    :param warmup: Seconds to run before measuring.
+    :type warmup: float
+    :param hosts: Number of seeded hosts.
+    :type hosts: int
+    :param clusters: Number of seeded clusters.
+    :type clusters: int
+    :param timeout: Seconds clients wait for a response.
+    :type timeout: float
+    :param sampler: Adds a timeline of its samples when given. It
+                    samples ten times per timeline interval.
+    :type sampler: Sampler or None
+    :returns: The results.
+    :rtype: dict
+    """
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+    workers = [
+        Worker(address, MIXES[mix], hosts, clusters, deadline, measure_from,
+               timeout)
+        for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    latencies = sorted(
+        latency for worker in workers for latency in worker.latencies)
+    statuses = Counter()
+    for worker in workers:
+        statuses.update(worker.statuses)
+    rss, max_rss = rss_bytes()
+    results = {
+        'mix': mix,
+        'concurrency': concurrency,
+        'duration': duration,
+        'hosts': hosts,
+        'clusters': clusters,
+        'requests': len(latencies),
+        'errors': statuses.get('error', 0),
+        'statuses': {str(key): value for key, value in statuses.items()},
+        'connections': sum(worker.connections for worker in workers),
+        'requests_per_second': len(latencies) / duration,
+        'latency_ms': {
+            'mean': (sum(latencies) / len(latencies) * 1000
+                     if latencies else 0.0),
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'p999': percentile(latencies, 0.999) * 1000,
+            'max': (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        'rss_bytes': rss,
+        'max_rss_bytes': max_rss,
+    }
+    if sampler is not None:
+        results['timeline'] = timeline(
+            workers, sampler.samples, measure_from, duration,
+            sampler.interval * 10)
+    return results
+
+
+def main():
+    """
+    Main entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--mix', choices=sorted(MIXES), default='read',
+        help='Request mix to drive')
+    parser.add_argument(
+        '--hosts', type=int, default=100, help='Number of hosts to seed')
+    parser.add_argument(
+        '--clusters', type=int, default=10,
+        help='Number of clusters to seed')
+    parser.add_argument(
+        '--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument(
+        '--duration', type=float, default=30.0, help='Seconds to measure')
+    parser.add_argument(
+        '--warmup', type=float, default=2.0,
+        help='Seconds to run before measuring')
+    parser.add_argument(
+        '--timeout', type=float, default=60.0,
+        help='Seconds clients wait for a response')
+    parser.add_argument(
+        '--fault', action='append', type=Fault.parse, default=[],
+        help=('Fault injected by the stand-in services as PATTERN[,delay='
+              'DIST:MS[:PARAM]][,error=RATE][,timeout=RATE], IE: '
+              'storage.*,delay=exp:20,error=0.01. DIST is one of fixed, '
+              'uniform, exp, lognormal or pareto. The first matching '
+              'fault applies.'))
+    parser.add_argument(
+        '--sample-interval', type=float, default=1.0,
+        help='Seconds per timeline interval when injecting faults')
+    parser.add_argument(
+        '--output', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    # Keep server logging off the measurements. start_server drops the
+    # access log.
+    logging.basicConfig(level=logging.WARNING)
+    responder = StandInResponder(
+        StandInStorage(args.hosts, args.clusters), faults=args.fault)
+    responder.start()
+    server, address = start_server(DISPATCHER)
+    sampler = None
+    if args.fault:
+        sampler = Sampler(responder, args.sample_interval / 10)
+        sampler.start()
+    try:
+        results = run(
+            address, args.mix, args.concurrency, args.duration, args.warmup,
+            args.hosts, args.clusters, args.timeout, sampler)
+    finally:
+        if sampler is not None:
+            sampler.stopped.set()
+        server._httpd.shutdown()
+        responder.stop()
+    results['bus_requests'] = responder.answered
+    if args.fault:
+        results['faults'] = [
+            {'pattern': fault.pattern, 'delay': fault.delay,
+             'error_rate': fault.error_rate,
+             'timeout_rate': fault.timeout_rate}
+            for fault in args.fault]
+        results['injected'] = dict(responder.injected)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -62,6 +62,7 @@ setup(
     entry_points={
         'console_scripts': [
             'commissaire-server = commissaire_http.server.cli:main',
+            'commissaire-http-replay = commissaire_http.util.replay:main',
         ],
     }
 
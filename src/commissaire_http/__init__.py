@@ -18,13 +18,44 @@ Main Commissaire application server code.
 """
 
 import logging
+import os
+import socket
+import stat
+import threading
 
-from argparse import Namespace
-from socketserver import ThreadingMixIn
+from argparse import ArgumentTypeError, Namespace
+from http import HTTPStatus
+from socketserver import TCPServer, ThreadingMixIn
 from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
 
 from commissaire.util.config import read_config_file
+from commissaire_http.bus import accounting
+from commissaire_http.util import log, systemd
 from commissaire_http.util.cli import parse_to_struct
+from commissaire_http.util.memory import memory_app
+from commissaire_http.util.metrics import metrics_app
+from commissaire_http.util.profiler import profiler_app
+from commissaire_http.util.tls import get_peer_identity
+
+
+def parse_bus_budget(value):
+    """
+    Parses a ROUTE=CALLS bus budget argument.
+
+    :param value: The argument (IE: /api/v0/cluster/{name}/=5)
+    :type value: str
+    :returns: Tuple of (route template, calls)
+    :rtype: tuple
+    :raises: argparse.ArgumentTypeError
+    """
+    route, sep, calls = value.rpartition('=')
+    try:
+        if not sep or not route:
+            raise ValueError
+        return route, int(calls)
+    except ValueError:
+        raise ArgumentTypeError(
+            'Expected ROUTE=CALLS, got "{}"'.format(value))
 
 
 def parse_args(parser):
@@ -60,6 +91,28 @@ def parse_args(parser):
     parser.add_argument(
         '--listen-port', '-p', type=int, default=8000,
         help='Port to listen on')
+    parser.add_argument(
+        '--listen-unix-socket', type=str, metavar='PATH',
+        help='Unix socket to listen on instead of the interface and port')
+    parser.add_argument(
+        '--listen-unix-socket-mode', type=str, metavar='OCTAL_MODE',
+        help='Permissions of the Unix socket (IE: 0660)')
+    parser.add_argument(
+        '--admin-listen-interface', type=str, default='127.0.0.1',
+        help='Interface for the admin listener serving /metrics, '
+             '/debug/profile, /debug/memory and /debug/log')
+    parser.add_argument(
+        '--admin-listen-port', type=int,
+        help='Port for the admin listener serving /metrics, '
+             '/debug/profile, /debug/memory and /debug/log. The admin '
+             'listener is off unless this is given')
+    parser.add_argument(
+        '--profile-dir', type=str, metavar='PATH',
+        help='Directory profiles are written to. Defaults to the '
+             'temporary directory')
+    parser.add_argument(
+        '--profile-signal', action='store_true',
+        help='Profile all requests for 30 seconds on SIGUSR2')
     parser.add_argument(
         '--tls-pemfile', type=str,
         help='Full path to the TLS PEM for the commissaire server')
@@ -72,6 +125,63 @@ def parse_args(parser):
         dest='authentication_plugins',
         metavar='MODULE_NAME:key=value,..', type=parse_to_struct,
         help=('Authentication Plugin module and configuration.'))
+    parser.add_argument(
+        '--auth-failure-rate', type=float, metavar='PER_SECOND',
+        help='Failed authentications allowed per second for each client '
+             'address and user before requests are rejected with a 429')
+    parser.add_argument(
+        '--auth-failure-burst', type=int, default=10,
+        help='Failed authentications allowed in a row for each client '
+             'address and user')
+    parser.add_argument(
+        '--trusted-proxy', action='append', dest='trusted_proxies',
+        metavar='ADDRESS_OR_NETWORK',
+        help='Trust client address and client certificate headers from '
+             'this TLS terminating proxy. Use "unix" for Unix socket peers')
+    parser.add_argument(
+        '--server-timing', action='store_true',
+        help='Return a Server-Timing header with the time spent in each '
+             'phase to requests sending X-Commissaire-Timing')
+    parser.add_argument(
+        '--server-timing-sample-rate', type=float, default=0.0,
+        metavar='FRACTION',
+        help='Fraction of requests always given a Server-Timing header')
+    parser.add_argument(
+        '--slow-request-threshold', type=float, metavar='SECONDS',
+        help='Log the stack, bus requests and phase timings of requests '
+             'still running after this long, and the phase timings of '
+             'those taking longer once they finish')
+    parser.add_argument(
+        '--slow-request-max-reports', type=int, default=10,
+        help='Slow requests logged per minute')
+    parser.add_argument(
+        '--capture-file', metavar='PATH',
+        help='Append the method, path, query, body size, credential types, '
+             'status and duration of requests to this JSONL file for '
+             'commissaire-http-replay')
+    parser.add_argument(
+        '--capture-sample-rate', type=float, default=1.0,
+        metavar='FRACTION', help='Fraction of requests captured')
+    parser.add_argument(
+        '--bus-budget', action='append', dest='bus_budgets',
+        metavar='ROUTE=CALLS', type=parse_bus_budget,
+        help='Warn when a request to the route template makes more bus '
+             'requests than this')
+    parser.add_argument(
+        '--bus-budget-reject', action='store_true',
+        help='Fail requests going over their bus budget with a 503 instead '
+             'of only warning')
+    parser.add_argument(
+        '--storage-batch-window', type=float, metavar='SECONDS',
+        help='Batch storage gets arriving within this long (IE: 0.001) '
+             'while another storage request is running into one request')
+    parser.add_argument(
+        '--coalesce-requests', action='store_true',
+        help='Share one handler call between identical concurrent GETs')
+    parser.add_argument(
+        '--coalesce-timeout', type=float, default=30.0, metavar='SECONDS',
+        help='Seconds a request waits on an identical in-flight request '
+             'before calling the handler itself')
     parser.add_argument(
         '--bus-exchange', type=str, default='commissaire',
         help='Message bus exchange name.')
@@ -104,7 +214,94 @@ class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
     """
     Threaded version of the WSIServer
     """
-    pass
+
+    def _set_server_name(self):
+        """
+        Sets the server name and port from the bound address.
+        """
+        host, port = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+
+    def adopt_socket(self, sock):
+        """
+        Serves on a socket which is already bound and listening, such as
+        one passed in by systemd. Requires bind_and_activate=False.
+
+        :param sock: The listening socket.
+        :type sock: socket.socket
+        """
+        self.socket.close()
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self._set_server_name()
+        self.setup_environ()
+
+
+class ThreadedUnixWSGIServer(ThreadedWSGIServer):
+    """
+    Threaded WSGIServer listening on a Unix socket.
+    """
+
+    address_family = socket.AF_UNIX
+
+    #: Path of the socket if this server bound it
+    _bound_path = None
+
+    def __init__(self, server_address, RequestHandlerClass,
+                 bind_and_activate=True, mode=None):
+        """
+        Initializes a new ThreadedUnixWSGIServer instance.
+
+        :param server_address: Path of the Unix socket.
+        :type server_address: str
+        :param RequestHandlerClass: The request handler class.
+        :type RequestHandlerClass: type
+        :param bind_and_activate: Bind and listen on the socket.
+        :type bind_and_activate: bool
+        :param mode: Permissions of the socket (IE: 0o660 or '0660')
+        :type mode: int, str or None
+        """
+        if isinstance(mode, str):
+            mode = int(mode, 8)
+        self.mode = mode
+        super(ThreadedUnixWSGIServer, self).__init__(
+            server_address, RequestHandlerClass, bind_and_activate)
+
+    def _set_server_name(self):
+        """
+        Sets the server name and port. Unix sockets have neither.
+        """
+        self.server_name = 'localhost'
+        self.server_port = ''
+
+    def server_bind(self):
+        """
+        Binds the socket, replacing a stale socket left by a previous run.
+        """
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        TCPServer.server_bind(self)
+        self._bound_path = self.server_address
+        if self.mode is not None:
+            os.chmod(self.server_address, self.mode)
+        self._set_server_name()
+        self.setup_environ()
+
+    def server_close(self):
+        """
+        Closes the socket, removing it if this server created it.
+        """
+        super(ThreadedUnixWSGIServer, self).server_close()
+        if self._bound_path is not None:
+            try:
+                os.unlink(self._bound_path)
+            except FileNotFoundError:
+                pass
+            self._bound_path = None
 
 
 class CommissaireRequestHandler(WSGIRequestHandler):
@@ -114,20 +311,167 @@ class CommissaireRequestHandler(WSGIRequestHandler):
     #: The software version of the server
     server_version = 'Commissaire/0.0.4'
 
+    #: (certificate, fingerprint) of the client on this connection
+    _peer_identity = None
+
+    #: WSGI environment of the current request
+    _environ = None
+
+    def setup(self):
+        """
+        Override to give Unix socket peers, which have no address, an
+        empty REMOTE_ADDR.
+        """
+        if not self.client_address:
+            self.client_address = ('', 0)
+        super(CommissaireRequestHandler, self).setup()
+
     def get_environ(self):
         """
-        Override to add SSL_CLIENT_VERIFY to the env.
+        Override to add SSL_CLIENT_VERIFY and SSL_CLIENT_FINGERPRINT to
+        the env. The client certificate is looked up once per connection.
 
         :returns: The WSGI environment
         :rtype: dict
         """
         env = super(CommissaireRequestHandler, self).get_environ()
-        try:
-            env['SSL_CLIENT_VERIFY'] = self.request.getpeercert()
-        except:
-            env['SSL_CLIENT_VERIFY'] = None
+        if self._peer_identity is None:
+            self._peer_identity = get_peer_identity(self.request)
+        cert, fingerprint = self._peer_identity
+        env['SSL_CLIENT_VERIFY'] = cert
+        env['SSL_CLIENT_FINGERPRINT'] = fingerprint
+        self._environ = env
         return env
 
+    def log_request(self, code='-', size='-'):
+        """
+        Override to add the bus calls made by the request to the access
+        log.
+
+        :param code: The response status code.
+        :type code: int or str
+        :param size: The response size.
+        :type size: int or str
+        """
+        account = None
+        if self._environ is not None:
+            account = self._environ.get(accounting.ENVIRON_KEY)
+        if account is None:
+            return super(CommissaireRequestHandler, self).log_request(
+                code, size)
+        if isinstance(code, HTTPStatus):
+            code = code.value
+        self.log_message(
+            '"%s" %s %s %s', self.requestline, str(code), str(size),
+            account.summary())
+
+
+class AdminRequestHandler(WSGIRequestHandler):
+    """
+    Request handler for the admin listener which logs requests at debug
+    level rather than writing every scrape to stderr.
+    """
+
+    #: Logger for admin requests
+    logger = logging.getLogger('AdminHttpServer')
+
+    def log_message(self, format, *args):
+        """
+        Logs a request at debug level.
+
+        :param format: The %-style format of the message.
+        :type format: str
+        :param args: Arguments for the format.
+        :type args: tuple
+        """
+        log.debug(
+            self.logger, '{} - {}', self.address_string(), format % args)
+
+
+class AdminHttpServer:
+    """
+    Http listener for operational endpoints, such as /metrics, kept apart
+    from the API so it can be bound to a private interface and does not
+    compete with API requests for the same accept queue.
+    """
+
+    #: Class level logger
+    logger = logging.getLogger('AdminHttpServer')
+
+    def __init__(self, bind_host, bind_port, routes=None):
+        """
+        Initializes a new AdminHttpServer instance.
+
+        :param bind_host: Host adapter to listen on.
+        :type bind_host: str
+        :param bind_port: Host port to listen on. 0 picks a free port.
+        :type bind_port: int
+        :param routes: Map of paths to WSGI apps. Defaults to /metrics,
+                       /debug/profile, /debug/memory and /debug/log.
+        :type routes: dict or None
+        """
+        if routes is None:
+            routes = {
+                '/metrics': metrics_app,
+                '/debug/profile': profiler_app,
+                '/debug/memory': memory_app,
+                '/debug/log': log.debug_log_app,
+            }
+        self.routes = dict(routes)
+        self._thread = None
+        self._httpd = make_server(
+            bind_host, bind_port, self.app,
+            server_class=ThreadedWSGIServer,
+            handler_class=AdminRequestHandler)
+        self._httpd.daemon_threads = True
+        self.logger.info('Admin listener on {}:{}'.format(
+            *self.server_address[:2]))
+
+    @property
+    def server_address(self):
+        """
+        The address the listener is bound to.
+
+        :rtype: tuple
+        """
+        return self._httpd.server_address
+
+    def app(self, environ, start_response):
+        """
+        Routes a request to the app registered for its path.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: Response back to requestor.
+        :rtype: list
+        """
+        route_app = self.routes.get(environ.get('PATH_INFO'))
+        if route_app is None:
+            start_response('404 Not Found', [('content-type', 'text/html')])
+            return [bytes('Not Found', 'utf8')]
+        return route_app(environ, start_response)
+
+    def start(self):
+        """
+        Serves in a daemon thread.
+        """
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name='AdminHttpServer',
+            daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """
+        Stops serving and closes the listening socket.
+        """
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
 
 class CommissaireHttpServer:
     """
@@ -138,10 +482,16 @@ class CommissaireHttpServer:
     logger = logging.getLogger('CommissaireHttpServer')
 
     def __init__(self, bind_host, bind_port, dispatcher,
-                 tls_pem_file=None, tls_clientverify_file=None):
+                 tls_pem_file=None, tls_clientverify_file=None,
+                 unix_socket=None, unix_socket_mode=None,
+                 listen_sockets=None):
         """
         Initializes a new CommissaireHttpServer instance.
 
+        Sockets passed in by systemd socket activation are used before a
+        Unix socket, which is used before the host and port. Only one
+        passed socket is supported; any after the first are ignored.
+
         :param bind_host: Host adapter to listen on.
         :type bind_host: str
         :param bind_port: Host port to listen on.
@@ -152,18 +502,51 @@ class CommissaireHttpServer:
         :type tls_pem_file: str
         :param tls_clientverify_file: Full path to CA to verify certs.
         :type tls_clientverify_file: str
+        :param unix_socket: Full path of a Unix socket to listen on.
+        :type unix_socket: str or None
+        :param unix_socket_mode: Permissions of the Unix socket.
+        :type unix_socket_mode: int, str or None
+        :param listen_sockets: Listening sockets to serve on. Defaults to
+                               those passed in by systemd.
+        :type listen_sockets: list or None
         """
         self._bind_host = bind_host
         self._bind_port = bind_port
         self._tls_pem_file = tls_pem_file
         self._tls_clientverify_file = tls_clientverify_file
         self.dispatcher = dispatcher
-        self._httpd = make_server(
-            self._bind_host,
-            self._bind_port,
-            self.dispatcher.dispatch,
-            server_class=ThreadedWSGIServer,
-            handler_class=CommissaireRequestHandler)
+        if listen_sockets is None:
+            listen_sockets = systemd.listen_sockets()
+
+        if listen_sockets:
+            sock = listen_sockets[0]
+            if len(listen_sockets) > 1:
+                self.logger.warn(
+                    'Serving only the first of {} passed sockets.'.format(
+                        len(listen_sockets)))
+            server_class = ThreadedWSGIServer
+            if sock.family == socket.AF_UNIX:
+                server_class = ThreadedUnixWSGIServer
+            self._httpd = server_class(
+                sock.getsockname(), CommissaireRequestHandler,
+                bind_and_activate=False)
+            self._httpd.adopt_socket(sock)
+            self._httpd.set_app(self.dispatcher.dispatch)
+            self.logger.info('Using passed socket {}'.format(
+                self._httpd.server_address))
+        elif unix_socket:
+            self._httpd = ThreadedUnixWSGIServer(
+                unix_socket, CommissaireRequestHandler,
+                mode=unix_socket_mode)
+            self._httpd.set_app(self.dispatcher.dispatch)
+            self.logger.info('Using Unix socket {}'.format(unix_socket))
+        else:
+            self._httpd = make_server(
+                self._bind_host,
+                self._bind_port,
+                self.dispatcher.dispatch,
+                server_class=ThreadedWSGIServer,
+                handler_class=CommissaireRequestHandler)
 
         # If we are given a PEM file then wrap the socket
         if tls_pem_file:
@@ -16,11 +16,52 @@
 Authentication related code for Commissaire.
 """
 
+import itertools
 import logging
 import base64
 
+from commissaire_http.util import log, timing
 from commissaire_http.util.wsgi import FakeStartResponse
 
+#: Credential given as an Authorization: Basic header
+CREDENTIAL_BASIC = 'basic'
+#: Credential given as an X-Auth-Token header
+CREDENTIAL_TOKEN = 'token'
+#: Credential given as a verified client certificate
+CREDENTIAL_CLIENT_CERT = 'client_cert'
+#: Credential given as an Authorization: Bearer session token
+CREDENTIAL_SESSION = 'session'
+
+#: All known credential types
+CREDENTIALS = (
+    CREDENTIAL_BASIC, CREDENTIAL_TOKEN, CREDENTIAL_CLIENT_CERT,
+    CREDENTIAL_SESSION)
+
+#: WSGI environment key set once a request passed authentication
+AUTHENTICATED_KEY = 'commissaire.authenticated'
+
+
+def get_credentials(environ):
+    """
+    Returns the credential types a request carries.
+
+    :param environ: WSGI environment instance.
+    :type environ: dict
+    :returns: The credential types present in the request.
+    :rtype: frozenset
+    """
+    present = []
+    http_auth = (environ.get('HTTP_AUTHORIZATION') or '')[:7].lower()
+    if http_auth[:6] == 'basic ':
+        present.append(CREDENTIAL_BASIC)
+    elif http_auth == 'bearer ':
+        present.append(CREDENTIAL_SESSION)
+    if environ.get('HTTP_X_AUTH_TOKEN'):
+        present.append(CREDENTIAL_TOKEN)
+    if environ.get('SSL_CLIENT_VERIFY'):
+        present.append(CREDENTIAL_CLIENT_CERT)
+    return frozenset(present)
+
 
 class Authenticator:
     """
@@ -30,6 +71,10 @@ class Authenticator:
     #: Logger for authenticators
     logger = logging.getLogger('authentication')
 
+    #: Credential types the authenticator consumes. None means it is
+    #: tried for every request.
+    credentials = None
+
     def __init__(self, app):
         """
         Initialize a new instance of Authenticator.
@@ -57,9 +102,9 @@ class Authenticator:
         # If the result is True then the authn was successful
         # The plugin is handling it's own response
         if fake_start_response.call_count > 0:
-            self.logger.debug(
-                '{} owned status code: {}'.format(
-                    self.__name, fake_start_response))
+            log.debug(
+                self.logger, '{} owned status code: {}',
+                self.__name, fake_start_response)
 
             # If the code returned is a 2xx then it's successful authn
             if fake_start_response.code.startswith('2'):
@@ -79,12 +124,12 @@ class Authenticator:
             return result
 
         elif result is True:
-            self.logger.debug('{} successfully authenticated.'.format(
-                self.__name))
+            log.debug(
+                self.logger, '{} successfully authenticated.', self.__name)
             return self._app(environ, start_response)
 
         # Fall through to a generic forbidden
-        self.logger.debug('{} failed authentication.'.format(self.__name))
+        log.debug(self.logger, '{} failed authentication.', self.__name)
         start_response(
             '403 Forbidden', [('content-type', 'text/html')])
         return [bytes('Forbidden', 'utf8')]
@@ -103,6 +148,21 @@ class Authenticator:
         """
         return False
 
+    def issue(self, environ, authenticator):
+        """
+        Method may be overriden to hand out credentials after any
+        authenticator succeeded. It is only called on authenticators which
+        override it.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param authenticator: The authenticator which succeeded.
+        :type authenticator: Authenticator
+        :returns: Headers to add to the response.
+        :rtype: list
+        """
+        return []
+
 
 class AuthenticationManager:
     """
@@ -122,12 +182,143 @@ class AuthenticationManager:
         :type authenticators: list
         """
         self._app = app
+        # (table, issuers) swapped as one so threads see a consistent set
+        self._routing = ({}, ())
         self.authenticators = authenticators
 
+    @property
+    def authenticators(self):
+        """
+        The configured Authenticator instances. Assign or use
+        add_authenticator to change them.
+
+        :rtype: tuple
+        """
+        return self._authenticators
+
+    @authenticators.setter
+    def authenticators(self, authenticators):
+        """
+        Replaces the configured Authenticator instances.
+
+        :param authenticators: Configured Authenticator instances to utilize.
+        :type authenticators: list
+        """
+        self._authenticators = tuple(authenticators)
+        self._rebuild_routing()
+
+    def add_authenticator(self, authenticator):
+        """
+        Adds an Authenticator after the configured ones.
+
+        :param authenticator: The Authenticator instance to add.
+        :type authenticator: Authenticator
+        """
+        self.authenticators = self._authenticators + (authenticator, )
+
+    def _build_table(self, authenticators):
+        """
+        Maps every combination of credential types to the authenticators
+        which consume at least one of them, in configured order.
+        Authenticators which do not declare credentials are always used.
+
+        :param authenticators: Authenticator instances to route to.
+        :type authenticators: tuple
+        :returns: Map of credential types to authenticators.
+        :rtype: dict
+        """
+        table = {}
+        for size in range(len(CREDENTIALS) + 1):
+            for present in itertools.combinations(CREDENTIALS, size):
+                present = frozenset(present)
+                table[present] = tuple(
+                    authenticator for authenticator in authenticators
+                    if self._consumes(authenticator, present))
+        return table
+
+    @classmethod
+    def _consumes(cls, authenticator, present):
+        """
+        Checks if an authenticator is used for a set of credential types.
+
+        :param authenticator: The authenticator to check.
+        :type authenticator: Authenticator
+        :param present: The credential types given in a request.
+        :type present: frozenset
+        :rtype: bool
+        """
+        if not cls._declares_credentials(authenticator):
+            return True
+        return bool(present.intersection(authenticator.credentials))
+
+    @staticmethod
+    def _issues(authenticator):
+        """
+        Checks if an authenticator overrides Authenticator.issue.
+
+        :param authenticator: The authenticator to check.
+        :type authenticator: Authenticator
+        :rtype: bool
+        """
+        if not isinstance(authenticator, Authenticator):
+            return False
+        return type(authenticator).issue is not Authenticator.issue
+
+    @staticmethod
+    def _declares_credentials(authenticator):
+        """
+        Checks if an authenticator declares the credentials it consumes.
+
+        :param authenticator: The authenticator to check.
+        :type authenticator: Authenticator
+        :rtype: bool
+        """
+        return isinstance(
+            getattr(authenticator, 'credentials', None),
+            (tuple, list, set, frozenset))
+
+    def get_authenticators(self, environ):
+        """
+        Returns the authenticators to try for a request.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :returns: Authenticators in configured order.
+        :rtype: tuple
+        """
+        return self._routing[0][get_credentials(environ)]
+
+    def _rebuild_routing(self):
+        """
+        Rebuilds the routing after the authenticators changed.
+        """
+        authenticators = self._authenticators
+        issuers = tuple(
+            authenticator for authenticator in authenticators
+            if self._issues(authenticator))
+        self._routing = (self._build_table(authenticators), issuers)
+
+    def _issue(self, environ, authenticator):
+        """
+        Collects credentials issued after a successful authentication.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param authenticator: The authenticator which succeeded.
+        :type authenticator: Authenticator
+        :returns: Headers to add to the response.
+        :rtype: list
+        """
+        headers = []
+        for issuer in self._routing[1]:
+            headers.extend(issuer.issue(environ, authenticator))
+        return headers
+
     def __call__(self, environ, start_response):
         """
-        Runs through the configured Authenticators until either a success
-        occurs or all authenticators are attempted.
+        Runs through the Authenticators which consume the credentials
+        given in the request until either a success occurs or all of them
+        are attempted.
 
         :param environ: WSGI environment instance.
         :type environ: dict
@@ -141,28 +332,43 @@ class AuthenticationManager:
 
         result = False
 
-        for authenticator in self.authenticators:
+        for authenticator in self.get_authenticators(environ):
             # Attempt to authenticate...
-            result = authenticator.authenticate(environ, fake_start_response)
+            with timing.timed('auth'):
+                result = authenticator.authenticate(
+                    environ, fake_start_response)
             # True means it was successful
             if result is True:
-                self.logger.debug('{} succeeded authentication.'.format(
-                    authenticator.__class__.__name__))
+                log.debug(
+                    self.logger, '{} succeeded authentication.',
+                    authenticator.__class__.__name__)
+                environ[AUTHENTICATED_KEY] = True
+                issued = self._issue(environ, authenticator)
+                if issued:
+                    def issuing_start_response(status, headers, *exc_info):
+                        return start_response(
+                            status, list(headers) + issued, *exc_info)
+                    return self._app(environ, issuing_start_response)
                 return self._app(environ, start_response)
             # The plugin handled it's own start_response and
             # return data. Pull from the fake_start_response and return
             # the result from authenticate.
             elif isinstance(
                     result, list) and fake_start_response.call_count > 0:
-                self.logger.debug('{} succeeded authentication.'.format(
-                    authenticator.__class__.__name__))
-                self.logger.debug('Response: {}'.format(fake_start_response))
-                start_response(
-                    fake_start_response.code, fake_start_response.headers)
+                log.debug(
+                    self.logger, '{} succeeded authentication.',
+                    authenticator.__class__.__name__)
+                log.debug(self.logger, 'Response: {}', fake_start_response)
+                headers = list(fake_start_response.headers)
+                if fake_start_response.code.startswith('2'):
+                    environ[AUTHENTICATED_KEY] = True
+                    headers.extend(self._issue(environ, authenticator))
+                start_response(fake_start_response.code, headers)
                 return result
             else:
-                self.logger.debug('{} failed authentication: {}'.format(
-                    authenticator.__class__.__name__, result))
+                log.debug(
+                    self.logger, '{} failed authentication: {}',
+                    authenticator.__class__.__name__, result)
 
         # Else fall through to a generic Forbidden.
         start_response(
@@ -187,7 +393,7 @@ def decode_basic_auth(logger, http_auth):
                 decoded = tuple(base64.decodebytes(
                     http_auth[6:].encode('utf-8')).decode().split(':'))
                 if logger:
-                    logger.debug('Credentials given: {0}'.format(decoded))
+                    log.debug(logger, 'Credentials given for: {0}', decoded[0])
                 return decoded
             except base64.binascii.Error:
                 if logger:
@@ -17,28 +17,58 @@ Client certificate authentication plugin.
 """
 
 from commissaire_http.authentication import Authenticator
+from commissaire_http.authentication import CREDENTIAL_CLIENT_CERT
+from commissaire_http.util.cache import TTLCache
+from commissaire_http.util.tls import get_common_names
 
 
 class HTTPClientCertAuth(Authenticator):
     """
     Requires a client certificate. If a cn
-    argument is given it must match the
-    cn on any incoming certificate. If cn is
+    argument is given one of the cns on any
+    incoming certificate must be in it. If cn is
     left blank then client certificate is
     accepted.
     """
 
-    def __init__(self, app, cn=None):
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_CLIENT_CERT,)
+
+    def __init__(self, app, cn=None, cache_size=1024, cache_ttl=3600):
         """
         Initializes an instance of HTTPClientCertAuth.
 
+        Decisions are cached by certificate fingerprint so a certificate's
+        subject is only checked once.
+
         :param app: The WSGI application being wrapped with authenticaiton.
         :type app: callable
-        :param cn: Optional CommonName to use when checking certificates.
-        :type cn: str or None
+        :param cn: Optional CommonName or list of CommonNames allowed.
+        :type cn: str, list or None
+        :param cache_size: Maximum cached decisions. 0 disables caching.
+        :type cache_size: int
+        :param cache_ttl: Seconds a decision is cached.
+        :type cache_ttl: float
         """
         super(HTTPClientCertAuth, self).__init__(app)
-        self.cn = cn
+        if isinstance(cn, str):
+            cn = [cn]
+        self.cn = frozenset(cn or ())
+        self._cache = TTLCache(int(cache_size), float(cache_ttl))
+
+    def check_certificate(self, cert):
+        """
+        Checks a certificate against the allowed CommonNames.
+
+        :param cert: A certificate as returned by SSLSocket.getpeercert().
+        :type cert: dict
+        :returns: The accepted CommonName or None if rejected.
+        :rtype: str or None
+        """
+        for name in get_common_names(cert):
+            if not self.cn or name in self.cn:
+                return name
+        return None
 
     def authenticate(self, environ, start_response):
         """
@@ -52,12 +82,21 @@ class HTTPClientCertAuth(Authenticator):
         :rtype: bool
         """
         cert = environ.get('SSL_CLIENT_VERIFY')
-        if cert:
-            for obj in cert.get('subject', ()):
-                for key, value in obj:
-                    if key == 'commonName' and \
-                            (not self.cn or value == self.cn):
-                        return True
+        if not cert:
+            # Forbid by default
+            return False
+
+        fingerprint = environ.get('SSL_CLIENT_FINGERPRINT')
+        # A cached empty string marks a rejected certificate
+        name = self._cache.get(fingerprint) if fingerprint else None
+        if name is None:
+            name = self.check_certificate(cert) or ''
+            if fingerprint:
+                self._cache.set(fingerprint, name)
+
+        if name:
+            environ['REMOTE_USER'] = name
+            return True
 
         # Forbid by default
         return False
@@ -14,10 +14,39 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import hashlib
+import hmac
 import json
+import os
+import threading
 
 from commissaire_http.authentication import Authenticator
+from commissaire_http.authentication import CREDENTIAL_BASIC
 from commissaire_http.authentication import decode_basic_auth
+from commissaire_http.util import log
+from commissaire_http.util.cache import TTLCache
+from commissaire_http.util.executor import (
+    BoundedExecutor, ExecutorSaturatedError)
+
+
+def verify_password(passwd, hashed):
+    """
+    Checks a password against a bcrypt hash. This is a module level
+    function so it can be sent to a process pool.
+
+    :param passwd: Password
+    :type passwd: string
+    :param hashed: The bcrypt hash
+    :type hashed: string
+    :returns: Whether the password matches
+    :rtype: bool
+    """
+    import bcrypt
+
+    try:
+        return bcrypt.hashpw(passwd.encode('utf-8'), hashed) == hashed
+    except ValueError:
+        return False  # Bad salt
 
 
 class HTTPBasicAuth(Authenticator):
@@ -25,7 +54,13 @@ class HTTPBasicAuth(Authenticator):
     Basic auth implementation of an authenticator.
     """
 
-    def __init__(self, app, filepath=None, users={}):
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_BASIC,)
+
+    def __init__(self, app, filepath=None, users=None,
+                 cache_size=1024, cache_ttl=300, verify_executor='thread',
+                 verify_workers=None, verify_queue_timeout=1.0,
+                 reload_interval=5):
         """
         Creates an instance of the HTTPBasicAuth authenticator.
 
@@ -33,18 +68,62 @@ class HTTPBasicAuth(Authenticator):
         applicable, merged into the 'users' dictionary.  If no arguments are
         given, the instance attempts to retrieve user passwords from etcd.
 
+        Successful verifications are cached for 'cache_ttl' seconds so
+        repeated requests skip bcrypt. The cache is keyed by an HMAC of the
+        user name and password under a per process secret so plain text
+        passwords are never stored.
+
+        Cache misses are verified in a bounded 'verify_executor' pool
+        ('thread' or 'process') so bcrypt can not starve request threads.
+        When no worker frees up within 'verify_queue_timeout' seconds the
+        request is failed fast with a 503.
+
+        The file is checked for changes every 'reload_interval' seconds in
+        a background thread. A changed file is parsed and swapped in as a
+        whole, and only cached verifications of users whose entries changed
+        are dropped. A file which can not be parsed is ignored and the
+        current users are kept. 0 disables reloading.
+
         :param app: The WSGI application being wrapped with authenticaiton.
         :type app: callable
         :param filepath: Path to a JSON file containing hashed passwords
         :type filepath: str or None
         :param users: A dictionary of user names and hashed passwords, or None
         :type users: dict or None
+        :param cache_size: Maximum cached verifications. 0 disables caching.
+        :type cache_size: int
+        :param cache_ttl: Seconds a cached verification is trusted.
+        :type cache_ttl: float
+        :param verify_executor: Pool kind for bcrypt: 'thread' or 'process'.
+        :type verify_executor: str
+        :param verify_workers: Concurrent verifications. Defaults to CPUs.
+        :type verify_workers: int or None
+        :param verify_queue_timeout: Seconds to wait for a free worker.
+        :type verify_queue_timeout: float
+        :param reload_interval: Seconds between checks of the file.
+        :type reload_interval: float
         :returns: HTTPBasicAuth
         """
         super(HTTPBasicAuth, self).__init__(app)
-        self._data = users
+        self._cache = TTLCache(int(cache_size), float(cache_ttl))
+        self._cache_secret = os.urandom(32)
+        self._executor = BoundedExecutor(
+            'httpbasicauth', verify_executor, verify_workers,
+            verify_queue_timeout)
+        self._users = dict(users or {})
+        # Replaced as a whole, never modified, so readers need no lock
+        self._data = dict(self._users)
+        self._file_signature = None
+        self._stop_watching = threading.Event()
         if filepath is not None:
             self._load_from_file(filepath)
+            if float(reload_interval) > 0:
+                watcher = threading.Thread(
+                    target=self._watch,
+                    args=(filepath, float(reload_interval)),
+                    name='HTTPBasicAuthReload')
+                watcher.daemon = True
+                watcher.start()
         # elif users is None:
         #     self._load_from_etcd()
 
@@ -72,6 +151,20 @@ class HTTPBasicAuth(Authenticator):
         self.logger.info('Loaded authentication data from Etcd.')
     '''
 
+    @staticmethod
+    def _get_file_signature(path):
+        """
+        Returns what identifies a version of a file.
+
+        :param path: Path to the file
+        :type path: str
+        :returns: Tuple of (inode, size, modification time)
+        :rtype: tuple
+        :raises: OSError
+        """
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
     def _load_from_file(self, path):
         """
         Loads authentication information from a JSON file.
@@ -79,14 +172,77 @@ class HTTPBasicAuth(Authenticator):
         :param path: Path to the JSON file
         :type path: str
         """
+        signature = None
         try:
+            signature = self._get_file_signature(path)
             with open(path, 'r') as afile:
-                self._data.update(json.load(afile))
-                self.logger.info('Loaded authentication data from local file.')
+                loaded = json.load(afile)
+            if not isinstance(loaded, dict):
+                raise ValueError('Expected a JSON object of users')
         except (ValueError, IOError) as error:
             self.logger.warn(
-                'Denying all access due to problem parsing '
-                'JSON file: {0}'.format(error))
+                'Keeping current authentication data due to problem '
+                'parsing JSON file: {0}'.format(error))
+            # Do not parse the same broken version again
+            if signature is not None:
+                self._file_signature = signature
+            return
+
+        data = dict(self._users)
+        data.update(loaded)
+        old_data = self._data
+        changed = set(
+            user for user in set(data).union(old_data)
+            if data.get(user) != old_data.get(user))
+        self._data = data
+        self._file_signature = signature
+        # Drop verifications made against the old entries of changed users
+        if changed:
+            self._cache.discard_if(lambda value: value[0] in changed)
+        self.logger.info(
+            'Loaded authentication data from local file. '
+            '{0} users changed.'.format(len(changed)))
+
+    def _watch(self, path, interval):
+        """
+        Reloads the JSON file whenever it changes.
+
+        :param path: Path to the JSON file
+        :type path: str
+        :param interval: Seconds between checks of the file.
+        :type interval: float
+        """
+        while not self._stop_watching.wait(interval):
+            try:
+                signature = self._get_file_signature(path)
+            except OSError as error:
+                log.debug(self.logger, 'Can not check {0}: {1}', path, error)
+                continue
+            if signature != self._file_signature:
+                self._load_from_file(path)
+
+    def stop_watching(self):
+        """
+        Stops reloading the JSON file when it changes.
+        """
+        self._stop_watching.set()
+
+    def _cache_key(self, user, passwd):
+        """
+        Creates the verification cache key for a user name and password.
+
+        :param user: User name
+        :type user: string
+        :param passwd: Password
+        :type passwd: string
+        :returns: HMAC-SHA256 digest of the credentials
+        :rtype: bytes
+        """
+        # Length prefix the user so user/password boundaries are unambiguous
+        credentials = '{}:{}:{}'.format(len(user), user, passwd)
+        return hmac.new(
+            self._cache_secret, credentials.encode('utf-8'),
+            hashlib.sha256).digest()
 
     def check_authentication(self, user, passwd):
         """
@@ -99,20 +255,26 @@ class HTTPBasicAuth(Authenticator):
         :type passwd: string
         :returns: Whether access is granted
         :rtype: bool
+        :raises: commissaire_http.util.executor.ExecutorSaturatedError
         """
-        import bcrypt
-
         valid = False
-        hashed = self._data[user]['hash']
-        try:
-            if bcrypt.hashpw(passwd.encode('utf-8'), hashed) == hashed:
-                self.logger.debug(
-                    'The provided hash for user {0} '
-                    'matched: {1}'.format(user, passwd))
+        entry = self._data.get(user)
+        if entry is None:
+            return False
+        hashed = entry['hash']
+
+        # A cached verification only counts if the stored hash is unchanged
+        cache_key = self._cache_key(user, passwd)
+        if self._cache.get(cache_key) == (user, hashed):
+            log.debug(self.logger, 'Cached verification used for {0}.', user)
+            return True
 
-                valid = True
-        except ValueError:
-            pass  # Bad salt
+        if self._executor.run(verify_password, passwd, hashed):
+            log.debug(
+                self.logger, 'The provided hash for user {0} matched.', user)
+
+            valid = True
+            self._cache.set(cache_key, (user, hashed))
 
         return valid
 
@@ -124,17 +286,26 @@ class HTTPBasicAuth(Authenticator):
         :type environ: dict
         :param start_response: WSGI start response callable.
         :type start_response: callable
-        :returns: True on success, False on failure
-        :rtype: bool
+        :returns: True on success, False on failure or a 503 response body
+        :rtype: bool or list
         """
         user, passwd = decode_basic_auth(
             self.logger,
             environ.get('HTTP_AUTHORIZATION'))
         if user is not None and passwd is not None:
             if user in self._data.keys():
-                self.logger.debug('User {0} found in datastore.'.format(user))
-                if self.check_authentication(user, passwd):
-                    return True  # Authentication is good
+                log.debug(self.logger, 'User {0} found in datastore.', user)
+                try:
+                    if self.check_authentication(user, passwd):
+                        environ['REMOTE_USER'] = user
+                        return True  # Authentication is good
+                except ExecutorSaturatedError as error:
+                    # Fail fast rather than queue behind other verifications
+                    self.logger.warn('{}. Rejecting request.'.format(error))
+                    start_response('503 Service Unavailable', [
+                        ('content-type', 'text/html'),
+                        ('Retry-After', '1')])
+                    return [bytes('Service Unavailable', 'utf8')]
 
         # Forbid by default
         return False
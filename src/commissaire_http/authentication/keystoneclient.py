@@ -0,0 +1,172 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Shared client for the OpenStack Keystone authentication plugins.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from commissaire_http.util.circuitbreaker import (
+    CircuitBreaker, CircuitOpenError)
+from commissaire_http.util.metrics import REGISTRY
+
+#: Maximum pooled keep-alive connections per Keystone host
+POOL_MAXSIZE = 32
+
+#: Time spent waiting on Keystone
+REQUEST_SECONDS = REGISTRY.histogram(
+    'commissaire_keystone_request_seconds',
+    'Seconds spent waiting on Keystone.', ('method',))
+#: Keystone requests which failed or were refused
+ERRORS = REGISTRY.counter(
+    'commissaire_keystone_errors_total',
+    'Keystone requests which failed or were refused.', ('method', 'reason'))
+
+_SESSION = None
+_BREAKERS = {}
+_LOCK = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the pooled session shared by all Keystone plugins.
+
+    :returns: The shared session.
+    :rtype: requests.Session
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _SESSION = session
+    return _SESSION
+
+
+def get_breaker(url, failure_threshold=5, reset_timeout=30):
+    """
+    Returns the circuit breaker for a Keystone endpoint. Plugins using
+    the same endpoint share a breaker; the first one sets its limits.
+
+    :param url: The Keystone endpoint.
+    :type url: str
+    :param failure_threshold: Consecutive failures which open the circuit.
+    :type failure_threshold: int
+    :param reset_timeout: Seconds the circuit stays open.
+    :type reset_timeout: float
+    :returns: The circuit breaker for the endpoint.
+    :rtype: commissaire_http.util.circuitbreaker.CircuitBreaker
+    """
+    with _LOCK:
+        breaker = _BREAKERS.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(url, failure_threshold, reset_timeout)
+            _BREAKERS[url] = breaker
+        return breaker
+
+
+class KeystoneClient:
+    """
+    Posts authentication requests to Keystone over the shared session
+    with timeouts and a circuit breaker.
+    """
+
+    #: Logger for KeystoneClient
+    logger = logging.getLogger('KeystoneClient')
+
+    #: Headers sent with every request
+    headers = {'Content-Type': 'application/json'}
+
+    def __init__(self, url, method, connect_timeout=3.05, read_timeout=5,
+                 failure_threshold=5, reset_timeout=30):
+        """
+        Initializes a new KeystoneClient instance.
+
+        :param url: The OpenStack Keystone endpoint used for Authentication
+        :type url: str
+        :param method: The authentication method, used to label metrics.
+        :type method: str
+        :param connect_timeout: Seconds to wait for a connection.
+        :type connect_timeout: float
+        :param read_timeout: Seconds to wait for a response.
+        :type read_timeout: float
+        :param failure_threshold: Consecutive failures which open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the circuit stays open.
+        :type reset_timeout: float
+        """
+        self.url = url
+        self.method = method
+        self.timeout = (float(connect_timeout), float(read_timeout))
+        self.breaker = get_breaker(
+            url, int(failure_threshold), float(reset_timeout))
+        self._request_seconds = REQUEST_SECONDS.labels(method)
+
+    def post(self, body):
+        """
+        Posts a request body to Keystone.
+
+        :param body: The request body to send as JSON.
+        :type body: dict
+        :returns: The Keystone response.
+        :rtype: requests.Response
+        :raises: requests.exceptions.RequestException, CircuitOpenError
+        """
+        if not self.breaker.allow():
+            ERRORS.labels(self.method, 'circuit_open').inc()
+            raise CircuitOpenError(
+                'Circuit for {} is open'.format(self.url))
+
+        start = time.monotonic()
+        try:
+            response = get_session().post(
+                self.url,
+                data=json.dumps(body),
+                headers=self.headers,
+                timeout=self.timeout)
+            # A broken Keystone must not look like a rejection
+            if (response.status_code or 0) >= 500:
+                response.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            self.breaker.failure()
+            if isinstance(error, requests.exceptions.Timeout):
+                reason = 'timeout'
+            elif isinstance(error, requests.exceptions.HTTPError):
+                reason = 'server_error'
+            else:
+                reason = 'connection'
+            ERRORS.labels(self.method, reason).inc()
+            raise
+        except Exception:
+            # Any other error must still resolve the call, or a half open
+            # trial would keep the circuit from ever closing
+            self.breaker.failure()
+            ERRORS.labels(self.method, 'unexpected').inc()
+            raise
+        finally:
+            self._request_seconds.observe(time.monotonic() - start)
+
+        self.breaker.success()
+        return response
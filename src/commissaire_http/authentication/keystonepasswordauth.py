@@ -16,11 +16,14 @@
 OpenStack Keystone authentication plugin.
 """
 
-import json
 import requests
 
 from commissaire_http.authentication import Authenticator
+from commissaire_http.authentication import CREDENTIAL_BASIC
 from commissaire_http.authentication import decode_basic_auth
+from commissaire_http.authentication.keystoneclient import KeystoneClient
+from commissaire_http.util import log
+from commissaire_http.util.circuitbreaker import CircuitOpenError
 
 
 class KeystonePassword(Authenticator):
@@ -28,20 +31,41 @@ class KeystonePassword(Authenticator):
     Auth implementation using password method against OpenStack Keystone
     """
 
-    def __init__(self, app, url=None, domain='Default'):
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_BASIC,)
+
+    def __init__(self, app, url=None, domain='Default', connect_timeout=3.05,
+                 read_timeout=5, failure_threshold=5, reset_timeout=30):
         """
         Checks the user name and password from an Authorization header
         against the specified OpenStack Keystone instance
 
+        Requests share a pooled keep-alive session with the other Keystone
+        plugins. After 'failure_threshold' consecutive failures Keystone is
+        not contacted for 'reset_timeout' seconds and access is denied.
+
         :param app: The WSGI application being wrapped with authenticaiton.
         :type app: callable
         :param url: The OpenStack Keystone endpoint used for Authentication
         :type url: string
+        :param domain: The Keystone domain of the users.
+        :type domain: str
+        :param connect_timeout: Seconds to wait for a connection.
+        :type connect_timeout: float
+        :param read_timeout: Seconds to wait for a response.
+        :type read_timeout: float
+        :param failure_threshold: Consecutive failures which open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the circuit stays open.
+        :type reset_timeout: float
         :returns: HTTPBasicAuth
         """
         super(KeystonePassword, self).__init__(app)
         self.url = url
         self.domain = domain
+        self.client = KeystoneClient(
+            url, 'password', connect_timeout, read_timeout,
+            failure_threshold, reset_timeout)
 
     def authenticate(self, environ, start_response):
         """
@@ -64,11 +88,9 @@ class KeystonePassword(Authenticator):
             self.logger.info(
                 'Authentication can not continue due to mising '
                 'user/pass. Rejecting.')
-            self.logger.debug('User: {}, Pass: {}'.format(user, passwd))
-            self.logger.debug('Environ: {}'.format(environ))
+            log.debug(self.logger, 'User: {}', user)
             return False
 
-        headers = {'Content-Type': 'application/json'}
         body = {'auth': {'identity': {}}}
         ident = body['auth']['identity']
 
@@ -79,11 +101,9 @@ class KeystonePassword(Authenticator):
             'domain': {'name': self.domain}}}
 
         try:
-            response = requests.post(
-                self.url,
-                data=json.dumps(body),
-                headers=headers)
-        except requests.exceptions.BaseHTTPError as error:
+            response = self.client.post(body)
+        except (requests.exceptions.RequestException,
+                CircuitOpenError) as error:
             self.logger.error('Could not reach {}. Denying access. {}: {}'
                               .format(self.url, type(error), error))
             return False
@@ -94,6 +114,7 @@ class KeystonePassword(Authenticator):
             start_response('200 OK', [
                            ('content-type', 'application/json'),
                            (subject_token_name, token)])
+            environ['REMOTE_USER'] = user
             return True
 
         # Forbid by default
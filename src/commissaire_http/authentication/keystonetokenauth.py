@@ -16,10 +16,41 @@
 OpenStack Keystone authentication plugin.
 """
 
-import json
+import hashlib
+import threading
+import time
+
+from datetime import datetime, timezone
+
 import requests
 
 from commissaire_http.authentication import Authenticator
+from commissaire_http.authentication import CREDENTIAL_TOKEN
+from commissaire_http.authentication.keystoneclient import KeystoneClient
+from commissaire_http.util import log
+from commissaire_http.util.cache import TTLCache
+from commissaire_http.util.circuitbreaker import CircuitOpenError
+
+#: Formats Keystone uses for expires_at
+EXPIRES_AT_FORMATS = ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_expires_at(expires_at):
+    """
+    Parses a Keystone expires_at timestamp.
+
+    :param expires_at: UTC timestamp (IE: 2016-10-18T12:00:00.000000Z)
+    :type expires_at: str
+    :returns: Seconds since the epoch or None if it can not be parsed.
+    :rtype: float or None
+    """
+    for fmt in EXPIRES_AT_FORMATS:
+        try:
+            parsed = datetime.strptime(expires_at, fmt)
+            return parsed.replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return None
 
 
 class KeystoneToken(Authenticator):
@@ -27,18 +58,155 @@ class KeystoneToken(Authenticator):
     Auth implementation using token method against OpenStack Keystone
     """
 
-    def __init__(self, app, url=None):
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_TOKEN,)
+
+    def __init__(self, app, url=None, cache_size=1024, cache_ttl=300,
+                 negative_cache_size=1024, negative_cache_ttl=30,
+                 stale_ttl=0, connect_timeout=3.05, read_timeout=5,
+                 failure_threshold=5, reset_timeout=30):
         """
         Checks the token given as the X-Auth-Token header
         against the specified OpenStack Keystone instance
+
+        Validated tokens are cached, keyed by a hash of the token, for at
+        most 'cache_ttl' seconds and never past the expires_at Keystone
+        returned. Rejected tokens are cached for 'negative_cache_ttl'
+        seconds. Within 'stale_ttl' seconds after a cached validation goes
+        stale it is still used while it is revalidated in the background.
+
         :param app: The WSGI application being wrapped with authenticaiton.
         :type app: callable
         :param url: The OpenStack Keystone endpoint used for Authentication
         :type url: string
+        :param cache_size: Maximum cached validations. 0 disables caching.
+        :type cache_size: int
+        :param cache_ttl: Maximum seconds a validation is trusted.
+        :type cache_ttl: float
+        :param negative_cache_size: Maximum cached rejections.
+        :type negative_cache_size: int
+        :param negative_cache_ttl: Seconds a rejection is remembered.
+        :type negative_cache_ttl: float
+        :param stale_ttl: Seconds a stale validation may be used while
+                          revalidating.
+        :type stale_ttl: float
+        :param connect_timeout: Seconds to wait for a connection.
+        :type connect_timeout: float
+        :param read_timeout: Seconds to wait for a response.
+        :type read_timeout: float
+        :param failure_threshold: Consecutive failures which open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the circuit stays open.
+        :type reset_timeout: float
         :returns
         """
         super(KeystoneToken, self).__init__(app)
         self.url = url
+        self.cache_ttl = float(cache_ttl)
+        self.stale_ttl = float(stale_ttl)
+        self._cache = TTLCache(int(cache_size), self.cache_ttl)
+        self._negative_cache = TTLCache(
+            int(negative_cache_size), float(negative_cache_ttl))
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        self.client = KeystoneClient(
+            url, 'token', connect_timeout, read_timeout,
+            failure_threshold, reset_timeout)
+
+    def _validate(self, token):
+        """
+        Validates a token with Keystone.
+
+        :param token: The token to validate.
+        :type token: str
+        :returns: Tuple of (subject token, expires at) or None if rejected.
+        :rtype: tuple or None
+        :raises: requests.exceptions.RequestException, CircuitOpenError
+        """
+        body = {'auth': {'identity': {}}}
+        ident = body['auth']['identity']
+
+        ident['methods'] = ['token']
+        ident['token'] = {'id': token}
+
+        response = self.client.post(body)
+
+        subject_token_name = 'X-Subject-Token'
+        if subject_token_name not in response.headers:
+            return None
+
+        try:
+            expires_at = parse_expires_at(
+                response.json()['token']['expires_at'])
+        except (ValueError, TypeError, KeyError):
+            expires_at = None
+        return response.headers[subject_token_name], expires_at
+
+    def _store(self, key, result):
+        """
+        Caches the result of a validation.
+
+        :param key: The cache key for the token.
+        :type key: str
+        :param result: The result returned from _validate.
+        :type result: tuple or None
+        """
+        if result is None:
+            self._cache.pop(key)
+            self._negative_cache.set(key, True)
+            return
+
+        subject_token, expires_at = result
+        # Without an expiration the token can not be cached safely
+        if expires_at is None:
+            return
+        expires_in = expires_at - time.time()
+        fresh_for = min(self.cache_ttl, expires_in)
+        if fresh_for <= 0:
+            return
+        self._negative_cache.pop(key)
+        self._cache.set(
+            key, (subject_token, time.monotonic() + fresh_for),
+            ttl=min(fresh_for + self.stale_ttl, expires_in))
+
+    def _revalidate(self, key, token):
+        """
+        Revalidates a stale token and updates the cache.
+
+        :param key: The cache key for the token.
+        :type key: str
+        :param token: The token to validate.
+        :type token: str
+        """
+        try:
+            self._store(key, self._validate(token))
+        except (requests.exceptions.RequestException,
+                CircuitOpenError) as error:
+            self.logger.warn(
+                'Could not revalidate token with {}. {}: {}'.format(
+                    self.url, type(error), error))
+        finally:
+            with self._revalidating_lock:
+                self._revalidating.discard(key)
+
+    def _revalidate_in_background(self, key, token):
+        """
+        Starts revalidating a token unless it is already in progress.
+
+        :param key: The cache key for the token.
+        :type key: str
+        :param token: The token to validate.
+        :type token: str
+        """
+        with self._revalidating_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        thread = threading.Thread(
+            target=self._revalidate, args=(key, token),
+            name='KeystoneTokenRevalidate')
+        thread.daemon = True
+        thread.start()
 
     def authenticate(self, environ, start_response):
         """
@@ -55,33 +223,36 @@ class KeystoneToken(Authenticator):
         if not token:
             return False
 
-        headers = {'Content-Type': 'application/json'}
-        body = {'auth': {'identity': {}}}
-        ident = body['auth']['identity']
-
-        ident['methods'] = ['token']
-        ident['token'] = {'id': token}
-
-        try:
-            response = requests.post(
-                self.url,
-                data=json.dumps(body),
-                headers=headers)
-        except requests.exceptions.BaseHTTPError as error:
-            self.logger.error('Could not reach {}. Denying access. {}: {}'
-                              .format(self.url, type(error), error))
+        # Only a hash of the token is kept in memory
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        if self._negative_cache.get(key):
+            log.debug(self.logger, 'Token rejected from cache.')
             return False
 
-        subject_token_name = 'X-Subject-Token'
-        if subject_token_name in response.headers:
-            token = response.headers[subject_token_name]
-            start_response('200 OK', [
-                           ('content-type', 'application/json'),
-                           (subject_token_name, token)])
-            return True
-
-        # Forbid by default
-        return False
+        cached = self._cache.get(key)
+        if cached is not None:
+            subject_token, fresh_until = cached
+            if fresh_until <= time.monotonic():
+                self._revalidate_in_background(key, token)
+            log.debug(self.logger, 'Token accepted from cache.')
+        else:
+            try:
+                result = self._validate(token)
+            except (requests.exceptions.RequestException,
+                    CircuitOpenError) as error:
+                self.logger.error('Could not reach {}. Denying access. {}: {}'
+                                  .format(self.url, type(error), error))
+                return False
+            self._store(key, result)
+            if result is None:
+                # Forbid by default
+                return False
+            subject_token = result[0]
+
+        start_response('200 OK', [
+                       ('content-type', 'application/json'),
+                       ('X-Subject-Token', subject_token)])
+        return True
 
 
 PluginClass = KeystoneToken
@@ -0,0 +1,250 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Rate limiting of failed authentication attempts.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from commissaire_http.authentication import (
+    AUTHENTICATED_KEY, decode_basic_auth)
+from commissaire_http.util import log
+from commissaire_http.util.metrics import REGISTRY
+
+#: Requests rejected because too many authentications failed
+REJECTED = REGISTRY.counter(
+    'commissaire_auth_rate_limited_total',
+    'Requests rejected because too many authentications failed.')
+
+#: Response status codes which count as failed authentication when the
+#: request did not pass authentication
+FAILURE_CODES = ('401', '403')
+
+
+class MemoryBucketStore:
+    """
+    Keeps token buckets in a dictionary local to the process.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new MemoryBucketStore instance.
+        """
+        #: Lock held around reading and updating a bucket
+        self.lock = threading.Lock()
+        self._buckets = {}
+
+    def __len__(self):  # noqa
+        """
+        Number of stored buckets.
+        """
+        return len(self._buckets)
+
+    def get(self, key):
+        """
+        Returns a bucket. Must be called with the lock held.
+
+        :param key: The bucket key.
+        :type key: tuple
+        :returns: Tuple of (tokens, last update) or None.
+        :rtype: tuple or None
+        """
+        return self._buckets.get(key)
+
+    def set(self, key, tokens, updated):
+        """
+        Stores a bucket. Must be called with the lock held.
+
+        :param key: The bucket key.
+        :type key: tuple
+        :param tokens: Tokens left in the bucket.
+        :type tokens: float
+        :param updated: Time of the last update.
+        :type updated: float
+        """
+        self._buckets[key] = (tokens, updated)
+
+    def expire(self, before):
+        """
+        Drops buckets last updated before a time.
+
+        :param before: Buckets updated before this time are dropped.
+        :type before: float
+        """
+        with self.lock:
+            for key in [key for key, (_, updated) in self._buckets.items()
+                        if updated < before]:
+                del self._buckets[key]
+
+
+class FailedAuthRateLimiter:
+    """
+    WSGI middleware placed in front of the AuthenticationManager which
+    limits failed authentications per client address and user name with
+    token buckets.
+
+    Each failed authentication takes a token from the bucket of the
+    client and a client whose bucket is empty is rejected with a 429.
+    Responses with a failure status from a request which passed
+    authentication, such as a 403 from a handler, are not charged.
+    Failures of concurrent requests are all charged, so they can
+    overdraw the bucket and delay the client longer.
+    """
+
+    #: Logger for FailedAuthRateLimiter
+    logger = logging.getLogger('FailedAuthRateLimiter')
+
+    def __init__(self, app, rate=1.0, burst=10, store=None,
+                 expire_interval=60, clock=time.monotonic):
+        """
+        Initializes a new FailedAuthRateLimiter instance.
+
+        :param app: The WSGI app to wrap, usually an AuthenticationManager.
+        :type app: callable
+        :param rate: Failed authentications allowed per second.
+        :type rate: float
+        :param burst: Failed authentications allowed in a row.
+        :type burst: int
+        :param store: Where buckets are kept. Defaults to MemoryBucketStore.
+        :type store: MemoryBucketStore
+        :param expire_interval: Seconds between drops of idle buckets.
+        :type expire_interval: float
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self._app = app
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.store = store if store is not None else MemoryBucketStore()
+        self.expire_interval = float(expire_interval)
+        self._clock = clock
+        self._expired_at = clock()
+        # An idle bucket is full again after this long and can be dropped
+        self.idle_ttl = self.burst / self.rate
+        # Rejections come in floods during the attacks this is for
+        self._rejections = log.LogLimiter(
+            self.logger, description='rejection messages', clock=clock)
+
+    @staticmethod
+    def key(environ):
+        """
+        Creates the bucket key for a request.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :returns: Tuple of (client address, user name)
+        :rtype: tuple
+        """
+        user, _ = decode_basic_auth(None, environ.get('HTTP_AUTHORIZATION'))
+        return (environ.get('REMOTE_ADDR', ''), user)
+
+    @staticmethod
+    def failed_authentication(environ, status):
+        """
+        Checks if a request failed authentication.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param status: The response statuses started, in order.
+        :type status: list
+        :rtype: bool
+        """
+        if not status or status[-1][:3] not in FAILURE_CODES:
+            return False
+        return not environ.get(AUTHENTICATED_KEY)
+
+    def _refill(self, key, now):
+        """
+        Returns the tokens in a bucket. Must be called with the lock held.
+
+        :param key: The bucket key.
+        :type key: tuple
+        :param now: The current time.
+        :type now: float
+        :rtype: float
+        """
+        bucket = self.store.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, updated = bucket
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _tokens(self, key, now):
+        """
+        Returns the tokens in a bucket.
+
+        :param key: The bucket key.
+        :type key: tuple
+        :param now: The current time.
+        :type now: float
+        :rtype: float
+        """
+        with self.store.lock:
+            return self._refill(key, now)
+
+    def _charge(self, key):
+        """
+        Takes a token for a failed authentication.
+
+        :param key: The bucket key.
+        :type key: tuple
+        """
+        now = self._clock()
+        with self.store.lock:
+            self.store.set(key, self._refill(key, now) - 1, now)
+
+    def __call__(self, environ, start_response):
+        """
+        Rejects clients with too many failed authentications and passes
+        everything else to the wrapped app.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: Response back to requestor.
+        :rtype: list
+        """
+        now = self._clock()
+        if now - self._expired_at >= self.expire_interval:
+            self._expired_at = now
+            self.store.expire(now - self.idle_ttl)
+
+        key = self.key(environ)
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            REJECTED.inc()
+            self._rejections.warn(
+                'Too many failed authentications from {0} for {1}. '
+                'Rejecting.'.format(*key))
+            retry_after = math.ceil((1 - tokens) / self.rate)
+            start_response('429 Too Many Requests', [
+                ('content-type', 'text/html'),
+                ('Retry-After', str(retry_after))])
+            return [bytes('Too Many Requests', 'utf8')]
+
+        status = []
+
+        def recording_start_response(code, headers, *exc_info):
+            status.append(code)
+            return start_response(code, headers, *exc_info)
+
+        result = self._app(environ, recording_start_response)
+        if self.failed_authentication(environ, status):
+            self._charge(key)
+        return result
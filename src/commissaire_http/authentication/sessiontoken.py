@@ -0,0 +1,262 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Signed session token authentication plugin.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from commissaire_http.authentication import Authenticator
+from commissaire_http.authentication import CREDENTIAL_SESSION
+from commissaire_http.util import log
+
+#: Response header carrying a newly issued session token
+SESSION_HEADER = 'X-Commissaire-Session'
+
+#: Version prefix of the token format
+TOKEN_VERSION = 'v1'
+
+
+def b64encode(data):
+    """
+    Encodes bytes as unpadded URL safe base64.
+
+    :param data: The bytes to encode.
+    :type data: bytes
+    :returns: The encoded string.
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(data):
+    """
+    Decodes unpadded URL safe base64.
+
+    :param data: The string to decode.
+    :type data: str
+    :returns: The decoded bytes.
+    :rtype: bytes
+    :raises: ValueError
+    """
+    try:
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (binascii.Error, TypeError) as error:
+        raise ValueError(error)
+
+
+class SessionToken(Authenticator):
+    """
+    Issues short lived, HMAC signed bearer tokens after any other
+    configured authenticator succeeds and accepts them on later requests.
+    """
+
+    #: Credentials the authenticator consumes
+    credentials = (CREDENTIAL_SESSION,)
+
+    def __init__(self, app, keyfile=None, ttl=300, reload_interval=5):
+        """
+        Initializes an instance of SessionToken.
+
+        Tokens are signed with the 'signing' key from 'keyfile' and
+        verified with any key in it, so keys can be rotated by adding a new
+        key, signing with it and removing the old key once its tokens have
+        expired. The file is reread when it changes, checked at most every
+        'reload_interval' seconds. It is JSON like:
+
+            {"signing": "2", "keys": {"1": "old secret", "2": "secret"}}
+
+        Without a keyfile a random key is used, so tokens are only valid
+        in this process until it restarts.
+
+        :param app: The WSGI application being wrapped with authenticaiton.
+        :type app: callable
+        :param keyfile: Path to a JSON file containing the signing keys.
+        :type keyfile: str or None
+        :param ttl: Seconds an issued token is valid.
+        :type ttl: float
+        :param reload_interval: Seconds between checks of the keyfile.
+        :type reload_interval: float
+        """
+        super(SessionToken, self).__init__(app)
+        self.keyfile = keyfile
+        self.ttl = float(ttl)
+        self.reload_interval = float(reload_interval)
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        # (signing key id, {key id: secret}) swapped as one on reload
+        self._keys = (None, {})
+        if keyfile is None:
+            self._keys = ('random', {'random': os.urandom(32)})
+        else:
+            self._load_keys()
+
+    def _load_keys(self):
+        """
+        Loads the keys from the keyfile if it changed.
+        """
+        try:
+            mtime = os.stat(self.keyfile).st_mtime
+            if mtime == self._mtime:
+                return
+            with open(self.keyfile, 'r') as kfile:
+                data = json.load(kfile)
+            keys = {
+                str(kid): secret.encode('utf-8')
+                for kid, secret in data['keys'].items()}
+            signing = str(data['signing'])
+            if signing not in keys:
+                raise KeyError(signing)
+        except (ValueError, IOError, KeyError, TypeError,
+                AttributeError) as error:
+            self.logger.warn(
+                'Keeping the current session keys due to a problem '
+                'loading {0}: {1}'.format(self.keyfile, error))
+            return
+        self._keys = (signing, keys)
+        self._mtime = mtime
+        self.logger.info('Loaded {0} session keys from {1}.'.format(
+            len(keys), self.keyfile))
+
+    def _get_keys(self):
+        """
+        Returns the current keys, reloading the keyfile when due.
+
+        :returns: Tuple of (signing key id, {key id: secret})
+        :rtype: tuple
+        """
+        if self.keyfile is not None:
+            now = time.monotonic()
+            if now - self._checked_at >= self.reload_interval:
+                self._checked_at = now
+                self._load_keys()
+        return self._keys
+
+    @staticmethod
+    def _sign(secret, signed):
+        """
+        Signs the token body.
+
+        :param secret: The signing key.
+        :type secret: bytes
+        :param signed: The token body.
+        :type signed: str
+        :returns: The signature.
+        :rtype: bytes
+        """
+        return hmac.new(
+            secret, signed.encode('ascii'), hashlib.sha256).digest()
+
+    def create_token(self, user=None):
+        """
+        Creates a signed token.
+
+        :param user: The authenticated user, if known.
+        :type user: str or None
+        :returns: The token or None if there is no signing key.
+        :rtype: str or None
+        """
+        signing, keys = self._get_keys()
+        if signing is None:
+            return None
+        payload = json.dumps(
+            {'sub': user, 'exp': int(time.time() + self.ttl)},
+            separators=(',', ':'))
+        signed = '{0}.{1}.{2}'.format(
+            TOKEN_VERSION, signing, b64encode(payload.encode('utf-8')))
+        return '{0}.{1}'.format(
+            signed, b64encode(self._sign(keys[signing], signed)))
+
+    def verify_token(self, token):
+        """
+        Verifies a token.
+
+        :param token: The token to verify.
+        :type token: str
+        :returns: The payload of a valid token or None.
+        :rtype: dict or None
+        """
+        try:
+            signed, signature = token.rsplit('.', 1)
+            version, kid, payload = signed.split('.')
+        except ValueError:
+            return None
+        if version != TOKEN_VERSION:
+            return None
+        secret = self._get_keys()[1].get(kid)
+        if secret is None:
+            log.debug(self.logger, 'Unknown session key {0}.', kid)
+            return None
+        try:
+            if not hmac.compare_digest(
+                    b64decode(signature), self._sign(secret, signed)):
+                return None
+            payload = json.loads(b64decode(payload).decode('utf-8'))
+            expired = payload['exp'] <= time.time()
+        except (ValueError, UnicodeDecodeError, KeyError, TypeError):
+            return None
+        if expired:
+            log.debug(self.logger, 'Session token expired.')
+            return None
+        return payload
+
+    def authenticate(self, environ, start_response):
+        """
+        Implements the authentication logic.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: True on success, False on failure
+        :rtype: bool
+        """
+        http_auth = environ.get('HTTP_AUTHORIZATION') or ''
+        if http_auth[:7].lower() != 'bearer ':
+            return False
+        payload = self.verify_token(http_auth[7:].strip())
+        if payload is None:
+            # Forbid by default
+            return False
+        if payload.get('sub') is not None:
+            environ['REMOTE_USER'] = payload['sub']
+        return True
+
+    def issue(self, environ, authenticator):
+        """
+        Issues a session token after another authenticator succeeded.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param authenticator: The authenticator which succeeded.
+        :type authenticator: Authenticator
+        :returns: Headers to add to the response.
+        :rtype: list
+        """
+        if authenticator is self:
+            return []
+        token = self.create_token(environ.get('REMOTE_USER'))
+        if token is None:
+            return []
+        return [(SESSION_HEADER, token)]
+
+
+PluginClass = SessionToken
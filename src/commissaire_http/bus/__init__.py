@@ -22,6 +22,9 @@ from kombu import Connection, Exchange, Producer, Queue
 
 from commissaire.bus import BusMixin
 from commissaire.storage.client import StorageClient
+from commissaire_http.bus import accounting
+from commissaire_http.bus.batching import BatchingStorageClient
+from commissaire_http.util import log, timing
 
 
 class Bus(BusMixin):
@@ -48,7 +51,7 @@ class Bus(BusMixin):
         self.exchange_name = exchange_name
         self.connection_url = connection_url
         self.qkwargs = qkwargs
-        self.storage = StorageClient(self)
+        self.storage = accounting.AccountedStorageClient(StorageClient(self))
 
     @property
     def init_kwargs(self):
@@ -88,13 +91,51 @@ class Bus(BusMixin):
             queue.exchange = self._exchange
             queue = queue.bind(self._channel)
             self._queues.append(queue)
-            self.logger.debug('Created queue {}'.format(queue.as_dict()))
+            log.debug(self.logger, 'Created queue {}', queue.as_dict())
 
         # Create producer for publishing on topics
         self.producer = Producer(self._channel, self._exchange)
         self.logger.debug('Bus connection finished')
         return self
 
+    def batch_storage(self, window, max_batch=100):
+        """
+        Batches concurrent storage gets into get_many requests.
+
+        :param window: Seconds gets are collected for before a batch is
+                       sent.
+        :type window: float
+        :param max_batch: Distinct models per batch.
+        :type max_batch: int
+        """
+        self.storage = accounting.AccountedStorageClient(
+            BatchingStorageClient(StorageClient(self), window, max_batch))
+        self.logger.info(
+            'Batching storage gets arriving within {}s'.format(window))
+
+    def request(self, routing_key, *args, **kwargs):
+        """
+        Sends a request over the bus and waits for the response. The call
+        is counted and timed as part of the current request.
+
+        :param routing_key: The routing key of the request.
+        :type routing_key: str
+        :param args: Positional arguments for BusMixin.request.
+        :type args: tuple
+        :param kwargs: Keyword arguments for BusMixin.request.
+        :type kwargs: dict
+        :returns: The response.
+        :rtype: dict
+        :raises: commissaire_http.bus.accounting.BusBudgetError
+        """
+        call = accounting.record_request(routing_key)
+        try:
+            with timing.timed('bus'):
+                return super(Bus, self).request(routing_key, *args, **kwargs)
+        finally:
+            if call is not None:
+                call.finish()
+
     def respond(self, queue_name, id, payload, **kwargs):  # pragma: no cover
         """
         Sends a response to a simple queue. Responses are sent back to a
@@ -109,14 +150,14 @@ class Bus(BusMixin):
         :param kwargs: Keyword arguments to pass to SimpleQueue
         :type kwargs: dict
         """
-        self.logger.debug('Sending response for message id "{}"'.format(id))
+        log.debug(self.logger, 'Sending response for message id "{}"', id)
         send_queue = self.connection.SimpleQueue(queue_name, **kwargs)
         jsonrpc_msg = {
             'jsonrpc': "2.0",
             'id': id,
             'result': payload,
         }
-        self.logger.debug('jsonrpc msg: {}'.format(jsonrpc_msg))
+        log.debug(self.logger, 'jsonrpc msg: {}', jsonrpc_msg)
         send_queue.put(jsonrpc_msg)
-        self.logger.debug('Sent response for message id "{}"'.format(id))
+        log.debug(self.logger, 'Sent response for message id "{}"', id)
         send_queue.close()
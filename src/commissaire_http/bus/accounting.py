@@ -0,0 +1,403 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Per request accounting of bus calls.
+
+The Dispatcher makes a BusAccount current for the thread handling a
+request. Bus.request and the storage client record into it so handlers
+making one bus call per item (N+1) show up in metrics, the access log
+and, with a budget, as warnings or rejected requests.
+"""
+
+import logging
+import threading
+import time
+
+from commissaire_http.util.metrics import REGISTRY
+
+#: WSGI environment key holding the BusAccount of a request
+ENVIRON_KEY = 'commissaire.bus_account'
+
+#: Bus requests kept with their timings per HTTP request
+MAX_CALLS = 256
+
+#: HTTP status of requests rejected for exceeding their bus budget
+REJECTED_STATUS = '503 Service Unavailable'
+
+#: Bus requests by route template and routing key
+BUS_REQUESTS = REGISTRY.counter(
+    'commissaire_bus_requests_total',
+    'Bus requests made while handling HTTP requests.',
+    ('route', 'routing_key'))
+#: Storage client calls by route template and storage method
+STORAGE_CALLS = REGISTRY.counter(
+    'commissaire_storage_calls_total',
+    'Storage client calls made while handling HTTP requests.',
+    ('route', 'method'))
+#: Bus requests made per HTTP request
+BUS_REQUESTS_PER_REQUEST = REGISTRY.histogram(
+    'commissaire_bus_requests_per_request',
+    'Bus requests made per HTTP request.', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+#: HTTP requests which went over their bus call budget
+BUDGET_EXCEEDED = REGISTRY.counter(
+    'commissaire_bus_budget_exceeded_total',
+    'HTTP requests which made more bus requests than budgeted.',
+    ('route',))
+
+
+class _AccountState(threading.local):
+    """
+    Per thread state holding the account of the current request.
+    """
+    #: The BusAccount of the request being handled
+    account = None
+
+
+_local = _AccountState()
+
+
+class BusBudgetError(Exception):
+    """
+    Raised when a request makes more bus requests than its budget allows
+    and budgets are enforced.
+    """
+    pass
+
+
+class BusBudgets:
+    """
+    Maximum bus requests per HTTP request, per route template.
+
+    Budgets can be changed at runtime from any thread.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new BusBudgets instance.
+        """
+        self._budgets = {}
+        #: Reject requests going over budget instead of only warning
+        self.reject = False
+
+    @property
+    def budgets(self):
+        """
+        Returns a copy of the configured budgets.
+
+        :returns: Mapping of route template to allowed bus requests.
+        :rtype: dict
+        """
+        return dict(self._budgets)
+
+    def set_budget(self, route, calls):
+        """
+        Sets the bus requests allowed per request on a route.
+
+        :param route: The route template (IE: /api/v0/cluster/{name}/).
+        :type route: str
+        :param calls: Allowed bus requests. None removes the budget.
+        :type calls: int or None
+        """
+        if calls is None:
+            self._budgets.pop(route, None)
+        else:
+            self._budgets[route] = int(calls)
+
+    def get(self, route):
+        """
+        Returns the budget of a route.
+
+        :param route: The route template.
+        :type route: str
+        :returns: Allowed bus requests or None if unlimited.
+        :rtype: int or None
+        """
+        return self._budgets.get(route)
+
+    def clear(self):
+        """
+        Removes all configured budgets.
+        """
+        self._budgets = {}
+
+
+#: Global budgets consulted by the Dispatcher
+BUDGETS = BusBudgets()
+
+
+class BusCall:
+    """
+    Timing of a single bus request.
+    """
+
+    __slots__ = ('routing_key', 'started', 'duration')
+
+    def __init__(self, routing_key):
+        """
+        Initializes a new BusCall instance.
+
+        :param routing_key: The routing key of the request.
+        :type routing_key: str
+        """
+        self.routing_key = routing_key
+        self.started = time.monotonic()
+        #: Seconds the request took. None while it is in flight.
+        self.duration = None
+
+    def finish(self):
+        """
+        Records the end of the request.
+        """
+        self.duration = time.monotonic() - self.started
+
+
+class BusAccount:
+    """
+    Counts the bus requests and storage calls of a single HTTP request.
+
+    Can be used as a context manager to make it current, which is handy
+    for holding a handler to a budget in tests::
+
+        with BusAccount(budget=2, reject=True):
+            handler(message, bus)
+    """
+
+    #: Logger for BusAccount
+    logger = logging.getLogger('BusAccount')
+
+    __slots__ = (
+        'route', 'budget', 'reject', 'total', 'requests', 'storage',
+        'calls', 'exceeded', 'rejected', '_previous')
+
+    def __init__(self, route=None, budget=None, reject=False):
+        """
+        Initializes a new BusAccount instance.
+
+        :param route: The route template, used in metrics and messages.
+        :type route: str or None
+        :param budget: Allowed bus requests. None means unlimited.
+        :type budget: int or None
+        :param reject: Raise BusBudgetError instead of only warning.
+        :type reject: bool
+        """
+        self.route = route
+        self.budget = budget
+        self.reject = reject
+        #: Bus requests made
+        self.total = 0
+        #: Bus requests per routing key
+        self.requests = {}
+        #: Storage client calls per method
+        self.storage = {}
+        #: Timings of the first MAX_CALLS bus requests
+        self.calls = []
+        #: If the budget was exceeded
+        self.exceeded = False
+        #: If a bus request was refused for exceeding the budget
+        self.rejected = False
+        self._previous = None
+
+    def __enter__(self):  # noqa
+        self._previous = _local.account
+        _local.account = self
+        return self
+
+    def __exit__(self, *exc_info):  # noqa
+        _local.account = self._previous
+        self._previous = None
+        return False
+
+    def check_budget(self, routing_key):
+        """
+        Checks if one more bus request fits the budget, without recording
+        it.
+
+        :param routing_key: The routing key of the request.
+        :type routing_key: str
+        :raises: BusBudgetError
+        """
+        if self.budget is not None and self.total >= self.budget:
+            if not self.exceeded:
+                self.exceeded = True
+                if self.route is not None:
+                    BUDGET_EXCEEDED.labels(self.route).inc()
+                self.logger.warn(
+                    'Request to {} went over its budget of {} bus '
+                    'requests with {}.'.format(
+                        self.route, self.budget, routing_key))
+            if self.reject:
+                self.rejected = True
+                raise BusBudgetError(
+                    'Request to {} exceeded its budget of {} bus '
+                    'requests.'.format(self.route, self.budget))
+
+    def record_request(self, routing_key):
+        """
+        Records a bus request, checking it against the budget first.
+
+        :param routing_key: The routing key of the request.
+        :type routing_key: str
+        :returns: The call to finish when the request returns, or None
+                  once MAX_CALLS are kept.
+        :rtype: BusCall or None
+        :raises: BusBudgetError
+        """
+        self.check_budget(routing_key)
+        self.total += 1
+        self.requests[routing_key] = self.requests.get(routing_key, 0) + 1
+        if len(self.calls) < MAX_CALLS:
+            call = BusCall(routing_key)
+            self.calls.append(call)
+            return call
+        return None
+
+    def record_storage(self, method):
+        """
+        Records a storage client call.
+
+        :param method: The storage client method name.
+        :type method: str
+        """
+        self.storage[method] = self.storage.get(method, 0) + 1
+
+    def publish(self):
+        """
+        Adds the counts to the metrics. Requires a route.
+        """
+        if self.route is None:
+            return
+        for routing_key, count in self.requests.items():
+            BUS_REQUESTS.labels(self.route, routing_key).inc(count)
+        for method, count in self.storage.items():
+            STORAGE_CALLS.labels(self.route, method).inc(count)
+        BUS_REQUESTS_PER_REQUEST.labels(self.route).observe(self.total)
+
+    def summary(self):
+        """
+        Formats the counts for a log message.
+
+        :returns: IE: bus=3{storage.get=2,storage.list=1} storage={get=2}
+        :rtype: str
+        """
+        def format_counts(counts):
+            return ','.join(
+                '{}={}'.format(key, counts[key]) for key in sorted(counts))
+
+        # Copied first as the watchdog reports on requests still running
+        requests = dict(self.requests)
+        storage = dict(self.storage)
+        summary = 'bus={}'.format(self.total)
+        if requests:
+            summary += '{' + format_counts(requests) + '}'
+        if storage:
+            summary += ' storage={' + format_counts(storage) + '}'
+        return summary
+
+
+def rejected_response(start_response):
+    """
+    Responds to a request rejected for exceeding its bus budget, so it
+    can be told apart from other server errors.
+
+    :param start_response: WSGI start response callable.
+    :type start_response: callable
+    :returns: The response body.
+    :rtype: list
+    """
+    start_response(REJECTED_STATUS, [('content-type', 'text/html')])
+    return [bytes('Bus Budget Exceeded', 'utf8')]
+
+
+def current():
+    """
+    Returns the account of the request handled by this thread.
+
+    :returns: The account or None outside of a dispatched request.
+    :rtype: BusAccount or None
+    """
+    return _local.account
+
+
+def check_budget(routing_key):
+    """
+    Checks a bus request against the budget of the current account, if
+    any, without recording it.
+
+    :param routing_key: The routing key of the request.
+    :type routing_key: str
+    :raises: BusBudgetError
+    """
+    account = _local.account
+    if account is not None:
+        account.check_budget(routing_key)
+
+
+def record_request(routing_key):
+    """
+    Records a bus request on the current account, if any.
+
+    :param routing_key: The routing key of the request.
+    :type routing_key: str
+    :returns: The call to finish when the request returns, or None.
+    :rtype: BusCall or None
+    :raises: BusBudgetError
+    """
+    account = _local.account
+    if account is not None:
+        return account.record_request(routing_key)
+    return None
+
+
+class AccountedStorageClient:
+    """
+    Wraps a StorageClient so calls made through it are recorded by
+    method on the current account. Calls a storage method makes on the
+    client itself (IE: get_many calling get) are not counted again.
+    """
+
+    def __init__(self, client):
+        """
+        Initializes a new AccountedStorageClient instance.
+
+        :param client: The storage client to wrap.
+        :type client: commissaire.storage.client.StorageClient
+        """
+        self._client = client
+        self._methods = {}
+
+    def __getattr__(self, name):
+        """
+        Returns the attribute of the wrapped client, wrapping public
+        methods so their calls are recorded.
+
+        :param name: The attribute name.
+        :type name: str
+        :returns: The attribute.
+        :rtype: mixed
+        """
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        method = self._methods.get(name)
+        if method is None:
+            def method(*args, **kwargs):
+                account = _local.account
+                if account is not None:
+                    account.record_storage(name)
+                return attr(*args, **kwargs)
+            method.__name__ = name
+            self._methods[name] = method
+        return method
@@ -0,0 +1,267 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cross request batching of storage reads.
+
+A storage get is sent at once when no other storage request for its
+model type is running. Gets arriving while one is are collected per
+model type for a short window, deduplicated and sent as one get_many.
+The first caller of a window waits it out and makes the request, the
+others wait for its results.
+"""
+
+import json
+import logging
+import threading
+
+from collections import Counter, OrderedDict
+
+from commissaire import models
+from commissaire_http.bus import accounting
+from commissaire_http.util import log
+from commissaire_http.util.metrics import REGISTRY
+
+#: Models fetched per storage request made by the batching client
+BATCH_SIZES = REGISTRY.histogram(
+    'commissaire_storage_batch_size',
+    'Distinct models fetched per batched storage request.', ('model',),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+#: Storage gets answered from a batch with an identical get
+BATCH_DEDUPLICATED = REGISTRY.counter(
+    'commissaire_storage_batch_deduplicated_total',
+    'Storage gets sharing the result of an identical get.', ('model',))
+
+
+class _Batch:
+    """
+    Storage gets of one model type collected in a window.
+    """
+
+    __slots__ = ('models', 'full', 'done', 'results', 'error', 'handed')
+
+    def __init__(self):
+        """
+        Initializes a new _Batch instance.
+        """
+        #: key -> model instance to fetch, in request order
+        self.models = OrderedDict()
+        #: Set when the batch reached its maximum size
+        self.full = threading.Event()
+        #: Set when the results or error are in
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+        #: Keys whose result was handed out
+        self.handed = set()
+
+
+class BatchingStorageClient:
+    """
+    Wraps a StorageClient so concurrent gets are batched into get_many
+    calls. Everything but get and the get_* shortcuts is passed through.
+
+    The storage request of a batch is recorded on the bus account of the
+    thread which made it.
+    """
+
+    #: Logger for BatchingStorageClient
+    logger = logging.getLogger('BatchingStorageClient')
+
+    def __init__(self, client, window=0.001, max_batch=100):
+        """
+        Initializes a new BatchingStorageClient instance.
+
+        :param client: The storage client to wrap.
+        :type client: commissaire.storage.client.StorageClient
+        :param window: Seconds gets are collected for before a batch is
+                       sent, when a storage request of their model type
+                       is already running.
+        :type window: float
+        :param max_batch: Distinct models per batch. A full batch is sent
+                          at once.
+        :type max_batch: int
+        """
+        self._client = client
+        self.window = float(window)
+        self.max_batch = int(max_batch)
+        self._lock = threading.Lock()
+        self._pending = {}
+        #: model class -> storage requests running
+        self._fetching = Counter()
+
+    def __getattr__(self, name):
+        """
+        Returns the attribute of the wrapped client.
+
+        :param name: The attribute name.
+        :type name: str
+        :returns: The attribute.
+        :rtype: mixed
+        """
+        return getattr(self._client, name)
+
+    @staticmethod
+    def _key(model_instance):
+        """
+        Returns the key identical gets share.
+
+        :param model_instance: The model to get.
+        :type model_instance: commissaire.models.Model
+        :rtype: str
+        """
+        return json.dumps(model_instance.to_dict(), sort_keys=True)
+
+    def get(self, model_instance):
+        """
+        Gets a model, batched with the concurrent gets of its type.
+
+        :param model_instance: The model holding at least its primary key.
+        :type model_instance: commissaire.models.Model
+        :returns: The stored model.
+        :rtype: commissaire.models.Model
+        :raises: commissaire.bus.RemoteProcedureCallError
+        """
+        # Over budget callers fail on their own, not in a shared batch
+        accounting.check_budget('storage.get')
+        model_class = model_instance.__class__
+        key = self._key(model_instance)
+        with self._lock:
+            batch = self._pending.get(model_class)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._pending[model_class] = batch
+                # A lone get has nothing to be batched with
+                wait = self._fetching[model_class] > 0
+            if key in batch.models:
+                BATCH_DEDUPLICATED.labels(model_class.__name__).inc()
+            else:
+                batch.models[key] = model_instance
+            if len(batch.models) >= self.max_batch:
+                # Later gets start a new batch
+                del self._pending[model_class]
+                batch.full.set()
+
+        if leader:
+            if wait:
+                batch.full.wait(self.window)
+            with self._lock:
+                if self._pending.get(model_class) is batch:
+                    del self._pending[model_class]
+                self._fetching[model_class] += 1
+            try:
+                self._fetch(model_class, batch)
+            finally:
+                with self._lock:
+                    self._fetching[model_class] -= 1
+        else:
+            batch.done.wait()
+        return self._result(batch, key, model_instance, leader)
+
+    def _fetch(self, model_class, batch):
+        """
+        Makes the storage request of a batch.
+
+        :param model_class: The model type of the batch.
+        :type model_class: type
+        :param batch: The batch to fetch.
+        :type batch: _Batch
+        """
+        requested = list(batch.models.values())
+        BATCH_SIZES.labels(model_class.__name__).observe(len(requested))
+        try:
+            if len(requested) == 1:
+                results = [self._client.get(requested[0])]
+            else:
+                log.debug(
+                    self.logger, 'Getting {} {} models in one request',
+                    len(requested), model_class.__name__)
+                results = list(self._client.get_many(requested))
+                if len(results) != len(requested):
+                    raise ValueError(
+                        'Expected {} models from get_many, got {}'.format(
+                            len(requested), len(results)))
+            batch.results = dict(zip(batch.models, results))
+        except Exception as error:
+            batch.error = error
+        finally:
+            batch.done.set()
+
+    def _result(self, batch, key, model_instance, leader):
+        """
+        Returns a caller's result from a fetched batch.
+
+        :param batch: The fetched batch.
+        :type batch: _Batch
+        :param key: The key of the caller's get.
+        :type key: str
+        :param model_instance: The model the caller asked for.
+        :type model_instance: commissaire.models.Model
+        :param leader: If the caller made the storage request.
+        :type leader: bool
+        :returns: The stored model.
+        :rtype: commissaire.models.Model
+        :raises: commissaire.bus.RemoteProcedureCallError
+        """
+        if batch.error is not None:
+            budget_error = isinstance(batch.error, accounting.BusBudgetError)
+            if leader and budget_error:
+                raise batch.error
+            # The budget of the leader says nothing about the others
+            if len(batch.models) == 1 and not budget_error:
+                raise batch.error
+            # A single missing model fails the whole get_many, so each
+            # caller asks again on its own
+            return self._client.get(model_instance)
+
+        result = batch.results[key]
+        with self._lock:
+            shared = key in batch.handed
+            batch.handed.add(key)
+        if shared:
+            # Handlers modify the models they get, so every caller needs
+            # its own instance
+            return result.__class__.new(**result.to_dict())
+        return result
+
+    def get_host(self, address):
+        """
+        Gets a host, batched with concurrent host gets.
+
+        :param address: The address of the host.
+        :type address: str
+        :rtype: commissaire.models.Host
+        """
+        return self.get(models.Host.new(address=address))
+
+    def get_cluster(self, name):
+        """
+        Gets a cluster, batched with concurrent cluster gets.
+
+        :param name: The name of the cluster.
+        :type name: str
+        :rtype: commissaire.models.Cluster
+        """
+        return self.get(models.Cluster.new(name=name))
+
+    def get_network(self, name):
+        """
+        Gets a network, batched with concurrent network gets.
+
+        :param name: The name of the network.
+        :type name: str
+        :rtype: commissaire.models.Network
+        """
+        return self.get(models.Network.new(name=name))
@@ -22,6 +22,8 @@ from commissaire.constants import JSONRPC_ERRORS
 JSONRPC_ERRORS['404'] = JSONRPC_ERRORS['NOT_FOUND']
 JSONRPC_ERRORS['400'] = JSONRPC_ERRORS['INVALID_REQUEST']
 JSONRPC_ERRORS['BAD_REQUEST'] = JSONRPC_ERRORS['INVALID_REQUEST']
+# Server defined error for requests exceeding their bus budget
+JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED'] = -32001
 
 ROUTING_RX_PARAMS = {
     'name': R'[a-zA-Z0-9\-\_]+',
@@ -16,14 +16,41 @@
 Prototype dispatcher.
 """
 
+import dis
 import logging
+import time
 import traceback
 
 from importlib import import_module
 from inspect import isclass
 
-from commissaire_http.bus import Bus
+from commissaire_http.bus import Bus, accounting
+from commissaire_http.dispatcher.coalesce import RequestCoalescer
 from commissaire_http.handlers import BasicHandler
+from commissaire_http.util import log, timing
+from commissaire_http.util.metrics import REGISTRY
+from commissaire_http.util.profiler import PROFILER
+from commissaire_http.util.watchdog import WATCHDOG
+
+#: Route label of requests which matched no route
+UNMATCHED_ROUTE = 'unmatched'
+
+#: Method label values, anything else is counted as OTHER
+HTTP_METHODS = frozenset((
+    'GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'))
+
+#: Requests dispatched by route template, method and status code
+REQUESTS = REGISTRY.counter(
+    'commissaire_http_requests_total',
+    'HTTP requests dispatched.', ('route', 'method', 'status'))
+#: Time spent dispatching requests by route template and method
+REQUEST_SECONDS = REGISTRY.histogram(
+    'commissaire_http_request_seconds',
+    'Seconds spent dispatching HTTP requests.', ('route', 'method'))
+#: Requests currently being dispatched by route template
+IN_FLIGHT = REGISTRY.gauge(
+    'commissaire_http_requests_in_flight',
+    'HTTP requests currently being dispatched.', ('route',))
 
 
 def ls_mod(mod, pkg):
@@ -74,8 +101,22 @@ class Dispatcher:
         self._handler_map = {}
         self.reload_handlers()
         self._bus = None
+        #: Optional RequestCoalescer shared by identical requests
+        self.coalescer = None
+
+    def setup_coalescing(self, wait_timeout=30.0):
+        """
+        Shares one handler call between identical concurrent GETs.
+
+        :param wait_timeout: Seconds a request waits on an identical
+                             in-flight request before calling the handler
+                             itself.
+        :type wait_timeout: float
+        """
+        self.coalescer = RequestCoalescer(wait_timeout)
 
-    def setup_bus(self, exchange_name, connection_url, qkwargs):
+    def setup_bus(self, exchange_name, connection_url, qkwargs,
+                  storage_batch_window=None):
         """
         Sets up a bus connection with the given configuration.
 
@@ -87,6 +128,10 @@ class Dispatcher:
         :type connection_url: str
         :param qkwargs: One or more keyword argument dicts for queue creation
         :type qkwargs: list
+        :param storage_batch_window: Seconds concurrent storage gets are
+                                     collected for and batched. None
+                                     disables batching.
+        :type storage_batch_window: float or None
         """
         self.logger.debug('Setting up bus connection.')
         bus_init_kwargs = {
@@ -97,6 +142,8 @@ class Dispatcher:
         self._bus = Bus(**bus_init_kwargs)
         self.logger.debug(
             'Bus instance created with: {}'.format(bus_init_kwargs))
+        if storage_batch_window:
+            self._bus.batch_storage(storage_batch_window)
         self._bus.connect()
         self.logger.info('Bus connection ready.')
 
@@ -133,12 +180,47 @@ class Dispatcher:
                     'Unable to import handler package "{}". {}: {}'.format(
                         pkg, type(error), error))
 
+    def get_handler_sites(self):
+        """
+        Returns where the handler of each route is defined, so code
+        running below a handler can be attributed to its route.
+
+        :returns: filename -> [(first line, last line, route), ...]
+        :rtype: dict
+        """
+        routes = {}
+        for route in getattr(self._router, 'matchlist', ()):
+            controller = route.defaults.get('controller')
+            handler = controller
+            if not callable(controller):
+                handler = self._handler_map.get(controller)
+            # Unwrap BasicHandler decorators and bound methods
+            handler = getattr(handler, 'handler', handler)
+            handler = getattr(handler, '__func__', handler)
+            code = getattr(handler, '__code__', None)
+            if code is None:
+                continue
+            last = max(
+                line for _, line in dis.findlinestarts(code)
+                if line is not None)
+            key = (code.co_filename, code.co_firstlineno, last)
+            routes.setdefault(key, set()).add(route.routepath)
+
+        sites = {}
+        for (filename, first, last), paths in routes.items():
+            sites.setdefault(filename, []).append(
+                (first, last, ' '.join(sorted(paths))))
+        return sites
+
     def dispatch(self, environ, start_response):
         """
         Dispatches an HTTP request into a jsonrpc message, passes it to a
         handler, translates the results, and returns the HTTP response back
         to the requestor.
 
+        Request counts, status codes and latency are recorded per route
+        template.
+
         :param environ: WSGI environment dictionary.
         :type environ: dict
         :param start_response: WSGI start_response callable.
@@ -155,18 +237,79 @@ class Dispatcher:
         # Add the bus instance to the WSGI environment dictionary.
         environ['commissaire.bus'] = self._bus
 
-        # Add the routematch results to the WSGI environment dictionary.
-        match_result = self._router.routematch(environ['PATH_INFO'], environ)
+        # Metrics are labeled by route template, never by the raw path,
+        # to keep their number bounded
+        with timing.timed('route'):
+            match_result = self._router.routematch(
+                environ['PATH_INFO'], environ)
+        route_path = UNMATCHED_ROUTE
+        if match_result is not None:
+            route_path = getattr(
+                match_result[1], 'routepath', None) or UNMATCHED_ROUTE
+        method = environ.get('REQUEST_METHOD')
+        if method not in HTTP_METHODS:
+            method = 'OTHER'
+
+        statuses = []
+
+        def recording_start_response(status, headers, *exc_info):
+            statuses.append(status)
+            return start_response(status, headers, *exc_info)
+
+        # Count bus calls against the budget of the route
+        account = accounting.BusAccount(
+            route_path, accounting.BUDGETS.get(route_path),
+            accounting.BUDGETS.reject)
+        environ[accounting.ENVIRON_KEY] = account
+
+        in_flight = IN_FLIGHT.labels(route_path)
+        in_flight.inc()
+        profiled = PROFILER.begin_request(route_path)
+        watched = WATCHDOG.begin_request(environ, route_path)
+        started = time.monotonic()
+        try:
+            with account:
+                return self._route(
+                    environ, recording_start_response, match_result)
+        finally:
+            status = statuses[-1][:3] if statuses else 'none'
+            if watched:
+                WATCHDOG.end_request(status)
+            if profiled:
+                PROFILER.end_request()
+            account.publish()
+            REQUEST_SECONDS.labels(route_path, method).observe(
+                time.monotonic() - started)
+            in_flight.dec()
+            REQUESTS.labels(route_path, method, status).inc()
+
+    def _route(self, environ, start_response, match_result):
+        """
+        Calls the handler of the matched route.
+
+        :param environ: WSGI environment dictionary.
+        :type environ: dict
+        :param start_response: WSGI start_response callable.
+        :type start_response: callable
+        :param match_result: The routematch result or None.
+        :type match_result: tuple or None
+        :returns: The body of the HTTP response.
+        :rtype: Mixed
+        """
         if match_result is None:
             start_response(
                 '404 Not Found',
                 [('content-type', 'text/html')])
             return [bytes('Not Found', 'utf8')]
+        # Add the routematch results to the WSGI environment dictionary.
         environ['commissaire.routematch'] = match_result
 
-        route_dict = match_result[0]
+        route_dict, route = match_result
         route_controller = route_dict['controller']
 
+        # Force debug logging for a sample of requests on this route
+        log.set_sampled(
+            log.SAMPLER.sample(getattr(route, 'routepath', None)))
         try:
             # If the handler registered is a callable, use it
             if callable(route_controller):
@@ -174,11 +317,25 @@ class Dispatcher:
             # Else load what we found earlier
             else:
                 handler = self._handler_map.get(route_controller)
-            self.logger.debug(
-                'Using controller {}->{}'.format(route_dict, handler))
+            log.debug(
+                self.logger, 'Using controller {}->{}', route_dict, handler)
+
+            # Share the result of an identical in-flight request
+            if self.coalescer is not None:
+                key = self.coalescer.key(environ)
+                if key is not None:
+                    return self.coalescer(
+                        key, handler, environ, start_response)
 
             return handler(environ, start_response)
         except Exception as error:
+            # Also covers handlers turning the budget error into another
+            account = environ.get(accounting.ENVIRON_KEY)
+            if account is not None and account.rejected:
+                log.debug(
+                    self.logger, 'Rejected request to {}: {}',
+                    account.route, account.summary())
+                return accounting.rejected_response(start_response)
             self.logger.error(
                 'Exception raised in handler {}:\n{}'.format(
                     route_controller, traceback.format_exc()))
@@ -186,3 +343,5 @@ class Dispatcher:
                 '500 Internal Server Error',
                 [('content-type', 'text/html')])
             return [bytes('Internal Server Error', 'utf8')]
+        finally:
+            log.set_sampled(False)
@@ -0,0 +1,156 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Request coalescing for the Dispatcher.
+"""
+
+import hashlib
+import logging
+import threading
+
+from commissaire_http.util import log
+from commissaire_http.util.wsgi import FakeStartResponse
+
+
+class _InflightCall:
+    """
+    A handler execution which other requests may wait on.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new _InflightCall instance.
+        """
+        self.done = threading.Event()
+        self.code = None
+        self.headers = None
+        self.body = None
+        self.error = None
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """
+    Shares a single in-flight handler execution between identical
+    concurrent idempotent requests.
+
+    Requests are identical when they have the same method, path, query
+    string and authentication scope. A request waiting longer than
+    wait_timeout on an in-flight call runs the app itself instead.
+    """
+
+    #: Logger for RequestCoalescer
+    logger = logging.getLogger('RequestCoalescer')
+
+    #: Request methods which may be coalesced
+    methods = ('GET', 'HEAD')
+
+    #: WSGI environment keys which identify the requestor
+    scope_keys = ('HTTP_AUTHORIZATION', 'HTTP_X_AUTH_TOKEN')
+
+    def __init__(self, wait_timeout=30.0):
+        """
+        Initializes a new RequestCoalescer instance.
+
+        :param wait_timeout: Seconds to wait on an in-flight call.
+        :type wait_timeout: float
+        """
+        self.wait_timeout = float(wait_timeout)
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def key(self, environ):
+        """
+        Creates the coalescing key for a request.
+
+        :param environ: WSGI environment dictionary.
+        :type environ: dict
+        :returns: The key or None if the request can not be coalesced.
+        :rtype: tuple or None
+        """
+        method = environ.get('REQUEST_METHOD')
+        if method not in self.methods:
+            return None
+
+        # Only a digest of the credentials is kept in the key
+        scope = hashlib.sha256()
+        for scope_key in self.scope_keys:
+            scope.update(environ.get(scope_key, '').encode('utf-8'))
+            scope.update(b'\0')
+        fingerprint = environ.get('SSL_CLIENT_FINGERPRINT')
+        cert = environ.get('SSL_CLIENT_VERIFY')
+        if fingerprint:
+            scope.update(fingerprint.encode('utf-8'))
+        elif cert:
+            scope.update(repr(cert.get('subject')).encode('utf-8'))
+
+        return (
+            method,
+            environ.get('PATH_INFO'),
+            environ.get('QUERY_STRING', ''),
+            scope.digest())
+
+    def __call__(self, key, app, environ, start_response):
+        """
+        Calls the app unless an identical request is in flight, in which
+        case the in-flight result is shared.
+
+        :param key: The key returned from key().
+        :type key: tuple
+        :param app: The WSGI app (handler) to call.
+        :type app: callable
+        :param environ: WSGI environment dictionary.
+        :type environ: dict
+        :param start_response: WSGI start_response callable.
+        :type start_response: callable
+        :returns: The body of the HTTP response.
+        :rtype: list
+        :raises: Exception raised by the shared app call
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+            else:
+                call.waiters += 1
+
+        if leader:
+            try:
+                fake_start_response = FakeStartResponse()
+                call.body = list(app(environ, fake_start_response))
+                call.code = fake_start_response.code
+                call.headers = list(fake_start_response.headers)
+            except Exception as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                call.done.set()
+            if call.waiters:
+                log.debug(
+                    self.logger, 'Shared {} {} with {} waiting requests',
+                    key[0], key[1], call.waiters)
+        elif not call.done.wait(self.wait_timeout):
+            self.logger.warn(
+                'Gave up waiting on {} {} after {}s, calling the handler '
+                'directly'.format(key[0], key[1], self.wait_timeout))
+            return app(environ, start_response)
+
+        if call.error is not None:
+            raise call.error
+        start_response(call.code, list(call.headers))
+        return list(call.body)
@@ -18,16 +18,42 @@ Built-in handlers.
 
 import json
 import logging
+import time
 import uuid
 
 from html import escape
 from urllib.parse import parse_qs
 
+from commissaire_http.bus import accounting
 from commissaire_http.constants import JSONRPC_ERRORS
+from commissaire_http.util import log, timing
+from commissaire_http.util.metrics import REGISTRY
 
 #: Handler specific logger
 LOGGER = logging.getLogger('Handlers')
 
+#: Outcome labels of the JSON-RPC errors translated to HTTP statuses
+JSONRPC_ERROR_OUTCOMES = {
+    JSONRPC_ERRORS['BAD_REQUEST']: 'bad_request',
+    JSONRPC_ERRORS['NOT_FOUND']: 'not_found',
+    JSONRPC_ERRORS['METHOD_NOT_ALLOWED']: 'method_not_allowed',
+    JSONRPC_ERRORS['CONFLICT']: 'conflict',
+    JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED']: 'bus_budget_exceeded',
+}
+
+#: Time spent in JSON-RPC handler functions
+HANDLER_SECONDS = REGISTRY.histogram(
+    'commissaire_jsonrpc_handler_seconds',
+    'Seconds spent in JSON-RPC handler functions.', ('handler',))
+#: JSON-RPC handler responses by result or error name
+HANDLER_RESPONSES = REGISTRY.counter(
+    'commissaire_jsonrpc_handler_responses_total',
+    'JSON-RPC handler responses by outcome.', ('handler', 'outcome'))
+#: JSON-RPC handler calls currently running
+HANDLER_IN_FLIGHT = REGISTRY.gauge(
+    'commissaire_jsonrpc_handler_in_flight',
+    'JSON-RPC handler calls currently running.', ('handler',))
+
 
 def parse_query_string(qs):
     """
@@ -141,7 +167,8 @@ class JSONRPC_Handler(BasicHandler):
         route_dict, route = environ['commissaire.routematch']
 
         # Extract request parameters.
-        param_dict = get_params(environ)
+        with timing.timed('params'):
+            param_dict = get_params(environ)
         if param_dict is None:
             start_response(
                 '400 Bad Request', [('content-type', 'text/html')])
@@ -155,17 +182,36 @@ class JSONRPC_Handler(BasicHandler):
             'method': environ['REQUEST_METHOD'],
             'params': param_dict
         }
-        LOGGER.debug(
-            'Request transformed to "{}"'.format(jsonrpc_message))
-
-        result = self.handler(jsonrpc_message, bus)
+        log.debug(LOGGER, 'Request transformed to "{}"', jsonrpc_message)
 
         handler_name = self.handler.__name__
-        LOGGER.debug('Handler {} returned "{}"'.format(handler_name, result))
+        in_flight = HANDLER_IN_FLIGHT.labels(handler_name)
+        in_flight.inc()
+        started = time.monotonic()
+        try:
+            with timing.timed('handler'):
+                result = self.handler(jsonrpc_message, bus)
+        finally:
+            HANDLER_SECONDS.labels(handler_name).observe(
+                time.monotonic() - started)
+            in_flight.dec()
+
+        log.debug(LOGGER, 'Handler {} returned "{}"', handler_name, result)
+
+        if 'error' in result.keys():
+            outcome = JSONRPC_ERROR_OUTCOMES.get(
+                result['error'].get('code'), 'error')
+        elif 'result' in result.keys():
+            outcome = 'result'
+        else:
+            outcome = 'malformed'
+        HANDLER_RESPONSES.labels(handler_name, outcome).inc()
 
         if 'error' in result.keys():
             error_code = result['error']['code']
-            if error_code == JSONRPC_ERRORS['BAD_REQUEST']:
+            if error_code == JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED']:
+                return accounting.rejected_response(start_response)
+            elif error_code == JSONRPC_ERRORS['BAD_REQUEST']:
                 status = '400 Bad Request'
             elif error_code == JSONRPC_ERRORS['NOT_FOUND']:
                 status = '404 Not Found'
@@ -189,14 +235,17 @@ class JSONRPC_Handler(BasicHandler):
                 if route_dict.get('action') != 'add':
                     status = '201 Created'
             start_response(status, [('content-type', 'application/json')])
-            response_body = json.dumps(result['result'])
+            with timing.timed('encode'):
+                response_body = json.dumps(result['result'])
 
         else:
             message = 'Malformed JSON-RPC response message'
             self.logger.error('{}: {}'.format(message, result))
             raise Exception(message)
 
-        return [bytes(response_body, 'utf8')]
+        with timing.timed('encode'):
+            response_body = bytes(response_body, 'utf8')
+        return [response_body]
 
 
 def create_jsonrpc_error(message, error, error_code):
@@ -213,10 +262,13 @@ def create_jsonrpc_error(message, error, error_code):
     :rtype: dict
     """
     LOGGER.error('Error dealing with: "{}"'.format(message))
+    # Handlers catch everything, keep budget rejections recognizable
+    if isinstance(error, accounting.BusBudgetError):
+        error_code = JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED']
     response = create_jsonrpc_response(
         message['id'], error=error,
         error_code=error_code)
-    LOGGER.debug('Returning: {}'.format(response))
+    log.debug(LOGGER, 'Returning: {}', response)
     return response
 
 
@@ -23,6 +23,7 @@ from commissaire_http.constants import JSONRPC_ERRORS
 
 from commissaire_http.handlers import (
     LOGGER, JSONRPC_Handler, create_jsonrpc_response, create_jsonrpc_error)
+from commissaire_http.util import log
 
 
 def _register(router):
@@ -215,9 +216,9 @@ def create_cluster(message, bus):
     try:
         name = message['params']['name']
         bus.storage.get_cluster(name)
-        LOGGER.debug(
-            'Creation of already exisiting cluster {0} requested.'.format(
-                name))
+        log.debug(
+            LOGGER, 'Creation of already exisiting cluster {0} requested.',
+            name)
     except Exception as error:
         LOGGER.debug('Brand new cluster being created.')
 
@@ -252,7 +253,7 @@ def delete_cluster(message, bus):
     """
     try:
         name = message['params']['name']
-        LOGGER.debug('Attempting to delete cluster "{}"'.format(name))
+        log.debug(LOGGER, 'Attempting to delete cluster "{}"', name)
         cluster = bus.storage.get_cluster(name)
         if cluster.container_manager:
             params = [cluster.container_manager]
@@ -263,8 +264,7 @@ def delete_cluster(message, bus):
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error deleting cluster: {}: {}'.format(
-            type(error), error))
+        log.debug(LOGGER, 'Error deleting cluster: {}: {}', type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -284,16 +284,15 @@ def list_cluster_members(message, bus):
     try:
         name = message['params']['name']
         cluster = bus.storage.get_cluster(name)
-        LOGGER.debug('Cluster found: {}'.format(cluster.name))
-        LOGGER.debug('Returning: {}'.format(cluster.hostset))
+        log.debug(LOGGER, 'Cluster found: {}', cluster.name)
+        log.debug(LOGGER, 'Returning: {}', cluster.hostset)
         return create_jsonrpc_response(
             message['id'], result=cluster.hostset)
     except _bus.StorageLookupError as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error listing cluster: {}: {}'.format(
-            type(error), error))
+        log.debug(LOGGER, 'Error listing cluster: {}: {}', type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -313,8 +312,8 @@ def update_cluster_members(message, bus):
     try:
         old_hosts = set(message['params']['old'])  # Ensures no duplicates
         new_hosts = set(message['params']['new'])  # Ensures no duplicates
-        LOGGER.debug('old_hosts="{}", new_hosts="{}"'.format(
-            old_hosts, new_hosts))
+        log.debug(
+            LOGGER, 'old_hosts="{}", new_hosts="{}"', old_hosts, new_hosts)
     except Exception as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['BAD_REQUEST'])
@@ -337,9 +336,9 @@ def update_cluster_members(message, bus):
     # Only verify *new* hosts are suitable to add to the cluster.
     # Rejecting existing cluster members would be surprising to users.
     actual_new_hosts = new_hosts.difference(old_hosts)
-    LOGGER.debug(
-        'Checking status of new hosts (ignoring existing): '
-        '{}'.format(', '.join(actual_new_hosts)))
+    log.debug(
+        LOGGER, 'Checking status of new hosts (ignoring existing): {}',
+        log.LazyCall(', '.join, actual_new_hosts))
     list_of_hosts = bus.storage.get_many(
         [models.Host.new(address=x) for x in actual_new_hosts])
     hosts_not_ready = [host.address for host in list_of_hosts
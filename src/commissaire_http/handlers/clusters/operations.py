@@ -24,6 +24,7 @@ from commissaire_http.constants import JSONRPC_ERRORS
 
 from commissaire_http.handlers import (
     LOGGER, JSONRPC_Handler, create_jsonrpc_response, create_jsonrpc_error)
+from commissaire_http.util import log
 
 
 def _register(router):
@@ -94,7 +95,7 @@ def get_cluster_deploy(message, bus):
             message['id'], cluster_deploy.to_dict_safe())
     except models.ValidationError as error:
         LOGGER.info('Invalid data retrieved. "{}"'.format(error))
-        LOGGER.debug('Data="{}"'.format(message['params']))
+        log.debug(LOGGER, 'Data="{}"', message['params'])
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INVALID_REQUEST'])
     except _bus.StorageLookupError as error:
@@ -130,12 +131,12 @@ def create_cluster_deploy(message, bus):
         return create_jsonrpc_response(message['id'], result['result'])
     except models.ValidationError as error:
         LOGGER.info('Invalid data provided. "{}"'.format(error))
-        LOGGER.debug('Data="{}"'.format(message['params']))
+        log.debug(LOGGER, 'Data="{}"', message['params'])
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INVALID_REQUEST'])
     except Exception as error:
-        LOGGER.debug('Error creating ClusterDeploy: {}: {}'.format(
-            type(error), error))
+        log.debug(
+            LOGGER, 'Error creating ClusterDeploy: {}: {}', type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -223,15 +224,16 @@ def get_cluster_operation(model_cls, message, bus):
         return create_jsonrpc_response(message['id'], model.to_dict_safe())
     except models.ValidationError as error:
         LOGGER.info('Invalid data retrieved. "{}"'.format(error))
-        LOGGER.debug('Data="{}"'.format(message['params']))
+        log.debug(LOGGER, 'Data="{}"', message['params'])
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INVALID_REQUEST'])
     except _bus.StorageLookupError as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error getting {}: {}: {}'.format(
-            model_cls.__name__, type(error), error))
+        log.debug(
+            LOGGER, 'Error getting {}: {}: {}',
+            model_cls.__name__, type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -256,7 +258,7 @@ def create_cluster_operation(model_cls, message, bus, routing_key):
     cluster_name = message['params']['name']
     try:
         bus.storage.get_cluster(cluster_name)
-        LOGGER.debug('Found cluster "{}"'.format(cluster_name))
+        log.debug(LOGGER, 'Found cluster "{}"', cluster_name)
     except:
         error_msg = 'Cluster "{}" does not exist.'.format(cluster_name)
         LOGGER.debug(error_msg)
@@ -274,11 +276,12 @@ def create_cluster_operation(model_cls, message, bus, routing_key):
         return create_jsonrpc_response(message['id'], result['result'])
     except models.ValidationError as error:
         LOGGER.info('Invalid data provided. "{}"'.format(error))
-        LOGGER.debug('Data="{}"'.format(message['params']))
+        log.debug(LOGGER, 'Data="{}"', message['params'])
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INVALID_REQUEST'])
     except Exception as error:
-        LOGGER.debug('Error creating {}: {}: {}'.format(
-            model_cls.__name__, type(error), error))
+        log.debug(
+            LOGGER, 'Error creating {}: {}: {}',
+            model_cls.__name__, type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
@@ -21,6 +21,7 @@ from commissaire import bus as _bus
 from commissaire_http.constants import JSONRPC_ERRORS
 from commissaire_http.handlers import (
     LOGGER, JSONRPC_Handler, create_jsonrpc_response, create_jsonrpc_error)
+from commissaire_http.util import log
 
 
 def _register(router):  # pragma: no cover
@@ -116,14 +117,17 @@ def create_container_manager(message, bus):
     """
     try:
         name = message['params']['name']
-        LOGGER.debug('create_container_manager params: {}'.format(
-            message['params']))
+        # Only log the parameter names as the values may hold secrets
+        log.debug(
+            LOGGER, 'create_container_manager params: {}',
+            log.LazyCall(sorted, message['params']))
         # Check to see if we already have a network with that name
         input_cmc = models.ContainerManagerConfig.new(**message['params'])
         saved_cmc = bus.storage.get(input_cmc)
-        LOGGER.debug(
+        log.debug(
+            LOGGER,
             'Creation of already exisiting ContainerManagerConfig '
-            '"{}" requested.'.format(name))
+            '"{}" requested.', name)
 
         # If they are the same thing then go ahead and return success
         if saved_cmc.to_dict() == input_cmc.to_dict():
@@ -164,15 +168,16 @@ def delete_container_manager(message, bus):
     """
     try:
         name = message['params']['name']
-        LOGGER.debug('Attempting to delete ContainerManagerConfig "{}"'.format(
-            name))
+        log.debug(
+            LOGGER, 'Attempting to delete ContainerManagerConfig "{}"', name)
         bus.storage.delete(models.ContainerManagerConfig.new(name=name))
         return create_jsonrpc_response(message['id'], [])
     except _bus.StorageLookupError as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error deleting ContainerManagerConfig: {}: {}'.format(
-            type(error), error))
+        log.debug(
+            LOGGER, 'Error deleting ContainerManagerConfig: {}: {}',
+            type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
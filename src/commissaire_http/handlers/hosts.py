@@ -23,6 +23,7 @@ from commissaire import models
 from commissaire_http.constants import JSONRPC_ERRORS
 from commissaire_http.handlers import (
     LOGGER, JSONRPC_Handler, create_jsonrpc_response, create_jsonrpc_error)
+from commissaire_http.util import log
 
 
 def _register(router):
@@ -107,8 +108,9 @@ def get_host(message, bus):
         host = bus.storage.get_host(address)
         return create_jsonrpc_response(message['id'], host.to_dict_safe())
     except _bus.RemoteProcedureCallError as error:
-        LOGGER.debug('Client requested a non-existant host: "{}"'.format(
-            message['params']['address']))
+        log.debug(
+            LOGGER, 'Client requested a non-existant host: "{}"',
+            message['params']['address'])
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
 
@@ -125,7 +127,10 @@ def create_host(message, bus):
     :returns: A jsonrpc structure.
     :rtype: dict
     """
-    LOGGER.debug('create_host params: "{}"'.format(message['params']))
+    # Only log the parameter names as the values may hold secrets
+    log.debug(
+        LOGGER, 'create_host params: "{}"',
+        log.LazyCall(sorted, message['params']))
     try:
         address = message['params']['address']
     except KeyError:
@@ -144,10 +149,10 @@ def create_host(message, bus):
                 JSONRPC_ERRORS['CONFLICT'])
         else:
             cluster_data = cluster.to_dict()
-            LOGGER.debug('Found cluster. Data: "{}"'.format(cluster))
+            log.debug(LOGGER, 'Found cluster. Data: "{}"', cluster)
     try:
         host = bus.storage.get_host(address)
-        LOGGER.debug('Host "{}" already exisits.'.format(address))
+        log.debug(LOGGER, 'Host "{}" already exisits.', address)
 
         # Verify the keys match
         if host.ssh_priv_key != message['params'].get('ssh_priv_key', ''):
@@ -156,8 +161,9 @@ def create_host(message, bus):
 
         # Verify the host is in the cluster if it is expected
         if cluster_name and address not in cluster.hostset:
-            LOGGER.debug('Host "{}" is not in cluster "{}"'.format(
-                address, cluster_name))
+            log.debug(
+                LOGGER, 'Host "{}" is not in cluster "{}"',
+                address, cluster_name)
             return create_jsonrpc_error(
                 message, 'Host not in cluster', JSONRPC_ERRORS['CONFLICT'])
 
@@ -165,16 +171,18 @@ def create_host(message, bus):
         return create_jsonrpc_response(message['id'], host.to_dict_safe())
 
     except _bus.RemoteProcedureCallError as error:
-        LOGGER.debug('Brand new host "{}" being created.'.format(
-            message['params']['address']))
+        log.debug(
+            LOGGER, 'Brand new host "{}" being created.',
+            message['params']['address'])
 
     # Save the host to the cluster if it isn't already there
     if cluster_name:
         if address not in cluster.hostset:
             cluster.hostset.append(address)
             bus.storage.save(cluster)
-            LOGGER.debug('Saved host "{}" to cluster "{}"'.format(
-                address, cluster_name))
+            log.debug(
+                LOGGER, 'Saved host "{}" to cluster "{}"',
+                address, cluster_name)
 
     try:
         host = bus.storage.save(models.Host.new(**message['params']))
@@ -210,7 +218,7 @@ def delete_host(message, bus):
     """
     try:
         address = message['params']['address']
-        LOGGER.debug('Attempting to delete host "{}"'.format(address))
+        log.debug(LOGGER, 'Attempting to delete host "{}"', address)
         bus.storage.delete(models.Host.new(address=address))
         # TODO: kick off service job to remove the host?
 
@@ -240,8 +248,7 @@ def delete_host(message, bus):
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error deleting host: {}: {}'.format(
-            type(error), error))
+        log.debug(LOGGER, 'Error deleting host: {}: {}', type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -267,8 +274,8 @@ def get_hostcreds(message, bus):
         }
         return create_jsonrpc_response(message['id'], creds)
     except _bus.RemoteProcedureCallError as error:
-        LOGGER.debug('Client requested a non-existant host: "{}"'.format(
-            address))
+        log.debug(
+            LOGGER, 'Client requested a non-existant host: "{}"', address)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
 
@@ -317,17 +324,19 @@ def get_host_status(message, bus):
             # TODO: Update when we add other types.
             type='host_only')
 
-        LOGGER.debug('Status for host "{0}": "{1}"'.format(
-            host.address, status.to_json_safe()))
+        if log.is_debug(LOGGER):
+            log.debug(
+                LOGGER, 'Status for host "{0}": "{1}"',
+                host.address, status.to_json_safe())
 
         return create_jsonrpc_response(message['id'], status.to_dict_safe())
     except _bus.RemoteProcedureCallError as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug(
-            'Host Status exception caught for {0}: {1}:{2}'.format(
-                address, type(error), error))
+        log.debug(
+            LOGGER, 'Host Status exception caught for {0}: {1}:{2}',
+            address, type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
 
@@ -344,10 +353,10 @@ def _does_cluster_exist(bus, cluster_name):
     :returns: The found Cluster instance or None
     :rtype: mixed
     """
-    LOGGER.debug('Checking on cluster "{}"'.format(cluster_name))
+    log.debug(LOGGER, 'Checking on cluster "{}"', cluster_name)
     try:
         cluster = bus.storage.get_cluster(cluster_name)
-        LOGGER.debug('Found cluster: "{}"'.format(cluster))
+        log.debug(LOGGER, 'Found cluster: "{}"', cluster)
         return cluster
     except _bus.StorageLookupError as error:
         LOGGER.warn(
@@ -21,6 +21,7 @@ from commissaire import bus as _bus
 from commissaire_http.constants import JSONRPC_ERRORS
 from commissaire_http.handlers import (
     LOGGER, JSONRPC_Handler, create_jsonrpc_response, create_jsonrpc_error)
+from commissaire_http.util import log
 
 
 def _register(router):
@@ -118,13 +119,16 @@ def create_network(message, bus):
     """
     try:
         name = message['params']['name']
-        LOGGER.debug('create_network params: {}'.format(message['params']))
+        # Only log the parameter names as the values may hold secrets
+        log.debug(
+            LOGGER, 'create_network params: {}',
+            log.LazyCall(sorted, message['params']))
         # Check to see if we already have a network with that name
         input_network = models.Network.new(**message['params'])
         saved_network = bus.storage.get(input_network)
-        LOGGER.debug(
-            'Creation of already exisiting network "{0}" requested.'.format(
-                name))
+        log.debug(
+            LOGGER, 'Creation of already exisiting network "{0}" requested.',
+            name)
 
         # If they are the same thing then go ahead and return success
         if saved_network.to_dict() == input_network.to_dict():
@@ -165,14 +169,13 @@ def delete_network(message, bus):
     """
     try:
         name = message['params']['name']
-        LOGGER.debug('Attempting to delete network "{}"'.format(name))
+        log.debug(LOGGER, 'Attempting to delete network "{}"', name)
         bus.storage.delete(models.Network.new(name=name))
         return create_jsonrpc_response(message['id'], [])
     except _bus.StorageLookupError as error:
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['NOT_FOUND'])
     except Exception as error:
-        LOGGER.debug('Error deleting network: {}: {}'.format(
-            type(error), error))
+        log.debug(LOGGER, 'Error deleting network: {}: {}', type(error), error)
         return create_jsonrpc_error(
             message, error, JSONRPC_ERRORS['INTERNAL_ERROR'])
@@ -21,6 +21,8 @@ import logging
 
 from routes import Mapper
 
+from commissaire_http.util import log
+
 
 class Router(Mapper):
     """
@@ -79,9 +81,10 @@ class Router(Mapper):
         :returns: Dictionary of mapped result or None if no match.
         :rtype: dict or None
         """
-        self.logger.debug(
-            'Executing routes.Mapper.route with: args={}, kwargs={}'.format(
-                args, kwargs))
+        log.debug(
+            self.logger,
+            'Executing routes.Mapper.route with: args={}, kwargs={}',
+            args, kwargs)
         result = super(Router, self).match(*args, **kwargs)
-        self.logger.debug('Router result: {}'.format(result))
+        log.debug(self.logger, 'Router result: {}', result)
         return result
@@ -22,8 +22,16 @@ from commissaire.util.config import import_plugin
 
 from commissaire_http.authentication import (
     AuthenticationManager, Authenticator)
+from commissaire_http.authentication.ratelimit import FailedAuthRateLimiter
+from commissaire_http.bus.accounting import BUDGETS
 from commissaire_http.server.routing import DISPATCHER  # noqa
-from commissaire_http import CommissaireHttpServer, parse_args
+from commissaire_http.util import memory, profiler
+from commissaire_http.util.capture import TrafficCapture
+from commissaire_http.util.proxy import TrustedProxies
+from commissaire_http.util.timing import ServerTiming
+from commissaire_http.util.watchdog import WATCHDOG
+from commissaire_http import (
+    AdminHttpServer, CommissaireHttpServer, parse_args, parse_bus_budget)
 
 
 def inject_authentication(plugins):
@@ -44,7 +52,7 @@ def inject_authentication(plugins):
             module_name, 'commissaire_http.authentication', Authenticator)
         # NOTE: We set the app to None as we are not using the
         #       authentication_class as the dispatcher itself
-        authn_manager.authenticators.append(
+        authn_manager.add_authenticator(
             authentication_class(None, **plugins[module_name]))
 
     # If there are no authentication managers defined, append the default
@@ -52,7 +60,7 @@ def inject_authentication(plugins):
     if len(authn_manager.authenticators) == 0:
         print(
             'No authentication plugins found. Denying all requests.')
-        authn_manager.authenticators.append(Authenticator(None))
+        authn_manager.add_authenticator(Authenticator(None))
 
     # NOTE: We wrap only the dispatch method, not the entire
     #       dispatcher instance.
@@ -60,6 +68,80 @@ def inject_authentication(plugins):
     return DISPATCHER
 
 
+def inject_middleware(dispatcher, args):
+    """
+    Wraps the dispatcher's dispatch method in the configured middleware.
+
+    :param dispatcher: The dispatcher with authentication injected.
+    :type dispatcher: commissaire_http.dispatcher.Dispatcher
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace
+    :returns: The same dispatcher.
+    :rtype: commissaire_http.dispatcher.Dispatcher
+    """
+    # Reject clients failing authentication too often before the
+    # authenticators spend time verifying their credentials
+    if args.auth_failure_rate:
+        dispatcher.dispatch = FailedAuthRateLimiter(
+            dispatcher.dispatch, args.auth_failure_rate,
+            args.auth_failure_burst)
+
+    # Ahead of everything else so it all sees the real client
+    if args.trusted_proxies:
+        dispatcher.dispatch = TrustedProxies(
+            dispatcher.dispatch, args.trusted_proxies)
+
+    # Outermost so the total covers every phase. Slow request reports
+    # use the phase timings too.
+    timed = args.server_timing or args.server_timing_sample_rate
+    if timed or args.slow_request_threshold is not None:
+        dispatcher.dispatch = ServerTiming(
+            dispatcher.dispatch, args.server_timing,
+            args.server_timing_sample_rate)
+
+    # Outside of timing so its own writes are not counted
+    if args.capture_file:
+        dispatcher.dispatch = TrafficCapture(
+            dispatcher.dispatch, args.capture_file,
+            args.capture_sample_rate)
+    return dispatcher
+
+
+def setup_diagnostics(dispatcher, args):
+    """
+    Configures bus budgets, the watchdog, the profiler, memory
+    diagnostics and the admin listener.
+
+    :param dispatcher: The dispatcher being served.
+    :type dispatcher: commissaire_http.dispatcher.Dispatcher
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace
+    """
+    for budget in args.bus_budgets or ():
+        # Budgets from the configuration file are not parsed yet
+        if isinstance(budget, str):
+            budget = parse_bus_budget(budget)
+        BUDGETS.set_budget(*budget)
+    BUDGETS.reject = args.bus_budget_reject
+
+    if args.slow_request_threshold is not None:
+        WATCHDOG.start(
+            args.slow_request_threshold, args.slow_request_max_reports)
+
+    if args.profile_dir:
+        profiler.PROFILER.output_dir = args.profile_dir
+    if args.profile_signal:
+        profiler.install_signal_handler()
+
+    # Lets memory diagnostics group allocations by route
+    memory.MEMORY.route_sites = dispatcher.get_handler_sites()
+
+    # Metrics and other operational endpoints on their own listener
+    if args.admin_listen_port is not None:
+        AdminHttpServer(
+            args.admin_listen_interface, args.admin_listen_port).start()
+
+
 def main():
     """
     Main entry point.
@@ -74,12 +156,19 @@ def main():
     try:
         # Inject the authentication plugin
         DISPATCHER = inject_authentication(args.authentication_plugins)
+        DISPATCHER = inject_middleware(DISPATCHER, args)
+
+        if args.coalesce_requests:
+            DISPATCHER.setup_coalescing(args.coalesce_timeout)
 
         # Connect to the bus
         DISPATCHER.setup_bus(
             args.bus_exchange,
             args.bus_uri,
-            [{'name': 'simple', 'routing_key': 'simple.*'}])
+            [{'name': 'simple', 'routing_key': 'simple.*'}],
+            args.storage_batch_window)
+
+        setup_diagnostics(DISPATCHER, args)
 
         # Create the server
         server = CommissaireHttpServer(
@@ -87,7 +176,9 @@ def main():
             args.listen_port,
             DISPATCHER,
             args.tls_pemfile,
-            args.tls_clientverifyfile)
+            args.tls_clientverifyfile,
+            args.listen_unix_socket,
+            args.listen_unix_socket_mode)
 
         # Serve until we are killed off
         server.serve_forever()
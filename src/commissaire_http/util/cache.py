@@ -0,0 +1,137 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Caching utilities.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread safe, size bounded, least recently used cache whose entries
+    expire after a time to live.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        """
+        Initializes a new TTLCache instance.
+
+        :param maxsize: Maximum number of entries. 0 disables the cache.
+        :type maxsize: int
+        :param ttl: Default number of seconds an entry lives.
+        :type ttl: float
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):  # noqa
+        """
+        Number of entries, including expired ones not yet evicted.
+        """
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Returns the value for a key if it is present and not expired.
+
+        :param key: The key to look up.
+        :type key: hashable
+        :param default: Value returned on a miss.
+        :type default: mixed
+        :returns: The cached value or default.
+        :rtype: mixed
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value, evicting the least recently used entries if the
+        cache is full.
+
+        :param key: The key to store under.
+        :type key: hashable
+        :param value: The value to store.
+        :type value: mixed
+        :param ttl: Seconds the entry lives. Defaults to the cache ttl.
+        :type ttl: float or None
+        """
+        if self.maxsize <= 0:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Removes a key from the cache.
+
+        :param key: The key to remove.
+        :type key: hashable
+        :param default: Value returned if the key is not present.
+        :type default: mixed
+        :returns: The removed value or default.
+        :rtype: mixed
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def discard_if(self, predicate):
+        """
+        Removes all entries whose value matches a predicate.
+
+        :param predicate: Callable given a value, returning True to remove it.
+        :type predicate: callable
+        :returns: The number of removed entries.
+        :rtype: int
+        """
+        with self._lock:
+            keys = [
+                key for key, (_, value) in self._data.items()
+                if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
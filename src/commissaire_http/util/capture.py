@@ -0,0 +1,207 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Capture of request metadata for replaying production load.
+
+Only metadata is recorded, one JSON object per line: the start time,
+method, path, query string, body size, credential types, status and
+duration. Bodies and header values are never recorded and query values
+of sensitive looking parameters are redacted.
+"""
+
+import atexit
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from urllib.parse import parse_qsl, urlencode
+
+from commissaire_http.authentication import get_credentials
+
+#: Query parameters whose values are redacted
+SENSITIVE_QUERY = re.compile(
+    r'pass|secret|token|key|auth|cred', re.IGNORECASE)
+
+#: Replaces redacted query values
+REDACTED = 'REDACTED'
+
+#: Seconds between flushes of the capture file
+FLUSH_INTERVAL = 1.0
+
+
+def sanitize_query(query):
+    """
+    Redacts the values of sensitive looking query parameters.
+
+    :param query: The query string.
+    :type query: str
+    :returns: The sanitized query string.
+    :rtype: str
+    """
+    if not query:
+        return ''
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([
+        (key, REDACTED if SENSITIVE_QUERY.search(key) else value)
+        for key, value in pairs])
+
+
+class TrafficCapture:
+    """
+    WSGI middleware, placed outermost, which records the metadata of a
+    sample of requests to a JSONL file.
+
+    Each line holds: t (start as seconds since the epoch), m (method),
+    p (path), q (sanitized query), b (body bytes), a (credential types),
+    s (status) and d (duration in milliseconds).
+    """
+
+    #: Logger for TrafficCapture
+    logger = logging.getLogger('TrafficCapture')
+
+    def __init__(self, app, path, sample_rate=1.0, clock=time.time):
+        """
+        Initializes a new TrafficCapture instance.
+
+        :param app: The WSGI app to wrap.
+        :type app: callable
+        :param path: The file to append the capture to.
+        :type path: str
+        :param sample_rate: Fraction of requests recorded.
+        :type sample_rate: float
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self._app = app
+        self.path = path
+        self.sample_rate = float(sample_rate)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+        self._flushed = clock()
+        # Writes are flushed at most once per FLUSH_INTERVAL, keep the
+        # tail of the capture when the server exits
+        atexit.register(self.close)
+        self.logger.info('Capturing {:.0%} of requests to {}'.format(
+            self.sample_rate, path))
+
+    def record(self, environ, status, started, duration):
+        """
+        Writes the metadata of a request.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param status: The response status code or None.
+        :type status: int or None
+        :param started: When the request started.
+        :type started: float
+        :param duration: Seconds the request took.
+        :type duration: float
+        """
+        try:
+            body = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            body = 0
+        line = json.dumps({
+            't': round(started, 6),
+            'm': environ.get('REQUEST_METHOD'),
+            'p': environ.get('PATH_INFO'),
+            'q': sanitize_query(environ.get('QUERY_STRING')),
+            'b': body,
+            'a': sorted(get_credentials(environ)),
+            's': status,
+            'd': round(duration * 1000, 3),
+        }, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            now = self._clock()
+            if now - self._flushed >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed = now
+
+    def close(self):
+        """
+        Flushes and closes the capture file.
+        """
+        atexit.unregister(self.close)
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._file.close()
+                self._file = None
+
+    def __call__(self, environ, start_response):
+        """
+        Records the request if sampled and passes it to the wrapped app.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: Response back to requestor.
+        :rtype: list
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return self._app(environ, start_response)
+
+        statuses = []
+
+        def capture_start_response(status, headers, *exc_info):
+            statuses.append(status)
+            return start_response(status, headers, *exc_info)
+
+        started = self._clock()
+        try:
+            return self._app(environ, capture_start_response)
+        finally:
+            status = None
+            if statuses:
+                try:
+                    status = int(statuses[-1][:3])
+                except ValueError:
+                    pass
+            try:
+                self.record(
+                    environ, status, started, self._clock() - started)
+            except (OSError, ValueError) as error:
+                self.logger.error('Unable to capture request: {}'.format(
+                    error))
+
+
+def read_capture(path):
+    """
+    Reads a capture, skipping lines which can not be parsed.
+
+    :param path: The capture file.
+    :type path: str
+    :returns: The recorded requests, in order of their start.
+    :rtype: list
+    """
+    requests = []
+    with open(path) as capture:
+        for line in capture:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(request, dict) and 't' in request:
+                requests.append(request)
+    requests.sort(key=lambda request: request['t'])
+    return requests
@@ -0,0 +1,156 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Circuit breaker for calls to remote services.
+"""
+
+import logging
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is refused because the circuit is open.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after repeated failures of a remote service.
+
+    After failure_threshold consecutive failures the circuit opens and
+    calls are refused for reset_timeout seconds. Then a single trial call
+    is let through; success closes the circuit, failure opens it again.
+    """
+
+    #: Logger for CircuitBreaker
+    logger = logging.getLogger('CircuitBreaker')
+
+    #: Circuit states
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30,
+                 clock=time.monotonic):
+        """
+        Initializes a new CircuitBreaker instance.
+
+        :param name: Name of the remote service used in logs.
+        :type name: str
+        :param failure_threshold: Consecutive failures which open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the circuit stays open.
+        :type reset_timeout: float
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout = float(reset_timeout)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        """
+        The current state of the circuit.
+
+        :rtype: str
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if self._clock() - self._opened_at < self.reset_timeout:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def allow(self):
+        """
+        Checks if a call may be made, claiming the trial call when the
+        circuit is half open.
+
+        :returns: True if the call may be made.
+        :rtype: bool
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def success(self):
+        """
+        Records a successful call, closing the circuit.
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                self.logger.info('Circuit for {} closed.'.format(self.name))
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def failure(self):
+        """
+        Records a failed call, opening the circuit if needed. Failures
+        of calls made before the circuit opened do not restart its reset
+        timeout.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._trial_running:
+                # The half open trial failed, wait out another timeout
+                self._trial_running = False
+                self._opened_at = self._clock()
+            elif self._opened_at is None:
+                if self._failures >= self.failure_threshold:
+                    self.logger.warn(
+                        'Circuit for {} opened after {} failures.'.format(
+                            self.name, self._failures))
+                    self._opened_at = self._clock()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func through the circuit. Any exception counts as a failure.
+
+        :param func: The callable.
+        :type func: callable
+        :param args: Positional arguments for func.
+        :type args: tuple
+        :param kwargs: Keyword arguments for func.
+        :type kwargs: dict
+        :returns: The result of func.
+        :rtype: mixed
+        :raises: CircuitOpenError
+        """
+        if not self.allow():
+            raise CircuitOpenError(
+                'Circuit for {} is open'.format(self.name))
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
@@ -0,0 +1,129 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Bounded executors for CPU heavy work done on behalf of requests.
+"""
+
+import os
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from commissaire_http.util.metrics import REGISTRY
+
+#: Callers waiting for an executor slot
+QUEUE_DEPTH = REGISTRY.gauge(
+    'commissaire_executor_queue_depth',
+    'Callers waiting for an executor slot.', ('executor',))
+#: Time spent running work in an executor
+TASK_SECONDS = REGISTRY.histogram(
+    'commissaire_executor_task_seconds',
+    'Seconds spent running work in an executor.', ('executor',))
+#: Work rejected because an executor was saturated
+REJECTED = REGISTRY.counter(
+    'commissaire_executor_rejected_total',
+    'Work rejected because the executor was saturated.', ('executor',))
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised when no executor slot frees up within the queue timeout.
+    """
+    pass
+
+
+class BoundedExecutor:
+    """
+    Runs callables in a thread or process pool with a concurrency limit.
+
+    Callers wait at most queue_timeout seconds for a free slot and then
+    fail fast with ExecutorSaturatedError.
+    """
+
+    #: Supported pool kinds
+    kinds = {
+        'thread': ThreadPoolExecutor,
+        'process': ProcessPoolExecutor,
+    }
+
+    def __init__(self, name, kind='thread', max_workers=None,
+                 queue_timeout=1.0):
+        """
+        Initializes a new BoundedExecutor instance.
+
+        :param name: Name used to label metrics.
+        :type name: str
+        :param kind: Either 'thread' or 'process'.
+        :type kind: str
+        :param max_workers: Concurrency limit. Defaults to the CPU count.
+        :type max_workers: int or None
+        :param queue_timeout: Seconds to wait for a free slot.
+        :type queue_timeout: float
+        :raises: ValueError
+        """
+        if kind not in self.kinds:
+            raise ValueError('Executor kind must be one of {}'.format(
+                ', '.join(sorted(self.kinds))))
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.name = name
+        self.kind = kind
+        self.max_workers = int(max_workers)
+        self.queue_timeout = float(queue_timeout)
+        self._executor = self.kinds[kind](max_workers=self.max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._queue_depth = QUEUE_DEPTH.labels(name)
+        self._task_seconds = TASK_SECONDS.labels(name)
+        self._rejected = REJECTED.labels(name)
+
+    def run(self, func, *args):
+        """
+        Runs a callable in the pool and waits for its result.
+
+        :param func: The callable. Must be picklable for process pools.
+        :type func: callable
+        :param args: Arguments for the callable.
+        :type args: tuple
+        :returns: The result of the callable.
+        :rtype: mixed
+        :raises: ExecutorSaturatedError
+        """
+        self._queue_depth.inc()
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            self._queue_depth.dec()
+        if not acquired:
+            self._rejected.inc()
+            raise ExecutorSaturatedError(
+                'No {} executor slot free after {}s'.format(
+                    self.name, self.queue_timeout))
+
+        start = time.monotonic()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+            self._task_seconds.observe(time.monotonic() - start)
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down the pool.
+
+        :param wait: Wait for running work to finish.
+        :type wait: bool
+        """
+        self._executor.shutdown(wait=wait)
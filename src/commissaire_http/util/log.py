@@ -0,0 +1,323 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Logging utilities.
+
+Debug messages on the request path should go through debug() so that no
+formatting work happens unless the message will actually be emitted.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+
+from urllib.parse import parse_qs
+
+
+class _SampleState(threading.local):
+    """
+    Per thread state used for sampled debug logging.
+    """
+    #: Whether debug logging is forced on for the current request
+    sampled = False
+
+
+_local = _SampleState()
+
+
+class LazyFormat:
+    """
+    Message which is only formatted (with str.format) when rendered.
+    """
+
+    __slots__ = ('fmt', 'args', 'kwargs')
+
+    def __init__(self, fmt, args, kwargs):
+        """
+        Initializes a new LazyFormat instance.
+
+        :param fmt: The format string.
+        :type fmt: str
+        :param args: Positional format arguments.
+        :type args: tuple
+        :param kwargs: Keyword format arguments.
+        :type kwargs: dict
+        """
+        self.fmt = fmt
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):  # noqa
+        """
+        The formatted message.
+        """
+        return self.fmt.format(*self.args, **self.kwargs)
+
+
+class LazyCall:
+    """
+    Format argument which is only computed when the message is rendered.
+    """
+
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        """
+        Initializes a new LazyCall instance.
+
+        :param func: Callable returning the value to format.
+        :type func: callable
+        :param args: Positional arguments for func.
+        :type args: tuple
+        """
+        self.func = func
+        self.args = args
+
+    def __format__(self, spec):  # noqa
+        """
+        The formatted result of the call.
+        """
+        return format(self.func(*self.args), spec)
+
+    def __str__(self):  # noqa
+        """
+        The result of the call as a string.
+        """
+        return str(self.func(*self.args))
+
+
+class RouteDebugSampler:
+    """
+    Decides, per route, which requests have debug logging forced on.
+
+    Rates can be changed at runtime from any thread.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new RouteDebugSampler instance.
+        """
+        self._rates = {}
+
+    @property
+    def rates(self):
+        """
+        Returns a copy of the configured sample rates.
+
+        :returns: Mapping of route template to sample rate.
+        :rtype: dict
+        """
+        return dict(self._rates)
+
+    def set_rate(self, route, rate):
+        """
+        Sets the fraction of requests on a route to log at debug level.
+
+        :param route: The route template (IE: /api/v0/host/{address}/).
+        :type route: str
+        :param rate: Value between 0.0 (never) and 1.0 (always).
+        :type rate: float
+        """
+        rate = float(rate)
+        if rate <= 0:
+            self._rates.pop(route, None)
+        else:
+            self._rates[route] = min(rate, 1.0)
+
+    def clear(self):
+        """
+        Removes all configured sample rates.
+        """
+        self._rates = {}
+
+    def sample(self, route):
+        """
+        Rolls the dice for a single request on a route.
+
+        :param route: The route template.
+        :type route: str
+        :returns: True if the request should log at debug level.
+        :rtype: bool
+        """
+        rate = self._rates.get(route)
+        if not rate:
+            return False
+        return rate >= 1.0 or random.random() < rate
+
+
+class LogLimiter:
+    """
+    Limits the messages written to a logger to max_messages per period.
+    The number of suppressed messages is logged when a period ends.
+    """
+
+    def __init__(self, logger, max_messages=10, period=60,
+                 description='messages', clock=time.monotonic):
+        """
+        Initializes a new LogLimiter instance.
+
+        :param logger: The logger to write to.
+        :type logger: logging.Logger
+        :param max_messages: Messages written per period.
+        :type max_messages: int
+        :param period: Seconds over which max_messages applies.
+        :type period: float
+        :param description: What the messages are, used when reporting
+                            suppressed ones.
+        :type description: str
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self.logger = logger
+        self.max_messages = int(max_messages)
+        self.period = float(period)
+        self.description = description
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._period_started = float('-inf')
+        self._written = 0
+        self._suppressed = 0
+
+    def allow(self):
+        """
+        Checks if a message may be written, counting it if so.
+
+        :returns: True if the message may be written.
+        :rtype: bool
+        """
+        now = self._clock()
+        with self._lock:
+            if now - self._period_started >= self.period:
+                suppressed = self._suppressed
+                self._period_started = now
+                self._written = 0
+                self._suppressed = 0
+            else:
+                suppressed = 0
+            if self._written >= self.max_messages:
+                self._suppressed += 1
+                allowed = False
+            else:
+                self._written += 1
+                allowed = True
+        if suppressed:
+            self.logger.warn('Suppressed {} {}.'.format(
+                suppressed, self.description))
+        return allowed
+
+    def warn(self, msg):
+        """
+        Writes a warning unless the limit was reached.
+
+        :param msg: The message.
+        :type msg: str
+        """
+        if self.allow():
+            self.logger.warn(msg)
+
+
+#: Global sampler consulted by the Dispatcher
+SAMPLER = RouteDebugSampler()
+
+
+def set_sampled(sampled):
+    """
+    Forces (or stops forcing) debug logging for the current thread.
+
+    :param sampled: Whether debug logging is forced on.
+    :type sampled: bool
+    """
+    _local.sampled = sampled
+
+
+def is_debug(logger):
+    """
+    Checks if debug messages would be emitted by a logger in this thread.
+
+    :param logger: The logger to check.
+    :type logger: logging.Logger
+    :returns: True if debug messages are emitted.
+    :rtype: bool
+    """
+    return _local.sampled or logger.isEnabledFor(logging.DEBUG)
+
+
+def debug(logger, fmt, *args, **kwargs):
+    """
+    Logs a brace style message at debug level without formatting it
+    unless it will be emitted.
+
+    :param logger: The logger to use.
+    :type logger: logging.Logger
+    :param fmt: The format string.
+    :type fmt: str
+    :param args: Positional format arguments.
+    :type args: tuple
+    :param kwargs: Keyword format arguments.
+    :type kwargs: dict
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(LazyFormat(fmt, args, kwargs))
+    elif _local.sampled and not logger.disabled:
+        # Bypass the logger level for sampled requests. Handler levels
+        # still apply.
+        logger.handle(logger.makeRecord(
+            logger.name, logging.DEBUG, '(sampled)', 0,
+            LazyFormat(fmt, args, kwargs), (), None))
+
+
+def debug_log_app(environ, start_response, sampler=SAMPLER):
+    """
+    WSGI app for the admin listener controlling per route debug sampling.
+
+    GET returns the configured rates. POST sets the rate of a route,
+    taking the 'route' and 'rate' query parameters, with a rate of 0
+    removing it. DELETE removes the rate of 'route', or all rates when
+    no route is given.
+
+    :param environ: WSGI environment instance.
+    :type environ: dict
+    :param start_response: WSGI start response callable.
+    :type start_response: callable
+    :param sampler: The sampler to control.
+    :type sampler: RouteDebugSampler
+    :returns: The configured rates as JSON.
+    :rtype: list
+    """
+    method = environ.get('REQUEST_METHOD')
+    params = {
+        key: values[0] for key, values in parse_qs(
+            environ.get('QUERY_STRING', '')).items()}
+    if method == 'POST':
+        try:
+            sampler.set_rate(params['route'], params['rate'])
+        except (KeyError, ValueError):
+            start_response('400 Bad Request', [('content-type', 'text/html')])
+            return [bytes('Bad Request', 'utf8')]
+    elif method == 'DELETE':
+        if 'route' in params:
+            sampler.set_rate(params['route'], 0)
+        else:
+            sampler.clear()
+    elif method != 'GET':
+        start_response(
+            '405 Method Not Allowed',
+            [('content-type', 'text/html'), ('Allow', 'GET, POST, DELETE')])
+        return [bytes('Method Not Allowed', 'utf8')]
+
+    start_response('200 OK', [('content-type', 'application/json')])
+    return [bytes(json.dumps(sampler.rates), 'utf8')]
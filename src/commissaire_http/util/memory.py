@@ -0,0 +1,243 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Memory diagnostics for live servers using tracemalloc.
+
+Snapshots are taken on demand and compared to find the allocation sites
+which grew in between. Allocations made below a route handler are
+attributed to its route.
+"""
+
+import json
+import logging
+import threading
+import tracemalloc
+
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+#: Allocations of these files are left out of snapshots
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>', '<unknown>')
+
+#: Route of allocations made outside of any route handler
+UNATTRIBUTED = 'unattributed'
+
+
+class MemoryDiagnostics:
+    """
+    Starts and stops tracemalloc, keeps snapshots and diffs them.
+    """
+
+    #: Logger for MemoryDiagnostics
+    logger = logging.getLogger('MemoryDiagnostics')
+
+    def __init__(self, max_snapshots=10):
+        """
+        Initializes a new MemoryDiagnostics instance.
+
+        :param max_snapshots: Snapshots kept. The oldest is dropped first.
+        :type max_snapshots: int
+        """
+        self.max_snapshots = int(max_snapshots)
+        #: filename -> [(first line, last line, route), ...] of handlers
+        self.route_sites = {}
+        self._snapshots = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self):
+        """
+        If tracemalloc is tracing allocations.
+
+        :rtype: bool
+        """
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=25):
+        """
+        Starts tracing allocations.
+
+        :param frames: Frames stored per allocation. Route attribution
+                       needs enough to reach the handler.
+        :type frames: int
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(frames))
+            self.logger.info(
+                'Tracing allocations with {} frames'.format(frames))
+
+    def stop(self):
+        """
+        Stops tracing allocations and drops all snapshots.
+        """
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.logger.info('Stopped tracing allocations')
+
+    def snapshot(self):
+        """
+        Takes a snapshot of the traced allocations.
+
+        :returns: The id of the snapshot.
+        :rtype: int
+        :raises: RuntimeError if not tracing
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, filename)
+            for filename in IGNORED_FILES])
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    @property
+    def snapshot_ids(self):
+        """
+        Ids of the kept snapshots, oldest first.
+
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._snapshots)
+
+    def route_of(self, traceback):
+        """
+        Finds the route whose handler made an allocation.
+
+        :param traceback: The traceback of the allocation.
+        :type traceback: tracemalloc.Traceback
+        :returns: The innermost route in the traceback or None.
+        :rtype: str or None
+        """
+        for frame in reversed(traceback):
+            for first, last, route in self.route_sites.get(
+                    frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return route
+        return None
+
+    def diff(self, first_id, second_id, limit=20):
+        """
+        Compares two snapshots.
+
+        :param first_id: The id of the earlier snapshot.
+        :type first_id: int
+        :param second_id: The id of the later snapshot.
+        :type second_id: int
+        :param limit: Allocation sites to return.
+        :type limit: int
+        :returns: The sites which grew most and growth per route.
+        :rtype: dict
+        :raises: KeyError if a snapshot is unknown
+        """
+        with self._lock:
+            first = self._snapshots[first_id]
+            second = self._snapshots[second_id]
+        stats = second.compare_to(first, 'traceback')
+
+        routes = {}
+        for stat in stats:
+            route = self.route_of(stat.traceback) or UNATTRIBUTED
+            routes[route] = routes.get(route, 0) + stat.size_diff
+
+        top = []
+        for stat in sorted(
+                stats, key=lambda stat: stat.size_diff, reverse=True):
+            if len(top) >= limit or stat.size_diff <= 0:
+                break
+            frame = stat.traceback[-1]
+            top.append({
+                'site': '{}:{}'.format(frame.filename, frame.lineno),
+                'route': self.route_of(stat.traceback),
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size,
+                'count': stat.count,
+                'traceback': [
+                    '{}:{}'.format(frame.filename, frame.lineno)
+                    for frame in reversed(stat.traceback)],
+            })
+        return {
+            'first': first_id,
+            'second': second_id,
+            'top': top,
+            'routes': routes,
+        }
+
+
+#: Global memory diagnostics for the admin listener
+MEMORY = MemoryDiagnostics()
+
+
+def memory_app(environ, start_response, diagnostics=MEMORY):
+    """
+    WSGI app for the admin listener controlling memory diagnostics.
+
+    POST takes an 'action' query parameter of start (with an optional
+    'frames'), stop or snapshot. GET returns the state, or the diff of
+    the 'first' and 'second' snapshots when given, limited to 'limit'
+    sites.
+
+    :param environ: WSGI environment instance.
+    :type environ: dict
+    :param start_response: WSGI start response callable.
+    :type start_response: callable
+    :param diagnostics: The diagnostics to control.
+    :type diagnostics: MemoryDiagnostics
+    :returns: The state or diff as JSON.
+    :rtype: list
+    """
+    method = environ.get('REQUEST_METHOD')
+    params = {
+        key: values[0] for key, values in parse_qs(
+            environ.get('QUERY_STRING', '')).items()}
+    result = {}
+    try:
+        if method == 'POST':
+            action = params.get('action')
+            if action == 'start':
+                diagnostics.start(int(params.get('frames', 25)))
+            elif action == 'stop':
+                diagnostics.stop()
+            elif action == 'snapshot':
+                result['snapshot'] = diagnostics.snapshot()
+            else:
+                raise ValueError('Unknown action {}'.format(action))
+        elif method != 'GET':
+            start_response(
+                '405 Method Not Allowed',
+                [('content-type', 'text/html'), ('Allow', 'GET, POST')])
+            return [bytes('Method Not Allowed', 'utf8')]
+        elif 'first' in params or 'second' in params:
+            result = diagnostics.diff(
+                int(params['first']), int(params['second']),
+                int(params.get('limit', 20)))
+    except (KeyError, ValueError, RuntimeError) as error:
+        start_response('400 Bad Request', [('content-type', 'text/html')])
+        return [bytes('Bad Request: {}'.format(error), 'utf8')]
+
+    result.setdefault('tracing', diagnostics.tracing)
+    result.setdefault('snapshots', diagnostics.snapshot_ids)
+    if diagnostics.tracing:
+        result['traced'], result['peak'] = tracemalloc.get_traced_memory()
+    start_response('200 OK', [('content-type', 'application/json')])
+    return [bytes(json.dumps(result), 'utf8')]
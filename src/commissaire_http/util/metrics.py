@@ -0,0 +1,568 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Low overhead, in process metrics.
+
+Updates never take a lock. They are appended to a deque (an atomic
+operation) and folded into the metric value by whichever thread reads the
+metric, or by a writer once enough updates are pending.
+
+Metrics are exposed in the Prometheus text format by render().
+"""
+
+import math
+import threading
+
+from bisect import bisect_left
+from collections import deque
+
+#: Pending updates which trigger a fold by the writing thread
+FOLD_THRESHOLD = 4096
+
+#: Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Value:
+    """
+    Base class for a single labeled metric value.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new _Value instance.
+        """
+        self._pending = deque()
+        self._fold_lock = threading.Lock()
+
+    def _add(self, update):
+        """
+        Records an update without locking.
+
+        :param update: The update to fold in later.
+        :type update: mixed
+        """
+        self._pending.append(update)
+        if len(self._pending) > FOLD_THRESHOLD:
+            self._flush(blocking=False)
+
+    def _flush(self, blocking=True):
+        """
+        Folds pending updates into the value.
+
+        :param blocking: If False, give up when another thread is folding.
+        :type blocking: bool
+        """
+        if not self._fold_lock.acquire(blocking):
+            return
+        try:
+            pending = self._pending
+            while pending:
+                self._fold(pending.popleft())
+        finally:
+            self._fold_lock.release()
+
+    def _fold(self, update):  # pragma: no cover
+        """
+        Applies a single update to the value.
+
+        :param update: The update to apply.
+        :type update: mixed
+        """
+        raise NotImplementedError
+
+
+class CounterValue(_Value):
+    """
+    A value which only goes up.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new CounterValue instance.
+        """
+        super(CounterValue, self).__init__()
+        self._value = 0
+
+    def _fold(self, update):
+        """
+        Applies a single update to the value.
+        """
+        self._value += update
+
+    def inc(self, amount=1):
+        """
+        Increments the counter.
+
+        :param amount: Amount to increment by.
+        :type amount: int or float
+        """
+        self._add(amount)
+
+    @property
+    def value(self):
+        """
+        The current value.
+
+        :rtype: int or float
+        """
+        self._flush()
+        return self._value
+
+
+class GaugeValue(CounterValue):
+    """
+    A value which can go up and down.
+    """
+
+    def dec(self, amount=1):
+        """
+        Decrements the gauge.
+
+        :param amount: Amount to decrement by.
+        :type amount: int or float
+        """
+        self._add(-amount)
+
+    def set(self, value):
+        """
+        Sets the gauge to a value.
+
+        :param value: The new value.
+        :type value: int or float
+        """
+        with self._fold_lock:
+            pending = self._pending
+            while pending:
+                self._fold(pending.popleft())
+            self._value = value
+
+
+class HistogramValue(_Value):
+    """
+    Counts observations into cumulative buckets.
+    """
+
+    def __init__(self, buckets):
+        """
+        Initializes a new HistogramValue instance.
+
+        :param buckets: Sorted upper bounds of the buckets.
+        :type buckets: tuple
+        """
+        super(HistogramValue, self).__init__()
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def _fold(self, update):
+        """
+        Applies a single update to the value.
+        """
+        self._counts[bisect_left(self._buckets, update)] += 1
+        self._sum += update
+
+    def observe(self, value):
+        """
+        Records an observation.
+
+        :param value: The observed value.
+        :type value: float
+        """
+        self._add(value)
+
+    def snapshot(self):
+        """
+        Returns the cumulative bucket counts, sum and count.
+
+        :returns: Tuple of ([(upper bound, cumulative count), ...], sum, count)
+        :rtype: tuple
+        """
+        self._flush()
+        with self._fold_lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self._buckets + (float('inf'),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, total_sum, running
+
+
+class Metric:
+    """
+    A named metric with optional labels.
+    """
+
+    #: The type name of the metric
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initializes a new Metric instance.
+
+        :param name: The metric name.
+        :type name: str
+        :param documentation: Help text for the metric.
+        :type documentation: str
+        :param labelnames: Names of the labels.
+        :type labelnames: tuple
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):  # pragma: no cover
+        """
+        Creates a new value instance for a label set.
+        """
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        """
+        Returns the value for a set of label values.
+
+        :param labelvalues: Label values in the order of labelnames.
+        :type labelvalues: tuple
+        :returns: The value for the labels.
+        :rtype: _Value
+        :raises: ValueError
+        """
+        value = self._values.get(labelvalues)
+        if value is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError('Expected labels {}, got {}'.format(
+                    self.labelnames, labelvalues))
+            with self._lock:
+                value = self._values.setdefault(
+                    labelvalues, self._new_value())
+        return value
+
+    def items(self):
+        """
+        Returns all label values and their values.
+
+        :returns: List of (label values, value) tuples.
+        :rtype: list
+        """
+        return list(self._values.items())
+
+
+class Counter(Metric):
+    """
+    A metric which only goes up.
+    """
+
+    type_name = 'counter'
+
+    def _new_value(self):
+        """
+        Creates a new value instance for a label set.
+        """
+        return CounterValue()
+
+    def inc(self, amount=1):
+        """
+        Increments the unlabeled counter.
+
+        :param amount: Amount to increment by.
+        :type amount: int or float
+        """
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """
+    A metric which can go up and down.
+    """
+
+    type_name = 'gauge'
+
+    def _new_value(self):
+        """
+        Creates a new value instance for a label set.
+        """
+        return GaugeValue()
+
+    def inc(self, amount=1):
+        """
+        Increments the unlabeled gauge.
+
+        :param amount: Amount to increment by.
+        :type amount: int or float
+        """
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        """
+        Decrements the unlabeled gauge.
+
+        :param amount: Amount to decrement by.
+        :type amount: int or float
+        """
+        self.labels().dec(amount)
+
+    def set(self, value):
+        """
+        Sets the unlabeled gauge.
+
+        :param value: The new value.
+        :type value: int or float
+        """
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """
+    A metric counting observations into buckets.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        """
+        Initializes a new Histogram instance.
+
+        :param name: The metric name.
+        :type name: str
+        :param documentation: Help text for the metric.
+        :type documentation: str
+        :param labelnames: Names of the labels.
+        :type labelnames: tuple
+        :param buckets: Upper bounds of the buckets.
+        :type buckets: tuple
+        """
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        """
+        Creates a new value instance for a label set.
+        """
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        """
+        Records an observation on the unlabeled histogram.
+
+        :param value: The observed value.
+        :type value: float
+        """
+        self.labels().observe(value)
+
+
+class Registry:
+    """
+    Collection of named metrics.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new Registry instance.
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        """
+        Returns the named metric, creating it if needed.
+
+        :param cls: The Metric class.
+        :type cls: type
+        :param name: The metric name.
+        :type name: str
+        :returns: The metric.
+        :rtype: Metric
+        :raises: ValueError
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError('Metric {} is already a {}'.format(
+                    name, metric.type_name))
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Returns the named Counter, creating it if needed.
+
+        :param name: The metric name.
+        :type name: str
+        :param documentation: Help text for the metric.
+        :type documentation: str
+        :param labelnames: Names of the labels.
+        :type labelnames: tuple
+        :rtype: Counter
+        """
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """
+        Returns the named Gauge, creating it if needed.
+
+        :param name: The metric name.
+        :type name: str
+        :param documentation: Help text for the metric.
+        :type documentation: str
+        :param labelnames: Names of the labels.
+        :type labelnames: tuple
+        :rtype: Gauge
+        """
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        """
+        Returns the named Histogram, creating it if needed.
+
+        :param name: The metric name.
+        :type name: str
+        :param documentation: Help text for the metric.
+        :type documentation: str
+        :param labelnames: Names of the labels.
+        :type labelnames: tuple
+        :param buckets: Upper bounds of the buckets.
+        :type buckets: tuple
+        :rtype: Histogram
+        """
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def metrics(self):
+        """
+        Returns all registered metrics sorted by name.
+
+        :rtype: list
+        """
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+
+#: Global metric registry
+REGISTRY = Registry()
+
+
+def _format_number(value):
+    """
+    Formats a sample value or bucket bound for the text format.
+
+    :param value: The number to format.
+    :type value: int or float
+    :rtype: str
+    """
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+    return repr(value)
+
+
+def _format_labels(names, values):
+    """
+    Formats a label set for the text format.
+
+    :param names: The label names.
+    :type names: tuple
+    :param values: The label values, in the order of names.
+    :type values: tuple
+    :returns: The label set including braces or an empty string.
+    :rtype: str
+    """
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+def render(registry=REGISTRY):
+    """
+    Renders all metrics of a registry in the Prometheus text format.
+
+    :param registry: The registry to render.
+    :type registry: Registry
+    :returns: The exposition text.
+    :rtype: str
+    """
+    lines = []
+    for metric in registry.metrics():
+        documentation = metric.documentation.replace(
+            '\\', '\\\\').replace('\n', '\\n')
+        lines.append('# HELP {} {}'.format(metric.name, documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type_name))
+        for labelvalues, value in sorted(
+                metric.items(), key=lambda item: tuple(map(str, item[0]))):
+            if metric.type_name == 'histogram':
+                bucket_names = metric.labelnames + ('le',)
+                cumulative, total_sum, count = value.snapshot()
+                for bound, bucket_count in cumulative:
+                    lines.append('{}_bucket{} {}'.format(
+                        metric.name,
+                        _format_labels(
+                            bucket_names,
+                            labelvalues + (_format_number(bound),)),
+                        bucket_count))
+                labels = _format_labels(metric.labelnames, labelvalues)
+                lines.append('{}_sum{} {}'.format(
+                    metric.name, labels, _format_number(total_sum)))
+                lines.append('{}_count{} {}'.format(
+                    metric.name, labels, count))
+            else:
+                lines.append('{}{} {}'.format(
+                    metric.name,
+                    _format_labels(metric.labelnames, labelvalues),
+                    _format_number(value.value)))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_app(environ, start_response):
+    """
+    WSGI app serving the global registry in the Prometheus text format.
+
+    :param environ: WSGI environment instance.
+    :type environ: dict
+    :param start_response: WSGI start response callable.
+    :type start_response: callable
+    :returns: The rendered metrics.
+    :rtype: list
+    """
+    if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+        start_response(
+            '405 Method Not Allowed',
+            [('content-type', 'text/html'), ('Allow', 'GET, HEAD')])
+        return [bytes('Method Not Allowed', 'utf8')]
+    body = render().encode('utf-8')
+    start_response('200 OK', [
+        ('content-type', CONTENT_TYPE),
+        ('content-length', str(len(body)))])
+    if environ['REQUEST_METHOD'] == 'HEAD':
+        return []
+    return [body]
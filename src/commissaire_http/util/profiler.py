@@ -0,0 +1,327 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+On demand sampling profiler for live servers.
+
+While a profile runs, the Dispatcher registers a sample of requests with
+the profiler. A background thread periodically looks at the stacks of the
+threads handling them and counts them by route. The result is written in
+the collapsed stack format read by flamegraph.pl and speedscope.
+"""
+
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from urllib.parse import parse_qs
+
+
+class ProfilerBusyError(Exception):
+    """
+    Raised when a profile is started while another one runs.
+    """
+    pass
+
+
+def frame_name(code, module):
+    """
+    Names a stack frame for the collapsed stack format.
+
+    :param code: The code object of the frame.
+    :type code: code
+    :param module: The module name of the frame.
+    :type module: str
+    :returns: IE: commissaire_http.handlers:JSONRPC_Handler.__call__
+    :rtype: str
+    """
+    name = getattr(code, 'co_qualname', code.co_name)
+    # ';' separates frames and ' ' the count in the output format
+    return '{}:{}'.format(module, name).replace(';', ':').replace(' ', '_')
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads handling requests for a set duration.
+
+    Outside of a profile the only cost to a request is one attribute
+    check.
+    """
+
+    #: Logger for SamplingProfiler
+    logger = logging.getLogger('SamplingProfiler')
+
+    def __init__(self, interval=0.005, output_dir=None):
+        """
+        Initializes a new SamplingProfiler instance.
+
+        :param interval: Seconds between stack samples.
+        :type interval: float
+        :param output_dir: Where profiles are written. Defaults to the
+                           temporary directory.
+        :type output_dir: str or None
+        """
+        self.interval = float(interval)
+        self.output_dir = output_dir or tempfile.gettempdir()
+        #: If a profile is running
+        self.active = False
+        #: Path of the running or last written profile
+        self.path = None
+        self.sample_rate = 1.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # thread ident -> route of the sampled requests in flight
+        self._threads = {}
+        self._names = {}
+
+    def begin_request(self, route):
+        """
+        Registers the calling thread's request if it is sampled.
+
+        :param route: The route template of the request.
+        :type route: str
+        :returns: True if the request is profiled and end_request must be
+                  called when it finishes.
+        :rtype: bool
+        """
+        if not self.active:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        self._threads[threading.get_ident()] = route
+        return True
+
+    def end_request(self):
+        """
+        Unregisters the calling thread's request.
+        """
+        self._threads.pop(threading.get_ident(), None)
+
+    def start(self, duration=30, sample_rate=1.0):
+        """
+        Starts profiling in a background thread.
+
+        :param duration: Seconds to profile for.
+        :type duration: float
+        :param sample_rate: Fraction of requests to profile.
+        :type sample_rate: float
+        :returns: The path the profile will be written to.
+        :rtype: str
+        :raises: ProfilerBusyError, OSError
+        """
+        with self._lock:
+            if self.active:
+                raise ProfilerBusyError(
+                    'A profile is already being written to {}'.format(
+                        self.path))
+            # Created here, with a unique name only the server may write,
+            # so nothing else can take the path first
+            fd, self.path = tempfile.mkstemp(
+                suffix='.collapsed', dir=self.output_dir,
+                prefix='commissaire-profile-{}-{}-'.format(
+                    os.getpid(), time.strftime('%Y%m%d%H%M%S')))
+            os.close(fd)
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            self._stop.clear()
+            self.active = True
+            self._thread = threading.Thread(
+                target=self._run, args=(float(duration), self.path),
+                name='SamplingProfiler', daemon=True)
+            self._thread.start()
+        self.logger.info(
+            'Profiling {:.0%} of requests for {}s into {}'.format(
+                self.sample_rate, duration, self.path))
+        return self.path
+
+    def stop(self, wait=True):
+        """
+        Ends the running profile early, writing what was collected.
+
+        :param wait: Wait until the profile is written.
+        :type wait: bool
+        """
+        self._stop.set()
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _collapse(self, route, frame):
+        """
+        Collapses a stack into a single line, outermost frame first.
+
+        :param route: The route template, used as the root frame.
+        :type route: str
+        :param frame: The innermost frame.
+        :type frame: frame
+        :rtype: str
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = frame_name(code, frame.f_globals.get('__name__', '?'))
+                self._names[code] = name
+            names.append(name)
+            frame = frame.f_back
+        names.append(route.replace(';', ':').replace(' ', '_'))
+        return ';'.join(reversed(names))
+
+    def _run(self, duration, path):
+        """
+        Samples stacks until the duration is up, then writes the profile.
+
+        :param duration: Seconds to profile for.
+        :type duration: float
+        :param path: Where to write the profile.
+        :type path: str
+        """
+        stacks = Counter()
+        deadline = time.monotonic() + duration
+        try:
+            while time.monotonic() < deadline:
+                if self._stop.wait(self.interval):
+                    break
+                frames = sys._current_frames()
+                for ident, route in list(self._threads.items()):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._collapse(route, frame)] += 1
+                del frames
+        finally:
+            self.active = False
+            self._threads.clear()
+            self._names.clear()
+            try:
+                self.write(stacks, path)
+            except OSError as error:
+                self.logger.error(
+                    'Unable to write profile {}: {}'.format(path, error))
+
+    def write(self, stacks, path):
+        """
+        Writes stack counts in the collapsed stack format.
+
+        :param stacks: Map of collapsed stacks to sample counts.
+        :type stacks: dict
+        :param path: Where to write the profile.
+        :type path: str
+        :raises: OSError
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            suffix='.tmp', dir=os.path.dirname(path),
+            prefix='.' + os.path.basename(path) + '-')
+        try:
+            with os.fdopen(fd, 'w') as output:
+                for stack, count in sorted(stacks.items()):
+                    output.write('{} {}\n'.format(stack, count))
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+        self.logger.info('Wrote {} samples of {} stacks to {}'.format(
+            sum(stacks.values()), len(stacks), path))
+
+
+#: Global profiler consulted by the Dispatcher
+PROFILER = SamplingProfiler()
+
+
+def install_signal_handler(profiler=PROFILER, signum=signal.SIGUSR2,
+                           duration=30, sample_rate=1.0):
+    """
+    Makes a signal start a profile, or end the running one early.
+
+    :param profiler: The profiler to control.
+    :type profiler: SamplingProfiler
+    :param signum: The signal to handle.
+    :type signum: int
+    :param duration: Seconds each profile runs for.
+    :type duration: float
+    :param sample_rate: Fraction of requests to profile.
+    :type sample_rate: float
+    """
+    def handler(signum, frame):
+        if profiler.active:
+            profiler.stop(wait=False)
+            return
+        # Raising here would unwind the main thread and stop the server
+        try:
+            profiler.start(duration, sample_rate)
+        except (OSError, ProfilerBusyError) as error:
+            profiler.logger.error(
+                'Unable to start profile: {}'.format(error))
+
+    signal.signal(signum, handler)
+
+
+def profiler_app(environ, start_response, profiler=PROFILER):
+    """
+    WSGI app for the admin listener controlling the profiler.
+
+    GET returns the profiler state. POST starts a profile, taking the
+    'seconds' and 'rate' query parameters. DELETE ends it early.
+
+    :param environ: WSGI environment instance.
+    :type environ: dict
+    :param start_response: WSGI start response callable.
+    :type start_response: callable
+    :param profiler: The profiler to control.
+    :type profiler: SamplingProfiler
+    :returns: The profiler state as JSON.
+    :rtype: list
+    """
+    method = environ.get('REQUEST_METHOD')
+    status = '200 OK'
+    if method == 'POST':
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            seconds = float(params.get('seconds', ['30'])[0])
+            rate = float(params.get('rate', ['1.0'])[0])
+            profiler.start(seconds, rate)
+            status = '202 Accepted'
+        except ValueError:
+            start_response('400 Bad Request', [('content-type', 'text/html')])
+            return [bytes('Bad Request', 'utf8')]
+        except ProfilerBusyError:
+            status = '409 Conflict'
+        except OSError as error:
+            profiler.logger.error(
+                'Unable to start profile: {}'.format(error))
+            start_response(
+                '500 Internal Server Error', [('content-type', 'text/html')])
+            return [bytes('Unable to start profile: {}'.format(
+                error.strerror or error), 'utf8')]
+    elif method == 'DELETE':
+        profiler.stop()
+    elif method != 'GET':
+        start_response(
+            '405 Method Not Allowed',
+            [('content-type', 'text/html'), ('Allow', 'GET, POST, DELETE')])
+        return [bytes('Method Not Allowed', 'utf8')]
+
+    start_response(status, [('content-type', 'application/json')])
+    return [bytes(json.dumps({
+        'active': profiler.active,
+        'path': profiler.path,
+        'sample_rate': profiler.sample_rate,
+    }), 'utf8')]
@@ -0,0 +1,268 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Support for running behind a TLS terminating reverse proxy.
+"""
+
+import hashlib
+import ipaddress
+import logging
+
+from commissaire_http.util import log
+from commissaire_http.util.cache import TTLCache
+
+#: Marks Unix socket peers, which have no address, in the proxy list
+UNIX_SOCKET = 'unix'
+
+#: Attribute names used by getpeercert() for RFC 2253 short names
+DN_ATTRIBUTES = {
+    'CN': 'commonName',
+    'O': 'organizationName',
+    'OU': 'organizationalUnitName',
+    'C': 'countryName',
+    'L': 'localityName',
+    'ST': 'stateOrProvinceName',
+    'DC': 'domainComponent',
+    'UID': 'userId',
+    'EMAILADDRESS': 'emailAddress',
+}
+
+
+def header_to_environ(header):
+    """
+    Returns the WSGI environ key of an HTTP header.
+
+    :param header: The header name (IE: X-Forwarded-For)
+    :type header: str
+    :returns: The environ key (IE: HTTP_X_FORWARDED_FOR)
+    :rtype: str
+    """
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+def _split_unescaped(value, separators):
+    """
+    Splits a string on separators not escaped with a backslash.
+
+    :param value: The string to split.
+    :type value: str
+    :param separators: Characters to split on.
+    :type separators: str
+    :returns: Tuples of (part, separator following it or '')
+    :rtype: list
+    """
+    parts = []
+    current = []
+    escaped = False
+    for char in value:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in separators:
+            parts.append((''.join(current), char))
+            current = []
+        else:
+            current.append(char)
+    parts.append((''.join(current), ''))
+    return parts
+
+
+def parse_dn(dn):
+    """
+    Parses an RFC 2253 distinguished name, as sent by proxies, into the
+    subject structure returned by SSLSocket.getpeercert().
+
+    Proxies send the most specific attribute first, getpeercert() lists
+    it last, so the order is reversed.
+
+    :param dn: The distinguished name (IE: CN=host,O=example)
+    :type dn: str
+    :returns: The subject as a tuple of RDNs of (name, value) tuples.
+    :rtype: tuple
+    :raises: ValueError
+    """
+    rdns = []
+    rdn = []
+    for part, separator in _split_unescaped(dn, ',+'):
+        name, sep, value = part.partition('=')
+        if not sep:
+            raise ValueError('Invalid distinguished name: {0}'.format(dn))
+        name = name.strip()
+        rdn.append((DN_ATTRIBUTES.get(name.upper(), name), value.strip()))
+        # '+' joins attributes of a multi-valued RDN
+        if separator != '+':
+            rdns.append(tuple(rdn))
+            rdn = []
+    return tuple(reversed(rdns))
+
+
+class TrustedProxies:
+    """
+    WSGI middleware which trusts client address and client certificate
+    headers sent by configured proxies.
+
+    For requests from a trusted proxy REMOTE_ADDR is taken from the
+    forwarded-for header and SSL_CLIENT_VERIFY / SSL_CLIENT_FINGERPRINT
+    are filled from the client certificate headers, as if the TLS
+    connection had been terminated in process. The headers are removed
+    from requests of anyone else so they can never be spoofed.
+    """
+
+    #: Logger for TrustedProxies
+    logger = logging.getLogger('TrustedProxies')
+
+    def __init__(self, app, proxies=('127.0.0.1', '::1'),
+                 forwarded_for_header='X-Forwarded-For',
+                 verify_header='X-SSL-Client-Verify',
+                 dn_header='X-SSL-Client-S-DN',
+                 fingerprint_header='X-SSL-Client-Fingerprint'):
+        """
+        Initializes a new TrustedProxies instance.
+
+        :param app: The WSGI app to wrap.
+        :type app: callable
+        :param proxies: Trusted proxy addresses or networks. 'unix' trusts
+                        peers on a Unix socket.
+        :type proxies: list
+        :param forwarded_for_header: Header with the client address chain.
+        :type forwarded_for_header: str
+        :param verify_header: Header which is SUCCESS for a verified client
+                              certificate.
+        :type verify_header: str
+        :param dn_header: Header with the RFC 2253 certificate subject.
+        :type dn_header: str
+        :param fingerprint_header: Header with the certificate fingerprint.
+        :type fingerprint_header: str
+        :raises: ValueError
+        """
+        self._app = app
+        self.trust_unix = UNIX_SOCKET in proxies
+        self.networks = tuple(
+            ipaddress.ip_network(proxy, strict=False)
+            for proxy in proxies if proxy != UNIX_SOCKET)
+        self._forwarded_for = header_to_environ(forwarded_for_header)
+        self._verify = header_to_environ(verify_header)
+        self._dn = header_to_environ(dn_header)
+        self._fingerprint = header_to_environ(fingerprint_header)
+        self._headers = (
+            self._forwarded_for, self._verify, self._dn, self._fingerprint)
+        self._trusted = TTLCache(maxsize=1024, ttl=3600)
+        self._subjects = TTLCache(maxsize=1024, ttl=3600)
+
+    def is_trusted(self, address):
+        """
+        Checks if an address belongs to a trusted proxy.
+
+        :param address: The peer address. Empty for Unix sockets.
+        :type address: str
+        :rtype: bool
+        """
+        if not address:
+            return self.trust_unix
+        trusted = self._trusted.get(address)
+        if trusted is None:
+            try:
+                ip = ipaddress.ip_address(address)
+            except ValueError:
+                return False
+            trusted = any(ip in network for network in self.networks)
+            self._trusted.set(address, trusted)
+        return trusted
+
+    def get_client_address(self, forwarded_for, default):
+        """
+        Returns the client address from a forwarded-for chain: the last
+        address which is not a trusted proxy.
+
+        :param forwarded_for: The comma separated address chain.
+        :type forwarded_for: str
+        :param default: Address returned when no client is found.
+        :type default: str
+        :rtype: str
+        """
+        client = default
+        for address in reversed(forwarded_for.split(',')):
+            address = address.strip()
+            try:
+                ipaddress.ip_address(address)
+            except ValueError:
+                break
+            client = address
+            if not self.is_trusted(address):
+                break
+        return client
+
+    def _get_subject(self, dn):
+        """
+        Returns the parsed subject of a distinguished name.
+
+        :param dn: The distinguished name.
+        :type dn: str
+        :returns: The certificate or None if it can not be parsed.
+        :rtype: dict or None
+        """
+        cert = self._subjects.get(dn)
+        if cert is None:
+            try:
+                cert = {'subject': parse_dn(dn)}
+            except ValueError as error:
+                self.logger.warn(
+                    'Ignoring client certificate: {0}'.format(error))
+                return None
+            self._subjects.set(dn, cert)
+        return cert
+
+    def __call__(self, environ, start_response):
+        """
+        Applies trusted headers and passes the request to the wrapped app.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: Response back to requestor.
+        :rtype: list
+        """
+        peer = environ.get('REMOTE_ADDR', '')
+        if not self.is_trusted(peer):
+            for key in self._headers:
+                if environ.pop(key, None) is not None:
+                    log.debug(
+                        self.logger, 'Dropped {0} from untrusted {1}.',
+                        key, peer)
+            return self._app(environ, start_response)
+
+        forwarded_for = environ.get(self._forwarded_for)
+        if forwarded_for:
+            environ['REMOTE_ADDR'] = self.get_client_address(
+                forwarded_for, peer)
+
+        cert = fingerprint = None
+        dn = environ.get(self._dn)
+        if environ.get(self._verify, '').upper() == 'SUCCESS' and dn:
+            cert = self._get_subject(dn)
+        if cert is not None:
+            fingerprint = environ.get(self._fingerprint)
+            if fingerprint:
+                fingerprint = fingerprint.replace(':', '').lower()
+            else:
+                # Decisions only depend on the subject so it can stand in
+                fingerprint = 'dn-' + hashlib.sha256(
+                    dn.encode('utf-8')).hexdigest()
+        environ['SSL_CLIENT_VERIFY'] = cert
+        environ['SSL_CLIENT_FINGERPRINT'] = fingerprint
+        return self._app(environ, start_response)
@@ -0,0 +1,314 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Replays a traffic capture against a server.
+
+Requests are sent at their captured offsets, divided by a speed up
+factor, by a pool of client threads. Latency is measured from when a
+request was due, so a server falling behind shows in the results instead
+of slowing the replay down.
+
+Captures hold no bodies or credentials. Requests which had a body get a
+JSON body of the same size and credentials are given with --header.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import queue
+import ssl
+import threading
+import time
+
+from collections import Counter
+from urllib.parse import urlsplit
+
+from commissaire_http.util.capture import read_capture
+
+
+def make_body(size):
+    """
+    Creates a JSON body of a given size.
+
+    :param size: Bytes in the body.
+    :type size: int
+    :returns: The body or None for no body.
+    :rtype: bytes or None
+    """
+    if size <= 0:
+        return None
+    padding = max(size - len('{"_":""}'), 0)
+    return bytes('{"_":"' + 'x' * padding + '"}', 'utf8')
+
+
+def schedule(requests, speed=1.0):
+    """
+    Computes when each request is due, relative to the start of the
+    replay.
+
+    :param requests: The captured requests, in order of their start.
+    :type requests: list
+    :param speed: Speed up factor. 0 sends everything at once.
+    :type speed: float
+    :returns: Tuples of (offset in seconds, request)
+    :rtype: list
+    """
+    if not requests:
+        return []
+    first = requests[0]['t']
+    return [
+        ((request['t'] - first) / speed if speed > 0 else 0.0, request)
+        for request in requests]
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest rank percentile of sorted values.
+
+    :param values: The sorted values.
+    :type values: list
+    :param fraction: The percentile as a fraction (IE: 0.99).
+    :type fraction: float
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values), max(
+        1, int(math.ceil(fraction * len(values))))) - 1]
+
+
+class Replayer:
+    """
+    Sends scheduled requests from a pool of client threads over
+    keep-alive connections.
+    """
+
+    def __init__(self, url, concurrency=8, headers=None, timeout=60,
+                 clock=time.monotonic):
+        """
+        Initializes a new Replayer instance.
+
+        :param url: Base url of the server (IE: http://127.0.0.1:8000).
+        :type url: str
+        :param concurrency: Number of client threads.
+        :type concurrency: int
+        :param headers: Headers sent with every request.
+        :type headers: dict or None
+        :param timeout: Seconds to wait for a response.
+        :type timeout: float
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        :raises: ValueError
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported url {}'.format(url))
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.concurrency = int(concurrency)
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self._clock = clock
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        #: Results as tuples of (status or 'error', latency, lag)
+        self.results = []
+
+    def connect(self):
+        """
+        Creates a connection to the server.
+
+        :rtype: http.client.HTTPConnection
+        """
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout,
+                context=ssl.create_default_context())
+        return http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout)
+
+    def send(self, connection, request):
+        """
+        Sends a request and reads the response.
+
+        :param connection: The connection to use.
+        :type connection: http.client.HTTPConnection
+        :param request: The captured request.
+        :type request: dict
+        :returns: The status or 'error'.
+        :rtype: int or str
+        """
+        path = self.prefix + request['p']
+        if request.get('q'):
+            path += '?' + request['q']
+        headers = dict(self.headers)
+        body = make_body(request.get('b', 0))
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(request['m'], path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return 'error'
+
+    def _work(self):
+        """
+        Sends requests from the queue until told to stop.
+        """
+        connection = self.connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            due, request = item
+            sent = self._clock()
+            status = self.send(connection, request)
+            finished = self._clock()
+            with self._lock:
+                self.results.append((status, finished - due, sent - due))
+        connection.close()
+
+    def replay(self, scheduled):
+        """
+        Replays scheduled requests and waits for them to finish.
+
+        :param scheduled: Tuples of (offset in seconds, request)
+        :type scheduled: list
+        :returns: Seconds the replay took.
+        :rtype: float
+        """
+        workers = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        started = self._clock()
+        for offset, request in scheduled:
+            due = started + offset
+            delay = due - self._clock()
+            if delay > 0:
+                time.sleep(delay)
+            self._queue.put((due, request))
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        return self._clock() - started
+
+    def summary(self, elapsed):
+        """
+        Summarizes the results.
+
+        :param elapsed: Seconds the replay took.
+        :type elapsed: float
+        :rtype: dict
+        """
+        statuses = Counter(str(status) for status, _, _ in self.results)
+        latencies = sorted(latency for _, latency, _ in self.results)
+        lags = sorted(lag for _, _, lag in self.results)
+        return {
+            'requests': len(self.results),
+            'errors': statuses.get('error', 0),
+            'statuses': dict(statuses),
+            'elapsed': elapsed,
+            'requests_per_second': (
+                len(self.results) / elapsed if elapsed > 0 else 0.0),
+            'latency_ms': {
+                'p50': percentile(latencies, 0.5) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'p999': percentile(latencies, 0.999) * 1000,
+                'max': (latencies[-1] if latencies else 0.0) * 1000,
+            },
+            'lag_ms': {
+                'p50': percentile(lags, 0.5) * 1000,
+                'p99': percentile(lags, 0.99) * 1000,
+                'max': (lags[-1] if lags else 0.0) * 1000,
+            },
+        }
+
+
+def parse_header(value):
+    """
+    Parses a header from the command line.
+
+    :param value: IE: 'Authorization: Basic dXNlcjpwYXNz'
+    :type value: str
+    :returns: Tuple of (name, value)
+    :rtype: tuple
+    :raises: argparse.ArgumentTypeError
+    """
+    name, sep, header_value = value.partition(':')
+    if not sep or not name.strip():
+        raise argparse.ArgumentTypeError(
+            'Expected NAME: VALUE, got {}'.format(value))
+    return name.strip(), header_value.strip()
+
+
+def main():
+    """
+    Main entry point.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog='Example: commissaire-http-replay capture.jsonl '
+               '--url http://127.0.0.1:8000 --speed 2')
+    parser.add_argument('capture', help='The capture file to replay')
+    parser.add_argument(
+        '--url', default='http://127.0.0.1:8000',
+        help='Base url of the server')
+    parser.add_argument(
+        '--speed', type=float, default=1.0,
+        help='Speed up factor of the captured rate. 0 sends as fast as '
+             'the clients can')
+    parser.add_argument(
+        '--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument(
+        '--header', action='append', type=parse_header, default=[],
+        metavar='NAME: VALUE',
+        help='Header sent with every request, IE: credentials')
+    parser.add_argument(
+        '--limit', type=int, help='Replay only the first requests')
+    parser.add_argument(
+        '--timeout', type=float, default=60.0,
+        help='Seconds to wait for a response')
+    args = parser.parse_args()
+
+    try:
+        replayer = Replayer(
+            args.url, args.concurrency, dict(args.header), args.timeout)
+        requests = read_capture(args.capture)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    if args.limit is not None:
+        requests = requests[:args.limit]
+
+    elapsed = replayer.replay(schedule(requests, args.speed))
+    results = replayer.summary(elapsed)
+    results.update({
+        'capture': args.capture,
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+    })
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,55 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+systemd integration.
+"""
+
+import os
+import socket
+
+#: First file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+
+def listen_sockets(unset_environment=True):
+    """
+    Returns the sockets passed in by systemd socket activation, like
+    sd_listen_fds(3).
+
+    :param unset_environment: Remove the LISTEN_* variables so child
+                              processes do not pick the sockets up.
+    :type unset_environment: bool
+    :returns: The passed sockets in order. Empty if there are none.
+    :rtype: list
+    """
+    try:
+        pid = int(os.environ.get('LISTEN_PID', ''))
+        count = int(os.environ.get('LISTEN_FDS', ''))
+    except ValueError:
+        return []
+    finally:
+        if unset_environment:
+            for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+                os.environ.pop(name, None)
+
+    # The sockets were meant for another process
+    if pid != os.getpid():
+        return []
+
+    sockets = []
+    for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    return sockets
@@ -0,0 +1,267 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Per request timing of the phases of request handling.
+
+The ServerTiming middleware makes a RequestTimer current for the thread
+handling a request. Code on the request path records phases with
+timed(), which does nothing when no timer is current.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from commissaire_http.util.proxy import header_to_environ
+
+#: Phases in the order they are reported
+PHASES = ('auth', 'route', 'params', 'bus', 'handler', 'encode')
+
+#: WSGI environment key holding the RequestTimer of a request
+ENVIRON_KEY = 'commissaire.timing'
+
+#: Request header asking for a Server-Timing response header
+DEBUG_HEADER = 'X-Commissaire-Timing'
+
+
+class _TimerState(threading.local):
+    """
+    Per thread state holding the timer of the current request.
+    """
+    #: The RequestTimer of the request being handled
+    timer = None
+
+
+_local = _TimerState()
+
+
+class RequestTimer:
+    """
+    Accumulates the time spent in each phase of a single request.
+    """
+
+    __slots__ = ('started', 'durations', 'counts', '_clock')
+
+    def __init__(self, clock=time.perf_counter):
+        """
+        Initializes a new RequestTimer instance.
+
+        :param clock: Callable returning the current time in seconds.
+        :type clock: callable
+        """
+        self._clock = clock
+        self.started = clock()
+        #: Seconds spent per phase
+        self.durations = {}
+        #: Times each phase was entered
+        self.counts = {}
+
+    def add(self, phase, seconds):
+        """
+        Records time spent in a phase.
+
+        :param phase: The phase name.
+        :type phase: str
+        :param seconds: Seconds spent.
+        :type seconds: float
+        """
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def elapsed(self):
+        """
+        Seconds since the request started.
+
+        :rtype: float
+        """
+        return self._clock() - self.started
+
+    def _phases(self):
+        """
+        Yields the recorded phases in report order.
+
+        :returns: Tuples of (phase, seconds, count)
+        :rtype: generator
+        """
+        # Copied first as the watchdog reports on requests still running
+        durations = dict(self.durations)
+        counts = dict(self.counts)
+        for phase in PHASES:
+            if phase in durations:
+                yield phase, durations[phase], counts.get(phase, 0)
+        for phase in sorted(set(durations).difference(PHASES)):
+            yield phase, durations[phase], counts.get(phase, 0)
+
+    def header(self):
+        """
+        Formats the phases as a Server-Timing header value. The bus phase
+        carries the number of calls made. Durations are in milliseconds.
+
+        :rtype: str
+        """
+        metrics = []
+        for phase, seconds, count in self._phases():
+            metric = '{};dur={:.3f}'.format(phase, seconds * 1000)
+            if phase == 'bus':
+                metric += ';desc="{} calls"'.format(count)
+            metrics.append(metric)
+        metrics.append('total;dur={:.3f}'.format(self.elapsed() * 1000))
+        return ', '.join(metrics)
+
+    def summary(self):
+        """
+        Formats the phases for a log message.
+
+        :rtype: str
+        """
+        parts = []
+        for phase, seconds, count in self._phases():
+            part = '{}={:.1f}ms'.format(phase, seconds * 1000)
+            if phase == 'bus':
+                part += '/{}'.format(count)
+            parts.append(part)
+        return ' '.join(parts)
+
+
+def current():
+    """
+    Returns the timer of the request handled by this thread.
+
+    :returns: The timer or None outside of a timed request.
+    :rtype: RequestTimer or None
+    """
+    return _local.timer
+
+
+def set_current(timer):
+    """
+    Sets the timer of the request handled by this thread.
+
+    :param timer: The timer or None.
+    :type timer: RequestTimer or None
+    """
+    _local.timer = timer
+
+
+class timed:
+    """
+    Context manager adding the time spent in its block to a phase of the
+    current request.
+    """
+
+    __slots__ = ('phase', '_timer', '_started')
+
+    def __init__(self, phase):
+        """
+        Initializes a new timed instance.
+
+        :param phase: The phase name.
+        :type phase: str
+        """
+        self.phase = phase
+        self._timer = None
+
+    def __enter__(self):  # noqa
+        self._timer = _local.timer
+        if self._timer is not None:
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):  # noqa
+        if self._timer is not None:
+            self._timer.add(self.phase, time.perf_counter() - self._started)
+        return False
+
+
+class ServerTiming:
+    """
+    WSGI middleware, placed outermost, which times every request.
+
+    A Server-Timing header with the phase breakdown is added when the
+    request carries the debug header and the header is enabled, or for a
+    sampled fraction of requests. The watchdog logs slow requests with
+    the same breakdown.
+    """
+
+    #: Logger for ServerTiming
+    logger = logging.getLogger('ServerTiming')
+
+    def __init__(self, app, debug_header=False, sample_rate=0.0):
+        """
+        Initializes a new ServerTiming instance.
+
+        :param app: The WSGI app to wrap.
+        :type app: callable
+        :param debug_header: If requests may ask for the Server-Timing
+                             header with X-Commissaire-Timing.
+        :type debug_header: bool
+        :param sample_rate: Fraction of requests given the header.
+        :type sample_rate: float
+        """
+        self._app = app
+        self.debug_header = debug_header
+        self.sample_rate = float(sample_rate or 0)
+        self._debug_key = header_to_environ(DEBUG_HEADER)
+
+    def wants_header(self, environ):
+        """
+        Checks if a request gets a Server-Timing header.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :rtype: bool
+        """
+        if self.debug_header and environ.get(self._debug_key):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        """
+        Times the request and passes it to the wrapped app.
+
+        :param environ: WSGI environment instance.
+        :type environ: dict
+        :param start_response: WSGI start response callable.
+        :type start_response: callable
+        :returns: Response back to requestor.
+        :rtype: list
+        """
+        timer = RequestTimer()
+        environ[ENVIRON_KEY] = timer
+        set_current(timer)
+
+        if not self.wants_header(environ):
+            try:
+                return self._app(environ, start_response)
+            finally:
+                set_current(None)
+
+        # Hold the response start until the body is encoded so the
+        # header covers every phase
+        deferred = []
+
+        def timing_start_response(status, headers, *exc_info):
+            deferred[:] = [status, list(headers)] + list(exc_info)
+
+        try:
+            result = self._app(environ, timing_start_response)
+        finally:
+            set_current(None)
+
+        if deferred:
+            deferred[1].append(('Server-Timing', timer.header()))
+            start_response(*deferred)
+        return result
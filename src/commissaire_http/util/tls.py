@@ -0,0 +1,73 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Client certificate utilities.
+"""
+
+import hashlib
+
+from commissaire_http.util.cache import TTLCache
+
+#: Parsed peer certificates keyed by fingerprint
+PEER_CERTS = TTLCache(maxsize=1024, ttl=3600)
+
+
+def get_common_names(cert):
+    """
+    Returns the commonName values of a certificate subject.
+
+    :param cert: A certificate as returned by SSLSocket.getpeercert().
+    :type cert: dict
+    :returns: The common names in subject order.
+    :rtype: tuple
+    """
+    names = []
+    for rdn in cert.get('subject', ()):
+        for key, value in rdn:
+            if key == 'commonName':
+                names.append(value)
+    return tuple(names)
+
+
+def get_peer_identity(sock, cache=PEER_CERTS):
+    """
+    Returns the client certificate of a socket and its fingerprint.
+    Certificates are parsed once and then looked up by the SHA-256
+    fingerprint of their DER encoding.
+
+    The returned certificate is shared and must not be modified.
+
+    :param sock: The connected socket.
+    :type sock: ssl.SSLSocket or socket.socket
+    :param cache: Where parsed certificates are kept.
+    :type cache: commissaire_http.util.cache.TTLCache
+    :returns: Tuple of (certificate, hex fingerprint), (None, None) if
+              there is no client certificate.
+    :rtype: tuple
+    """
+    try:
+        der = sock.getpeercert(binary_form=True)
+    except (AttributeError, ValueError):
+        # Not a TLS socket or the handshake has not completed
+        return None, None
+    if not der:
+        return None, None
+
+    fingerprint = hashlib.sha256(der).hexdigest()
+    cert = cache.get(fingerprint)
+    if cert is None:
+        cert = sock.getpeercert()
+        cache.set(fingerprint, cert)
+    return cert, fingerprint
@@ -0,0 +1,267 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Watchdog reporting requests which run for too long.
+
+The Dispatcher registers every request with the watchdog. A background
+thread looks for requests running past a threshold and logs, while they
+still run, the stack of the thread handling them along with the bus
+requests made so far and the phase timings. Slow requests are logged
+again with their phase timings once they finish. All reports share one
+rate limit.
+"""
+
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from commissaire_http.bus import accounting
+from commissaire_http.util import log, timing
+from commissaire_http.util.metrics import REGISTRY
+
+#: Requests which ran past the slow request threshold
+SLOW_REQUESTS = REGISTRY.counter(
+    'commissaire_slow_requests_total',
+    'Requests which ran past the slow request threshold.', ('route',))
+
+
+class _WatchedRequest:
+    """
+    A request in flight.
+    """
+
+    __slots__ = ('environ', 'route', 'started', 'reported')
+
+    def __init__(self, environ, route):
+        """
+        Initializes a new _WatchedRequest instance.
+
+        :param environ: WSGI environment of the request.
+        :type environ: dict
+        :param route: The route template of the request.
+        :type route: str
+        """
+        self.environ = environ
+        self.route = route
+        self.started = time.monotonic()
+        self.reported = False
+
+
+class RequestWatchdog:
+    """
+    Reports requests running longer than a threshold to the SlowRequests
+    logger while they run and when they finish, at most max_reports
+    times per period.
+    """
+
+    #: Logger for the slow request reports
+    logger = logging.getLogger('SlowRequests')
+
+    def __init__(self, threshold=None, interval=None, max_reports=10,
+                 period=60):
+        """
+        Initializes a new RequestWatchdog instance.
+
+        :param threshold: Seconds after which a request is reported.
+        :type threshold: float or None
+        :param interval: Seconds between checks. Defaults to a quarter
+                         of the threshold, capped to 1 second.
+        :type interval: float or None
+        :param max_reports: Reports written per period.
+        :type max_reports: int
+        :param period: Seconds over which max_reports applies.
+        :type period: float
+        """
+        self.threshold = threshold
+        self.interval = interval
+        #: Rate limit of the reports
+        self.reports = log.LogLimiter(
+            self.logger, max_reports, period, 'slow request reports')
+        #: If the watchdog thread runs
+        self.running = False
+        self._requests = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def begin_request(self, environ, route):
+        """
+        Registers the calling thread's request.
+
+        :param environ: WSGI environment of the request.
+        :type environ: dict
+        :param route: The route template of the request.
+        :type route: str
+        :returns: True if end_request must be called when it finishes.
+        :rtype: bool
+        """
+        if not self.running:
+            return False
+        self._requests[threading.get_ident()] = _WatchedRequest(
+            environ, route)
+        return True
+
+    def end_request(self, status=None):
+        """
+        Unregisters the calling thread's request, reporting it if it took
+        longer than the threshold.
+
+        :param status: The response status code of the request.
+        :type status: str or None
+        """
+        request = self._requests.pop(threading.get_ident(), None)
+        if request is None:
+            return
+        timer = request.environ.get(timing.ENVIRON_KEY)
+        if timer is not None:
+            elapsed = timer.elapsed()
+        else:
+            elapsed = time.monotonic() - request.started
+        if elapsed < self.threshold:
+            return
+        if not request.reported:
+            request.reported = True
+            SLOW_REQUESTS.labels(request.route).inc()
+        if not self.reports.allow():
+            return
+        message = 'Slow request {} {} {} took {:.1f}ms'.format(
+            request.environ.get('REQUEST_METHOD'),
+            request.environ.get('PATH_INFO'), status or '-',
+            elapsed * 1000)
+        if timer is not None:
+            message += ': ' + timer.summary()
+        self.logger.warn(message)
+
+    def start(self, threshold=None, max_reports=None):
+        """
+        Starts the watchdog thread.
+
+        :param threshold: Seconds after which a request is reported.
+        :type threshold: float or None
+        :param max_reports: Reports written per period.
+        :type max_reports: int or None
+        """
+        if threshold is not None:
+            self.threshold = float(threshold)
+        if max_reports is not None:
+            self.reports.max_messages = int(max_reports)
+        if self.threshold is None:
+            raise ValueError('The watchdog needs a threshold')
+        if self.interval is None:
+            self.interval = min(self.threshold / 4, 1.0)
+        self._stop.clear()
+        self.running = True
+        self._thread = threading.Thread(
+            target=self._run, name='RequestWatchdog', daemon=True)
+        self._thread.start()
+        self.logger.info(
+            'Reporting requests running longer than {}s'.format(
+                self.threshold))
+
+    def stop(self):
+        """
+        Stops the watchdog thread.
+        """
+        self.running = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._requests.clear()
+
+    def _run(self):
+        """
+        Checks for slow requests until stopped.
+        """
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as error:  # pragma: no cover
+                self.logger.error(
+                    'Slow request check failed: {}: {}'.format(
+                        type(error), error))
+
+    def check(self):
+        """
+        Reports requests which ran past the threshold and were not yet
+        reported.
+
+        :returns: Number of reports written.
+        :rtype: int
+        """
+        now = time.monotonic()
+        cutoff = now - self.threshold
+        slow = [
+            (ident, request) for ident, request in list(
+                self._requests.items())
+            if not request.reported and request.started <= cutoff]
+        if not slow:
+            return 0
+
+        frames = sys._current_frames()
+        written = 0
+        for ident, request in slow:
+            request.reported = True
+            SLOW_REQUESTS.labels(request.route).inc()
+            if not self.reports.allow():
+                continue
+            self.logger.warn(
+                self.format_report(request, frames.get(ident), now))
+            written += 1
+        del frames
+        return written
+
+    def format_report(self, request, frame, now):
+        """
+        Formats the report of a slow request.
+
+        :param request: The slow request.
+        :type request: _WatchedRequest
+        :param frame: The current frame of the thread handling it.
+        :type frame: frame or None
+        :param now: The current time.
+        :type now: float
+        :rtype: str
+        """
+        environ = request.environ
+        lines = ['Request {} {} ({}) running for {:.1f}s'.format(
+            environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'),
+            request.route, now - request.started)]
+
+        account = environ.get(accounting.ENVIRON_KEY)
+        if account is not None:
+            lines.append('Bus requests: {}'.format(account.summary()))
+            for call in list(account.calls):
+                if call.duration is None:
+                    lines.append('  {} in flight for {:.1f}ms'.format(
+                        call.routing_key, (now - call.started) * 1000))
+                else:
+                    lines.append('  {} took {:.1f}ms'.format(
+                        call.routing_key, call.duration * 1000))
+
+        timer = environ.get(timing.ENVIRON_KEY)
+        if timer is not None:
+            lines.append('Phases so far: {}'.format(timer.summary()))
+
+        if frame is not None:
+            lines.append('Stack:')
+            lines.extend(
+                line.rstrip('\n') for line in traceback.format_stack(frame))
+        return '\n'.join(lines)
+
+
+#: Global watchdog consulted by the Dispatcher
+WATCHDOG = RequestWatchdog()
@@ -0,0 +1,131 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.authentication.keystoneclient module.
+"""
+
+import requests
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.authentication import keystoneclient
+from commissaire_http.authentication import keystonetokenauth
+from commissaire_http.util.circuitbreaker import CircuitOpenError
+
+
+def create_response(status_code):
+    """
+    Creates a Keystone response with a status code.
+
+    :param status_code: The HTTP status code.
+    :type status_code: int
+    :returns: The response.
+    :rtype: requests.Response
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class TestKeystoneClient(TestCase):
+    """
+    Tests for the KeystoneClient class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class before each run.
+        """
+        self.url = 'https://{}.example.com/v3/auth/tokens'.format(self.id())
+        self.client = keystoneclient.KeystoneClient(
+            self.url, 'test', connect_timeout=1, read_timeout=2,
+            failure_threshold=2)
+
+    def test_session_is_shared(self):
+        """
+        Verify all clients use one pooled session.
+        """
+        self.assertIs(
+            keystoneclient.get_session(), keystoneclient.get_session())
+
+    def test_post_uses_timeouts(self):
+        """
+        Verify requests are sent with the configured timeouts.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = create_response(201)
+            self.assertIs(_post.return_value, self.client.post({}))
+            self.assertEquals((1.0, 2.0), _post.call_args[1]['timeout'])
+
+    def test_post_with_server_error(self):
+        """
+        Verify server errors raise instead of looking like rejections.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = create_response(503)
+            self.assertRaises(
+                requests.exceptions.HTTPError, self.client.post, {})
+            _post.return_value = create_response(401)
+            self.assertEquals(401, self.client.post({}).status_code)
+
+    def test_post_fails_fast_when_keystone_is_down(self):
+        """
+        Verify the circuit opens after repeated connection failures.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.side_effect = requests.exceptions.ConnectTimeout
+            for _ in range(2):
+                self.assertRaises(
+                    requests.exceptions.Timeout, self.client.post, {})
+            self.assertRaises(CircuitOpenError, self.client.post, {})
+            self.assertEquals(2, _post.call_count)
+
+    def test_post_resolves_trial_on_unexpected_error(self):
+        """
+        Verify an unexpected error during the half open trial does not
+        keep the circuit from closing.
+        """
+        now = [0]
+        self.client.breaker._clock = lambda: now[0]
+        with mock.patch('requests.Session.post') as _post:
+            _post.side_effect = requests.exceptions.ConnectTimeout
+            for _ in range(2):
+                self.assertRaises(
+                    requests.exceptions.Timeout, self.client.post, {})
+            now[0] += 60
+            _post.side_effect = ValueError
+            self.assertRaises(ValueError, self.client.post, {})
+            now[0] += 60
+            _post.side_effect = None
+            _post.return_value = create_response(201)
+            self.assertEquals(201, self.client.post({}).status_code)
+            self.assertEquals('closed', self.client.breaker.state)
+
+    def test_breaker_is_shared_by_url(self):
+        """
+        Verify plugins using the same endpoint share a circuit breaker.
+        """
+        token_auth = keystonetokenauth.KeystoneToken(None, self.url)
+        self.assertIs(self.client.breaker, token_auth.client.breaker)
+        with mock.patch('requests.Session.post') as _post:
+            _post.side_effect = requests.exceptions.ConnectionError
+            for _ in range(2):
+                self.assertRaises(
+                    requests.exceptions.ConnectionError, self.client.post, {})
+            self.assertFalse(token_auth.authenticate(
+                {'HTTP_X_AUTH_TOKEN': 'token'}, mock.MagicMock()))
+            self.assertEquals(2, _post.call_count)
@@ -104,7 +104,7 @@ class Test_AuthenticationManager(TestCase):
         Verify AuthenticationManager handles the simple forbidden case with multiple authenticators.
         """
         start_response = mock.MagicMock()
-        self.authentication_manager.authenticators.append(self.authenticator)
+        self.authentication_manager.add_authenticator(self.authenticator)
         result = self.authentication_manager(create_environ(), start_response)
         self.assertEquals([bytes('Forbidden', 'utf8')], result)
         start_response.assert_called_once_with('403 Forbidden', mock.ANY)
@@ -160,3 +160,94 @@ class Test_AuthenticationManager(TestCase):
         result = self.authentication_manager(create_environ(), start_response)
         self.assertEquals(expected_result, result)
         start_response.assert_called_once_with('200 OK', mock.ANY)
+
+    def test_authentication_manager_routes_by_credentials(self):
+        """
+        Verify AuthenticationManager only tries authenticators for the credentials given.
+        """
+        start_response = mock.MagicMock()
+        basic = mock.MagicMock(
+            credentials=(authentication.CREDENTIAL_BASIC,),
+            authenticate=mock.MagicMock(return_value=False))
+        token = mock.MagicMock(
+            credentials=(authentication.CREDENTIAL_TOKEN,),
+            authenticate=mock.MagicMock(return_value=True))
+        self.authentication_manager.authenticators = [
+            basic, token, self.authenticator]
+
+        environ = create_environ(headers={'HTTP_X_AUTH_TOKEN': 'token'})
+        result = self.authentication_manager(environ, start_response)
+        self.assertEquals(DUMMY_WSGI_BODY, result)
+        self.assertFalse(basic.authenticate.called)
+        token.authenticate.assert_called_once_with(environ, mock.ANY)
+
+        # Without credentials only undeclared authenticators are tried
+        self.assertEquals(
+            (self.authenticator, ),
+            self.authentication_manager.get_authenticators(create_environ()))
+
+    def test_authentication_manager_table_follows_authenticators(self):
+        """
+        Verify AuthenticationManager rebuilds its table when authenticators change.
+        """
+        environ = create_environ(headers={'HTTP_AUTHORIZATION': 'Basic YTph'})
+        self.assertEquals(
+            (self.authenticator, ),
+            self.authentication_manager.get_authenticators(environ))
+        basic = mock.MagicMock(credentials=(authentication.CREDENTIAL_BASIC,))
+        self.authentication_manager.authenticators = [
+            basic, self.authenticator]
+        self.assertEquals(
+            (basic, self.authenticator),
+            self.authentication_manager.get_authenticators(environ))
+        self.authentication_manager.add_authenticator(basic)
+        self.assertEquals(
+            (basic, self.authenticator, basic),
+            self.authentication_manager.get_authenticators(environ))
+        self.authentication_manager.authenticators = [self.authenticator]
+        self.assertEquals(
+            (self.authenticator, ),
+            self.authentication_manager.get_authenticators(environ))
+
+    def test_authentication_manager_table_built_once(self):
+        """
+        Verify AuthenticationManager does not rebuild its table per request.
+        """
+        with mock.patch.object(
+                self.authentication_manager, '_build_table') as _build_table:
+            for _ in range(3):
+                self.authentication_manager(
+                    create_environ(), mock.MagicMock())
+            self.assertEquals(0, _build_table.call_count)
+            self.authentication_manager.add_authenticator(
+                self.authenticator)
+            self.assertEquals(1, _build_table.call_count)
+
+
+class TestGetCredentials(TestCase):
+    """
+    Tests for the get_credentials function.
+    """
+
+    def test_get_credentials(self):
+        """
+        Verify credential types are detected in the environment.
+        """
+        self.assertEquals(
+            frozenset(), authentication.get_credentials(create_environ()))
+        self.assertEquals(
+            frozenset((
+                authentication.CREDENTIAL_BASIC,
+                authentication.CREDENTIAL_TOKEN,
+                authentication.CREDENTIAL_CLIENT_CERT)),
+            authentication.get_credentials(create_environ(headers={
+                'HTTP_AUTHORIZATION': 'basic YTph',
+                'HTTP_X_AUTH_TOKEN': 'token',
+                'SSL_CLIENT_VERIFY': {'subject': ()}})))
+        self.assertEquals(
+            frozenset((authentication.CREDENTIAL_SESSION, )),
+            authentication.get_credentials(create_environ(
+                headers={'HTTP_AUTHORIZATION': 'Bearer abc'})))
+        self.assertEquals(
+            frozenset(), authentication.get_credentials(create_environ(
+                headers={'HTTP_AUTHORIZATION': 'Negotiate abc'})))
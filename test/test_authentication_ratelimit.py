@@ -0,0 +1,181 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.authentication.ratelimit module.
+"""
+
+from unittest import mock
+
+from . import TestCase, create_environ
+
+from commissaire_http.authentication import AUTHENTICATED_KEY, ratelimit
+
+
+def create_app(status):
+    """
+    Creates a WSGI app responding with a status.
+    """
+    app = mock.MagicMock(return_value=[b'body'])
+
+    def side_effect(environ, start_response):
+        start_response(status, [])
+        return [b'body']
+
+    app.side_effect = side_effect
+    return app
+
+
+class TestFailedAuthRateLimiter(TestCase):
+    """
+    Tests for the FailedAuthRateLimiter class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class with a fake clock.
+        """
+        self.now = 1000.0
+        self.environ = create_environ(headers={
+            'REMOTE_ADDR': '10.0.0.1', 'HTTP_AUTHORIZATION': 'basic YTph'})
+
+    def create_limiter(self, app):
+        """
+        Creates a limiter allowing 2 failures then one every 10 seconds.
+        """
+        return ratelimit.FailedAuthRateLimiter(
+            app, rate=0.1, burst=2, clock=lambda: self.now)
+
+    def test_rejects_after_failures(self):
+        """
+        Verify clients are rejected with a 429 once their bucket is empty.
+        """
+        app = create_app('403 Forbidden')
+        limiter = self.create_limiter(app)
+        for _ in range(2):
+            limiter(self.environ, mock.MagicMock())
+        start_response = mock.MagicMock()
+        self.assertEquals(
+            [b'Too Many Requests'], limiter(self.environ, start_response))
+        start_response.assert_called_once_with(
+            '429 Too Many Requests', [
+                ('content-type', 'text/html'), ('Retry-After', '10')])
+        self.assertEquals(2, app.call_count)
+
+        # Other users and addresses are not affected
+        other = create_environ(headers={'REMOTE_ADDR': '10.0.0.1'})
+        limiter(other, mock.MagicMock())
+        self.assertEquals(3, app.call_count)
+
+        # The bucket refills
+        self.now += 10
+        limiter(self.environ, mock.MagicMock())
+        self.assertEquals(4, app.call_count)
+
+    def test_successes_are_free(self):
+        """
+        Verify successful authentications do not take tokens.
+        """
+        app = create_app('200 OK')
+        limiter = self.create_limiter(app)
+        for _ in range(5):
+            limiter(self.environ, mock.MagicMock())
+        self.assertEquals(5, app.call_count)
+        self.assertEquals(0, len(limiter.store))
+
+    def test_idle_buckets_expire(self):
+        """
+        Verify buckets are dropped once they would be full again.
+        """
+        limiter = self.create_limiter(create_app('403 Forbidden'))
+        limiter(self.environ, mock.MagicMock())
+        self.assertEquals(1, len(limiter.store))
+        self.now += 60
+        limiter(create_environ(), mock.MagicMock())
+        self.assertEquals(1, len(limiter.store))
+        self.assertIsNone(limiter.store.get(limiter.key(self.environ)))
+
+    def test_handler_failures_are_free(self):
+        """
+        Verify failure statuses of authenticated requests take no tokens.
+        """
+        def app(environ, start_response):
+            environ[AUTHENTICATED_KEY] = True
+            start_response('403 Forbidden', [])
+            return [b'body']
+
+        limiter = self.create_limiter(app)
+        for _ in range(5):
+            start_response = mock.MagicMock()
+            limiter(dict(self.environ), start_response)
+            start_response.assert_called_once_with('403 Forbidden', [])
+        self.assertEquals(0, len(limiter.store))
+
+    def test_concurrent_failures_are_charged(self):
+        """
+        Verify every failure of concurrent requests is charged.
+        """
+        statuses = []
+        depth = []
+
+        def app(environ, start_response):
+            depth.append(None)
+            if len(depth) <= 2:
+                nested = mock.MagicMock()
+                limiter(dict(self.environ), nested)
+                statuses.append(nested.call_args[0][0])
+            start_response('403 Forbidden', [])
+            return [b'body']
+
+        limiter = self.create_limiter(app)
+        limiter(dict(self.environ), mock.MagicMock())
+        self.assertEquals(['403 Forbidden', '403 Forbidden'], statuses)
+        start_response = mock.MagicMock()
+        limiter(dict(self.environ), start_response)
+        # The bucket was overdrawn by one, two tokens are needed
+        start_response.assert_called_once_with(
+            '429 Too Many Requests', [
+                ('content-type', 'text/html'), ('Retry-After', '20')])
+
+    def test_concurrent_successes_are_not_limited(self):
+        """
+        Verify more than burst concurrent authenticated requests pass.
+        """
+        statuses = []
+        depth = []
+
+        def app(environ, start_response):
+            environ[AUTHENTICATED_KEY] = True
+            depth.append(None)
+            if len(depth) <= 11:
+                nested = mock.MagicMock()
+                limiter(dict(self.environ), nested)
+                statuses.append(nested.call_args[0][0])
+            start_response('200 OK', [])
+            return [b'body']
+
+        limiter = self.create_limiter(app)
+        limiter(dict(self.environ), mock.MagicMock())
+        self.assertEquals(['200 OK'] * 11, statuses)
+        self.assertEquals(0, len(limiter.store))
+
+    def test_rejections_are_logged_sparingly(self):
+        """
+        Verify floods of rejections do not flood the log.
+        """
+        limiter = self.create_limiter(create_app('403 Forbidden'))
+        with mock.patch.object(limiter.logger, 'warn') as _warn:
+            for _ in range(50):
+                limiter(self.environ, mock.MagicMock())
+        self.assertEquals(10, _warn.call_count)
@@ -73,3 +73,32 @@ class TestHTTPClientCertAuth(TestCase):
         # With no cn any is valid
         auth = httpauthclientcert.HTTPClientCertAuth(None)
         self.assertTrue(auth.authenticate(environ, mock.MagicMock()))
+
+    def test_cn_allow_set(self):
+        """
+        Verify any cn in a list of allowed cns is accepted
+        """
+        auth = httpauthclientcert.HTTPClientCertAuth(
+            None, cn=["other-cn", "system:master-proxy"])
+        environ = create_environ()
+        environ['SSL_CLIENT_VERIFY'] = self.cert
+        self.assertTrue(auth.authenticate(environ, mock.MagicMock()))
+        self.assertEquals('system:master-proxy', environ['REMOTE_USER'])
+
+    def test_decisions_cached_by_fingerprint(self):
+        """
+        Verify a certificate is only checked once per fingerprint
+        """
+        auth = httpauthclientcert.HTTPClientCertAuth(
+            None, cn="system:master-proxy")
+        for data, expected in ((self.cert, True), ({"bad": "data"}, False)):
+            environ = create_environ()
+            environ['SSL_CLIENT_VERIFY'] = data
+            environ['SSL_CLIENT_FINGERPRINT'] = repr(expected)
+            with mock.patch.object(
+                    auth, 'check_certificate',
+                    wraps=auth.check_certificate) as _check:
+                for _ in range(3):
+                    self.assertEquals(expected, auth.authenticate(
+                        environ, mock.MagicMock()))
+                self.assertEquals(1, _check.call_count)
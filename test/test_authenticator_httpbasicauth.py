@@ -16,6 +16,11 @@
 Test cases for the commissaire_http.authentication package.
 """
 
+import json
+import os
+import tempfile
+import time
+
 from . import TestCase, create_environ, get_fixture_file_path
 
 from unittest import mock
@@ -112,6 +117,139 @@ class TestHTTPBasicAuthByFile(TestCase):
             False,
             self.http_basic_auth.authenticate(environ, mock.MagicMock()))
 
+    def test_check_authentication_uses_cache(self):
+        """
+        Verify a repeated successful verification does not run bcrypt again.
+        """
+        import bcrypt
+        http_basic_auth = httpbasicauth.HTTPBasicAuth(None, self.user_config)
+        with mock.patch('bcrypt.hashpw', wraps=bcrypt.hashpw) as _hashpw:
+            for x in range(3):
+                self.assertTrue(
+                    http_basic_auth.check_authentication('a', 'a'))
+            self.assertEquals(1, _hashpw.call_count)
+        # Only an HMAC of the credentials is stored
+        for key in http_basic_auth._cache._data.keys():
+            self.assertNotIn(b'a:a', key)
+
+    def test_check_authentication_does_not_cache_failures(self):
+        """
+        Verify failed verifications always run bcrypt.
+        """
+        import bcrypt
+        http_basic_auth = httpbasicauth.HTTPBasicAuth(None, self.user_config)
+        with mock.patch('bcrypt.hashpw', wraps=bcrypt.hashpw) as _hashpw:
+            for x in range(2):
+                self.assertFalse(
+                    http_basic_auth.check_authentication('a', 'b'))
+            self.assertEquals(2, _hashpw.call_count)
+
+    def test_check_authentication_cache_invalidated_on_change(self):
+        """
+        Verify cached verifications are dropped when the user data changes.
+        """
+        http_basic_auth = httpbasicauth.HTTPBasicAuth(None, self.user_config)
+        self.assertTrue(http_basic_auth.check_authentication('a', 'a'))
+        http_basic_auth._data['a'] = {
+            'hash': '$2a$04$BcfYMyhJkd19POIMi3B4LuRp0kg/q6gOI8Lgmu/EluXe/R3bHFPkq'}
+        self.assertFalse(http_basic_auth.check_authentication('a', 'a'))
+
+        http_basic_auth._load_from_file(self.user_config)
+        self.assertTrue(http_basic_auth.check_authentication('a', 'a'))
+        self.assertEquals(1, len(http_basic_auth._cache))
+        # Reloading unchanged users keeps their verifications
+        http_basic_auth._load_from_file(self.user_config)
+        self.assertEquals(1, len(http_basic_auth._cache))
+
+    def test_reload_invalidates_changed_users(self):
+        """
+        Verify a reload drops only the cached verifications of changed users.
+        """
+        with open(self.user_config) as users_file:
+            hash_a = json.load(users_file)['a']['hash']
+        hash_x = '$2a$04$BcfYMyhJkd19POIMi3B4LuRp0kg/q6gOI8Lgmu/EluXe/R3bHFPkq'
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as users_file:
+            json.dump({'a': {'hash': hash_a}, 'b': {'hash': hash_x}},
+                      users_file)
+            users_file.flush()
+            http_basic_auth = httpbasicauth.HTTPBasicAuth(
+                None, users_file.name, reload_interval=0)
+            self.assertTrue(http_basic_auth.check_authentication('a', 'a'))
+            self.assertTrue(http_basic_auth.check_authentication('b', 'x'))
+            self.assertEquals(2, len(http_basic_auth._cache))
+
+            users_file.seek(0)
+            users_file.truncate()
+            json.dump({'a': {'hash': hash_a}, 'b': {'hash': hash_a}},
+                      users_file)
+            users_file.flush()
+            http_basic_auth._load_from_file(users_file.name)
+            self.assertEquals(1, len(http_basic_auth._cache))
+            self.assertFalse(http_basic_auth.check_authentication('b', 'x'))
+            self.assertTrue(http_basic_auth.check_authentication('b', 'a'))
+
+            # Users removed from the file are removed
+            users_file.seek(0)
+            users_file.truncate()
+            json.dump({'b': {'hash': hash_a}}, users_file)
+            users_file.flush()
+            http_basic_auth._load_from_file(users_file.name)
+            self.assertFalse(http_basic_auth.check_authentication('a', 'a'))
+
+            # A broken file keeps the current users
+            users_file.write('{')
+            users_file.flush()
+            http_basic_auth._load_from_file(users_file.name)
+            self.assertTrue(http_basic_auth.check_authentication('b', 'a'))
+
+    def test_watch_reloads_changed_file(self):
+        """
+        Verify the file is reloaded in the background when it changes.
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as users_file:
+            json.dump({}, users_file)
+            users_file.flush()
+            http_basic_auth = httpbasicauth.HTTPBasicAuth(
+                None, users_file.name, reload_interval=0.01)
+            self.addCleanup(http_basic_auth.stop_watching)
+            self.assertEquals({}, http_basic_auth._data)
+            with open(self.user_config) as config:
+                users = json.load(config)
+            with open(users_file.name, 'w') as replacement:
+                json.dump(users, replacement)
+            mtime = os.stat(users_file.name).st_mtime + 1
+            os.utime(users_file.name, (mtime, mtime))
+            for _ in range(200):
+                if http_basic_auth._data:
+                    break
+                time.sleep(0.01)
+            self.assertEquals(users, http_basic_auth._data)
+
+    def test_users_are_not_shared(self):
+        """
+        Verify instances do not share the default users.
+        """
+        first = httpbasicauth.HTTPBasicAuth(None, self.user_config)
+        second = httpbasicauth.HTTPBasicAuth(None)
+        self.assertIn('a', first._data)
+        self.assertEquals({}, second._data)
+
+    def test_authenticate_when_verification_saturated(self):
+        """
+        Verify authenticate fails fast with a 503 when bcrypt workers are busy.
+        """
+        from commissaire_http.util.executor import ExecutorSaturatedError
+        http_basic_auth = httpbasicauth.HTTPBasicAuth(None, self.user_config)
+        http_basic_auth._executor.run = mock.MagicMock(
+            side_effect=ExecutorSaturatedError('busy'))
+        start_response = mock.MagicMock()
+        environ = create_environ(headers={'HTTP_AUTHORIZATION': 'basic YTph'})
+        self.assertEquals(
+            [bytes('Service Unavailable', 'utf8')],
+            http_basic_auth.authenticate(environ, start_response))
+        start_response.assert_called_once_with(
+            '503 Service Unavailable', mock.ANY)
+
 
 # TODO: StorageService based?
 '''
@@ -56,7 +56,7 @@ class TestKeystonePassword(TestCase):
         Keystone Password: Verify a valid user authenticates successfully.
         """
         # patch the post function
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # Define what the response should be from post
             _post.return_value = SUCCESS_RESPONSE
 
@@ -71,7 +71,7 @@ class TestKeystonePassword(TestCase):
         Keystone Password: Verify an invalid user fails authentication.
         """
         # patch the post function
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # The response should not have a token
             _post.return_value = FAILURE_RESPONSE
 
@@ -85,7 +85,7 @@ class TestKeystonePassword(TestCase):
         """
         Keystone Password: Verify missing data does not successfully allow authentication.
         """
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # We give the response a token even though it should never get
             # to this point as the initial data is invalid. If it does get
             # the token then authentication succeeds and we know it's a
@@ -16,6 +16,9 @@
 Test cases for the commissaire_http.authentication.keystonetokenauth module.
 """
 
+import json
+import time
+
 import requests
 
 from . import TestCase, create_environ
@@ -38,6 +41,19 @@ SUCCESS_RESPONSE.headers['X-Subject-Token'] = TOKEN
 FAILURE_RESPONSE = requests.Response()
 
 
+def create_success_response(expires_in):
+    """
+    Creates a success response with an expires_at in the future.
+    """
+    expires_at = time.strftime(
+        '%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(time.time() + expires_in))
+    response = requests.Response()
+    response.headers['X-Subject-Token'] = TOKEN
+    response._content = json.dumps(
+        {'token': {'expires_at': expires_at}}).encode('utf-8')
+    return response
+
+
 class TestKeystoneToken(TestCase):
     """
     Tests for the KeystoneToken class.
@@ -55,7 +71,7 @@ class TestKeystoneToken(TestCase):
         Keystone Token: Verify a valid token authenticates successfully.
         """
         # patch the post function
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # Define what the response should be from post
             _post.return_value = SUCCESS_RESPONSE
 
@@ -70,7 +86,7 @@ class TestKeystoneToken(TestCase):
         Keystone Token: Verify an invalid token fails authentication.
         """
         # patch the post function
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # The response should not have a token
             _post.return_value = FAILURE_RESPONSE
 
@@ -84,7 +100,7 @@ class TestKeystoneToken(TestCase):
         """
         Keystone Token: Verify missing data does not successfully allow authentication.
         """
-        with mock.patch('requests.post') as _post:
+        with mock.patch('requests.Session.post') as _post:
             # We give the response a token even though it should never get
             # to this point as the initial data is invalid. If it does get
             # the token then authentication succeeds and we know it's a
@@ -96,3 +112,79 @@ class TestKeystoneToken(TestCase):
                 create_environ(), mock.MagicMock())
             # True means successful authn
             self.assertFalse(result)
+
+    def test_authenticate_uses_cache(self):
+        """
+        Keystone Token: Verify a validated token is not sent to Keystone again.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = create_success_response(3600)
+            for x in range(3):
+                self.assertTrue(self.keystone_token_auth.authenticate(
+                    ENVIRON, mock.MagicMock()))
+            self.assertEquals(1, _post.call_count)
+
+    def test_authenticate_honors_expires_at(self):
+        """
+        Keystone Token: Verify tokens are not cached past their expiration.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = create_success_response(-10)
+            for x in range(2):
+                self.keystone_token_auth.authenticate(
+                    ENVIRON, mock.MagicMock())
+            self.assertEquals(2, _post.call_count)
+            # Responses without an expiration are never cached
+            _post.return_value = SUCCESS_RESPONSE
+            for x in range(2):
+                self.keystone_token_auth.authenticate(
+                    ENVIRON, mock.MagicMock())
+            self.assertEquals(4, _post.call_count)
+
+    def test_authenticate_uses_negative_cache(self):
+        """
+        Keystone Token: Verify rejected tokens are not sent to Keystone again.
+        """
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = FAILURE_RESPONSE
+            for x in range(3):
+                self.assertFalse(self.keystone_token_auth.authenticate(
+                    ENVIRON, mock.MagicMock()))
+            self.assertEquals(1, _post.call_count)
+
+    def test_authenticate_with_stale_token(self):
+        """
+        Keystone Token: Verify stale tokens are used while revalidating.
+        """
+        self.keystone_token_auth = keystonetokenauth.KeystoneToken(
+            None, 'https://example.com/v3/auth/tokens',
+            cache_ttl=0.01, stale_ttl=3600)
+        with mock.patch('requests.Session.post') as _post:
+            _post.return_value = create_success_response(3600)
+            self.assertTrue(self.keystone_token_auth.authenticate(
+                ENVIRON, mock.MagicMock()))
+            time.sleep(0.02)
+            with mock.patch.object(
+                    self.keystone_token_auth,
+                    '_revalidate_in_background') as _revalidate:
+                self.assertTrue(self.keystone_token_auth.authenticate(
+                    ENVIRON, mock.MagicMock()))
+                _revalidate.assert_called_once_with(mock.ANY, TOKEN)
+            self.assertEquals(1, _post.call_count)
+
+
+class TestParseExpiresAt(TestCase):
+    """
+    Tests for the parse_expires_at function.
+    """
+
+    def test_parse_expires_at(self):
+        """
+        Verify Keystone timestamps are parsed with and without microseconds.
+        """
+        for expires_at in (
+                '2016-01-01T00:00:00.000000Z', '2016-01-01T00:00:00Z'):
+            self.assertEquals(
+                1451606400, keystonetokenauth.parse_expires_at(expires_at))
+        self.assertIsNone(keystonetokenauth.parse_expires_at('tomorrow'))
+        self.assertIsNone(keystonetokenauth.parse_expires_at(None))
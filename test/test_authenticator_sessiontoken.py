@@ -0,0 +1,163 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.authentication.sessiontoken module.
+"""
+
+import json
+import os
+import tempfile
+
+from unittest import mock
+
+from . import TestCase, create_environ
+
+from commissaire_http import authentication
+from commissaire_http.authentication import sessiontoken
+
+
+def bearer(token):
+    """
+    Creates an environ carrying a bearer token.
+    """
+    return create_environ(
+        headers={'HTTP_AUTHORIZATION': 'Bearer {}'.format(token)})
+
+
+class TestSessionToken(TestCase):
+    """
+    Tests for the SessionToken class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a keyfile and a fresh instance of the class before each run.
+        """
+        fd, self.keyfile = tempfile.mkstemp()
+        os.close(fd)
+        self.write_keys('1', {'1': 'secret'})
+        self.session_token = sessiontoken.SessionToken(
+            None, keyfile=self.keyfile, reload_interval=0)
+
+    def tearDown(self):
+        """
+        Removes the keyfile.
+        """
+        os.unlink(self.keyfile)
+
+    def write_keys(self, signing, keys):
+        """
+        Writes the keyfile with a new modification time.
+        """
+        with open(self.keyfile, 'w') as kfile:
+            json.dump({'signing': signing, 'keys': keys}, kfile)
+        mtime = os.stat(self.keyfile).st_mtime + len(keys)
+        os.utime(self.keyfile, (mtime, mtime))
+
+    def test_authenticate_with_valid_token(self):
+        """
+        Session Token: Verify issued tokens authenticate.
+        """
+        environ = bearer(self.session_token.create_token('a'))
+        self.assertTrue(
+            self.session_token.authenticate(environ, mock.MagicMock()))
+        self.assertEquals('a', environ['REMOTE_USER'])
+
+    def test_authenticate_with_invalid_token(self):
+        """
+        Session Token: Verify tampered, malformed and missing tokens fail.
+        """
+        token = self.session_token.create_token('a')
+        signed, signature = token.rsplit('.', 1)
+        tampered = '{}.{}'.format(
+            signed[:-2] + 'xx', signature)
+        for environ in (
+                bearer(tampered), bearer('v1.1.e30'), bearer('junk'),
+                bearer('v2.1.e30.AA'), create_environ()):
+            self.assertFalse(
+                self.session_token.authenticate(environ, mock.MagicMock()))
+
+    def test_authenticate_with_expired_token(self):
+        """
+        Session Token: Verify expired tokens fail.
+        """
+        token = self.session_token.create_token('a')
+        with mock.patch('time.time', return_value=1e12):
+            self.assertFalse(self.session_token.authenticate(
+                bearer(token), mock.MagicMock()))
+
+    def test_key_rotation(self):
+        """
+        Session Token: Verify keys rotate without recreating the plugin.
+        """
+        old_token = self.session_token.create_token('a')
+        self.write_keys('2', {'1': 'secret', '2': 'new secret'})
+        new_token = self.session_token.create_token('a')
+        self.assertTrue(new_token.startswith('v1.2.'))
+        for token in (old_token, new_token):
+            self.assertTrue(self.session_token.authenticate(
+                bearer(token), mock.MagicMock()))
+
+        # Dropping the old key invalidates its tokens
+        self.write_keys('2', {'2': 'new secret'})
+        self.assertFalse(self.session_token.authenticate(
+            bearer(old_token), mock.MagicMock()))
+
+    def test_bad_keyfile_keeps_keys(self):
+        """
+        Session Token: Verify a broken keyfile keeps the current keys.
+        """
+        token = self.session_token.create_token('a')
+        self.write_keys('missing', {'1': 'secret'})
+        self.assertTrue(self.session_token.authenticate(
+            bearer(token), mock.MagicMock()))
+
+    def test_issue_through_manager(self):
+        """
+        Session Token: Verify the manager issues tokens after other plugins succeed.
+        """
+        basic = mock.MagicMock(
+            credentials=(authentication.CREDENTIAL_BASIC,),
+            authenticate=mock.MagicMock(return_value=True))
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            return [b'ok']
+
+        manager = authentication.AuthenticationManager(
+            app, [self.session_token, basic])
+        start_response = mock.MagicMock()
+        environ = create_environ(
+            headers={'HTTP_AUTHORIZATION': 'Basic YTph', 'REMOTE_USER': 'a'})
+        self.assertEquals([b'ok'], manager(environ, start_response))
+        headers = dict(start_response.call_args[0][1])
+        token = headers[sessiontoken.SESSION_HEADER]
+
+        # The token authenticates without the basic plugin
+        basic.authenticate.reset_mock()
+        start_response = mock.MagicMock()
+        self.assertEquals([b'ok'], manager(bearer(token), start_response))
+        self.assertFalse(basic.authenticate.called)
+        start_response.assert_called_once_with('200 OK', [])
+
+    def test_without_keyfile(self):
+        """
+        Session Token: Verify a random key is used without a keyfile.
+        """
+        session_token = sessiontoken.SessionToken(None)
+        self.assertTrue(session_token.authenticate(
+            bearer(session_token.create_token()), mock.MagicMock()))
+        self.assertFalse(self.session_token.authenticate(
+            bearer(session_token.create_token()), mock.MagicMock()))
@@ -19,7 +19,10 @@ Test for commissaire_http.bus
 from unittest import mock
 
 from . import TestCase
-from commissaire_http.bus import Bus
+
+from commissaire.bus import BusMixin
+from commissaire_http.bus import Bus, accounting
+from commissaire_http.util import timing
 
 EXCHANGE = 'exchange'
 CONNECTION_URL = 'redis://127.0.0.1:6379//'
@@ -70,3 +73,27 @@ class TestBus(TestCase):
         # We should have a new producer
         _producer.assert_called_once_with(
             self.bus_instance._channel, self.bus_instance._exchange)
+
+    def test_request_is_timed(self):
+        """
+        Verify Bus.request is timed as part of the current request.
+        """
+        timer = timing.RequestTimer()
+        timing.set_current(timer)
+        try:
+            with mock.patch.object(
+                    BusMixin, 'request', return_value={}) as _request:
+                self.bus_instance.request('storage.get', params={})
+        finally:
+            timing.set_current(None)
+        _request.assert_called_once_with('storage.get', params={})
+        self.assertEquals(1, timer.counts['bus'])
+
+    def test_request_is_counted(self):
+        """
+        Verify Bus.request is counted on the current account.
+        """
+        with mock.patch.object(BusMixin, 'request', return_value={}):
+            with accounting.BusAccount() as account:
+                self.bus_instance.request('storage.get', params={})
+        self.assertEquals({'storage.get': 1}, account.requests)
@@ -0,0 +1,161 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.bus.accounting module.
+"""
+
+from . import TestCase, mock
+
+from commissaire_http.bus import accounting
+
+
+class FakeStorageClient:
+    """
+    Storage client whose get_many calls get.
+    """
+
+    def get(self, model):
+        return model
+
+    def get_many(self, models):
+        return [self.get(model) for model in models]
+
+
+class TestBusAccount(TestCase):
+    """
+    Tests for the BusAccount class.
+    """
+
+    def test_current(self):
+        """
+        Verify the account is current only inside its block.
+        """
+        self.assertIsNone(accounting.current())
+        with accounting.BusAccount() as account:
+            self.assertIs(account, accounting.current())
+            accounting.record_request('storage.get')
+        self.assertIsNone(accounting.current())
+        self.assertEquals({'storage.get': 1}, account.requests)
+        # Nothing is recorded without an account
+        accounting.record_request('storage.get')
+
+    def test_budget_warns(self):
+        """
+        Verify going over the budget warns once and is counted.
+        """
+        exceeded = accounting.BUDGET_EXCEEDED.labels('/warn/')
+        before = exceeded.value
+        account = accounting.BusAccount('/warn/', budget=1)
+        with mock.patch.object(account.logger, 'warn') as warn:
+            for x in range(3):
+                account.record_request('storage.list')
+        self.assertEquals(3, account.total)
+        self.assertTrue(account.exceeded)
+        self.assertEquals(1, warn.call_count)
+        self.assertEquals(before + 1, exceeded.value)
+
+    def test_budget_rejects(self):
+        """
+        Verify going over an enforced budget raises before the call.
+        """
+        account = accounting.BusAccount('/reject/', budget=1, reject=True)
+        account.record_request('storage.get')
+        self.assertRaises(
+            accounting.BusBudgetError, account.record_request,
+            'storage.get')
+        self.assertEquals(1, account.total)
+
+    def test_check_budget(self):
+        """
+        Verify budgets can be checked without recording a request.
+        """
+        account = accounting.BusAccount('/check/', budget=1, reject=True)
+        with account:
+            accounting.check_budget('storage.get')
+            self.assertEquals(0, account.total)
+            account.record_request('storage.get')
+            self.assertRaises(
+                accounting.BusBudgetError, accounting.check_budget,
+                'storage.get')
+        self.assertTrue(account.rejected)
+        accounting.check_budget('storage.get')
+
+    def test_call_timings(self):
+        """
+        Verify bus requests are timed up to MAX_CALLS.
+        """
+        account = accounting.BusAccount()
+        call = account.record_request('storage.get')
+        self.assertIsNone(call.duration)
+        call.finish()
+        self.assertGreaterEqual(call.duration, 0)
+        with mock.patch.object(accounting, 'MAX_CALLS', 1):
+            self.assertIsNone(account.record_request('storage.get'))
+        self.assertEquals([call], account.calls)
+        self.assertEquals(2, account.total)
+
+    def test_publish_and_summary(self):
+        """
+        Verify counts are published as metrics and summarized.
+        """
+        requests = accounting.BUS_REQUESTS.labels('/publish/', 'storage.get')
+        storage = accounting.STORAGE_CALLS.labels('/publish/', 'get_many')
+        before = (requests.value, storage.value)
+        account = accounting.BusAccount('/publish/')
+        account.record_request('storage.get')
+        account.record_request('storage.get')
+        account.record_storage('get_many')
+        account.publish()
+        self.assertEquals(before[0] + 2, requests.value)
+        self.assertEquals(before[1] + 1, storage.value)
+        self.assertEquals(
+            'bus=2{storage.get=2} storage={get_many=1}', account.summary())
+        self.assertEquals('bus=0', accounting.BusAccount().summary())
+
+
+class TestBusBudgets(TestCase):
+    """
+    Tests for the BusBudgets class.
+    """
+
+    def test_budgets(self):
+        """
+        Verify budgets can be set, removed and cleared.
+        """
+        budgets = accounting.BusBudgets()
+        budgets.set_budget('/a/', '3')
+        budgets.set_budget('/b/', 1)
+        self.assertEquals(3, budgets.get('/a/'))
+        budgets.set_budget('/b/', None)
+        self.assertEquals({'/a/': 3}, budgets.budgets)
+        budgets.clear()
+        self.assertIsNone(budgets.get('/a/'))
+
+
+class TestAccountedStorageClient(TestCase):
+    """
+    Tests for the AccountedStorageClient class.
+    """
+
+    def test_records_outer_calls(self):
+        """
+        Verify calls are recorded by method, nested calls only once.
+        """
+        client = accounting.AccountedStorageClient(FakeStorageClient())
+        with accounting.BusAccount() as account:
+            self.assertEquals([1, 2], client.get_many([1, 2]))
+            self.assertEquals(1, client.get(1))
+        self.assertEquals({'get_many': 1, 'get': 1}, account.storage)
+        self.assertIs(client.get, client.get)
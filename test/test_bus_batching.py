@@ -0,0 +1,233 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.bus.batching module.
+"""
+
+import threading
+
+from . import TestCase, mock
+
+from commissaire_http.bus import Bus, accounting, batching
+
+
+class FakeModel:
+    """
+    Model with the parts of the commissaire model API batching uses.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    @classmethod
+    def new(cls, **kwargs):
+        return cls(**kwargs)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class FakeClient:
+    """
+    Storage client recording its calls.
+    """
+
+    def __init__(self, missing=()):
+        self.missing = missing
+        self.calls = []
+
+    def _fetch(self, model):
+        if model.address in self.missing:
+            raise LookupError(model.address)
+        return FakeModel(address=model.address, status='active')
+
+    def get(self, model):
+        self.calls.append(('get', [model.address]))
+        return self._fetch(model)
+
+    def get_many(self, models):
+        self.calls.append(('get_many', [model.address for model in models]))
+        return [self._fetch(model) for model in models]
+
+    def list(self, model_class):
+        return 'listed'
+
+
+class TestBatchingStorageClient(TestCase):
+    """
+    Tests for the BatchingStorageClient class.
+    """
+
+    def get_concurrently(self, storage, addresses):
+        """
+        Gets models from one thread per address while another storage
+        request is running, so they are collected for the window.
+
+        :returns: Results or errors in the order of the addresses.
+        """
+        storage._fetching[FakeModel] += 1
+        results = [None] * len(addresses)
+        started = threading.Barrier(len(addresses))
+
+        def get(index, address):
+            started.wait()
+            try:
+                results[index] = storage.get(FakeModel(address=address))
+            except Exception as error:
+                results[index] = error
+
+        threads = [
+            threading.Thread(target=get, args=item)
+            for item in enumerate(addresses)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        storage._fetching[FakeModel] -= 1
+        return results
+
+    def test_single_get(self):
+        """
+        Verify a lone get is sent as a get.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(client, window=0)
+        self.assertEquals(
+            'active', storage.get(FakeModel(address='10.0.0.1')).status)
+        self.assertEquals([('get', ['10.0.0.1'])], client.calls)
+        self.assertEquals('listed', storage.list(FakeModel))
+
+    def test_uncontended_get(self):
+        """
+        Verify a get is sent without waiting out the window when no
+        other storage request is running.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(client, window=30)
+        for address in ('10.0.0.1', '10.0.0.2'):
+            self.assertEquals(
+                address, storage.get(FakeModel(address=address)).address)
+        self.assertEquals(
+            [('get', ['10.0.0.1']), ('get', ['10.0.0.2'])], client.calls)
+        self.assertEquals(0, storage._fetching[FakeModel])
+
+    def test_concurrent_gets(self):
+        """
+        Verify concurrent gets share one deduplicated get_many and get
+        their own instances.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(client, window=0.5)
+        results = self.get_concurrently(
+            storage, ['10.0.0.1', '10.0.0.2', '10.0.0.1'])
+        self.assertEquals(1, len(client.calls))
+        method, addresses = client.calls[0]
+        self.assertEquals('get_many', method)
+        self.assertEquals(['10.0.0.1', '10.0.0.2'], sorted(addresses))
+        self.assertEquals(
+            ['10.0.0.1', '10.0.0.2', '10.0.0.1'],
+            [result.address for result in results])
+        self.assertIsNot(results[0], results[2])
+
+    def test_full_batch(self):
+        """
+        Verify a full batch is sent without waiting out the window.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(
+            client, window=30, max_batch=2)
+        results = self.get_concurrently(storage, ['10.0.0.1', '10.0.0.2'])
+        self.assertEquals([('get_many', mock.ANY)], client.calls)
+        self.assertEquals(2, len(results))
+
+    def test_failed_batch(self):
+        """
+        Verify callers ask again on their own when get_many fails.
+        """
+        client = FakeClient(missing=('10.0.0.2',))
+        storage = batching.BatchingStorageClient(client, window=0.5)
+        results = self.get_concurrently(storage, ['10.0.0.1', '10.0.0.2'])
+        self.assertEquals('10.0.0.1', results[0].address)
+        self.assertIsInstance(results[1], LookupError)
+        self.assertEquals(
+            ['get_many', 'get', 'get'],
+            [method for method, _ in client.calls])
+
+    def test_failed_single_get(self):
+        """
+        Verify the error of a lone get is raised.
+        """
+        storage = batching.BatchingStorageClient(
+            FakeClient(missing=('10.0.0.1',)), window=0)
+        self.assertRaises(
+            LookupError, storage.get, FakeModel(address='10.0.0.1'))
+
+    def test_over_budget_get(self):
+        """
+        Verify a get over the caller's bus budget fails before batching.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(client, window=30)
+        with accounting.BusAccount(budget=0, reject=True):
+            self.assertRaises(
+                accounting.BusBudgetError, storage.get,
+                FakeModel(address='10.0.0.1'))
+        self.assertEquals([], client.calls)
+        self.assertEquals({}, storage._pending)
+
+    def test_budget_error_not_shared(self):
+        """
+        Verify the budget error of the leader is not raised in followers.
+        """
+        client = FakeClient()
+        fetch = client._fetch
+        errors = [accounting.BusBudgetError('over budget')]
+
+        def over_budget_once(model):
+            if errors:
+                raise errors.pop()
+            return fetch(model)
+
+        client._fetch = over_budget_once
+        storage = batching.BatchingStorageClient(client, window=0.5)
+        results = self.get_concurrently(storage, ['10.0.0.1', '10.0.0.1'])
+        self.assertEquals(
+            [accounting.BusBudgetError, FakeModel],
+            sorted((type(result) for result in results),
+                   key=lambda kind: kind.__name__))
+        self.assertEquals(
+            [('get', ['10.0.0.1'])] * 2, client.calls)
+
+    def test_get_host(self):
+        """
+        Verify get_host is batched.
+        """
+        client = FakeClient()
+        storage = batching.BatchingStorageClient(client, window=0)
+        with mock.patch('commissaire_http.bus.batching.models') as models:
+            models.Host = FakeModel
+            self.assertEquals('10.0.0.1', storage.get_host('10.0.0.1').address)
+        self.assertEquals([('get', ['10.0.0.1'])], client.calls)
+
+    def test_bus_batch_storage(self):
+        """
+        Verify the bus storage client can be made to batch.
+        """
+        bus = Bus('exchange', 'memory://', [])
+        bus.batch_storage(0.001)
+        self.assertIsInstance(bus.storage, accounting.AccountedStorageClient)
+        self.assertIsInstance(
+            bus.storage._client, batching.BatchingStorageClient)
+        self.assertEquals(0.001, bus.storage._client.window)
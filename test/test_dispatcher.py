@@ -22,7 +22,8 @@ from io import BytesIO
 
 from . import TestCase, mock
 
-from commissaire_http.bus import Bus
+from commissaire_http.bus import Bus, accounting
+from commissaire_http import dispatcher
 from commissaire_http.dispatcher import Dispatcher
 from commissaire_http.router import Router
 
@@ -121,3 +122,86 @@ class TestDispatcher(TestCase):
         result = self.dispatcher_instance.dispatch(environ, start_response)
         start_response.assert_called_once_with('404 Not Found', mock.ANY)
         self.assertEquals('Not Found', result[0].decode())
+
+    def test_dispatcher_dispatch_with_coalescing(self):
+        """
+        Verify the Dispatcher.dispatch uses the coalescer for GET requests.
+        """
+        self.dispatcher_instance = Dispatcher(
+            self.router_instance,
+            handler_packages=['commissaire_http.handlers'])
+        self.dispatcher_instance.setup_coalescing()
+        self.dispatcher_instance._bus = mock.MagicMock('Bus')
+        environ = {
+            'PATH_INFO': '/hello/',
+            'REQUEST_METHOD': 'GET',
+        }
+        start_response = mock.MagicMock()
+        coalescer = self.dispatcher_instance.coalescer
+        coalescer.key = mock.MagicMock(wraps=coalescer.key)
+        result = self.dispatcher_instance.dispatch(environ, start_response)
+        coalescer.key.assert_called_once_with(environ)
+        start_response.assert_called_once_with('200 OK', mock.ANY)
+        self.assertEquals('{"Hello": "there"}', result[0].decode())
+
+    def test_dispatcher_dispatch_records_metrics(self):
+        """
+        Verify the Dispatcher.dispatch records metrics per route template.
+        """
+        requests = dispatcher.REQUESTS.labels('/hello/', 'GET', '200')
+        unmatched = dispatcher.REQUESTS.labels(
+            dispatcher.UNMATCHED_ROUTE, 'OTHER', '404')
+        seconds = dispatcher.REQUEST_SECONDS.labels('/hello/', 'GET')
+        before = (requests.value, unmatched.value, seconds.snapshot()[2])
+
+        for path, method in (('/hello/', 'GET'), ('/nope/', 'BREW')):
+            environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+            self.dispatcher_instance.dispatch(environ, mock.MagicMock())
+
+        self.assertEquals(before[0] + 1, requests.value)
+        self.assertEquals(before[1] + 1, unmatched.value)
+        self.assertEquals(before[2] + 1, seconds.snapshot()[2])
+        self.assertEquals(
+            0, dispatcher.IN_FLIGHT.labels('/hello/').value)
+
+    def test_dispatcher_dispatch_enforces_bus_budget(self):
+        """
+        Verify the Dispatcher.dispatch holds requests to the route budget.
+        """
+        def handler(environ, start_response):
+            for x in range(3):
+                accounting.record_request('storage.get')
+            start_response('200 OK', [])
+            return [b'']
+
+        self.router_instance.connect(
+            '/loop/', controller=handler, conditions={'method': 'GET'})
+        accounting.BUDGETS.set_budget('/loop/', 2)
+        accounting.BUDGETS.reject = True
+        try:
+            environ = {'PATH_INFO': '/loop/', 'REQUEST_METHOD': 'GET'}
+            start_response = mock.MagicMock()
+            self.dispatcher_instance.dispatch(environ, start_response)
+        finally:
+            accounting.BUDGETS.clear()
+            accounting.BUDGETS.reject = False
+        start_response.assert_called_once_with(
+            '503 Service Unavailable', mock.ANY)
+        account = environ[accounting.ENVIRON_KEY]
+        self.assertEquals(2, account.total)
+        self.assertTrue(account.exceeded)
+        self.assertTrue(account.rejected)
+        self.assertIsNone(accounting.current())
+
+    def test_dispatcher_get_handler_sites(self):
+        """
+        Verify the Dispatcher.get_handler_sites finds handler code.
+        """
+        from commissaire_http.handlers import hello_world
+        code = hello_world.handler.__code__
+        sites = self.dispatcher_instance.get_handler_sites()
+        first, last, route = [
+            site for site in sites[code.co_filename]
+            if site[0] == code.co_firstlineno][0]
+        self.assertEquals('/hello/', route)
+        self.assertGreater(last, first)
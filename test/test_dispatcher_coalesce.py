@@ -0,0 +1,176 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test for commissaire_http.dispatcher.coalesce
+"""
+
+import threading
+
+from . import TestCase, mock
+
+from commissaire_http.dispatcher import coalesce
+from commissaire_http.dispatcher.coalesce import RequestCoalescer
+
+
+def create_environ(method='GET', path='/api/v0/cluster/test/', **kwargs):
+    """
+    Shortcut for a coalescable WSGI environ.
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+    }
+    environ.update(kwargs)
+    return environ
+
+
+class QueuedEvent(threading.Event):
+    """
+    Event setting queued once enough threads wait on it.
+    """
+
+    def __init__(self, expected):
+        super(QueuedEvent, self).__init__()
+        self.expected = expected
+        self.count = 0
+        self.lock = threading.Lock()
+        self.queued = threading.Event()
+
+    def wait(self, timeout=None):
+        with self.lock:
+            self.count += 1
+            if self.count >= self.expected:
+                self.queued.set()
+        return super(QueuedEvent, self).wait(timeout)
+
+
+class TestRequestCoalescer(TestCase):
+    """
+    Test for the RequestCoalescer class.
+    """
+
+    def setUp(self):
+        """
+        Creates a new instance to test with per test.
+        """
+        self.coalescer = RequestCoalescer()
+
+    def test_key_with_unsafe_method(self):
+        """
+        Verify only idempotent methods are coalesced.
+        """
+        for method in ('PUT', 'POST', 'DELETE'):
+            self.assertIsNone(self.coalescer.key(create_environ(method)))
+        self.assertIsNotNone(self.coalescer.key(create_environ()))
+
+    def test_key_with_different_scopes(self):
+        """
+        Verify requests with different credentials do not share a key.
+        """
+        key_a = self.coalescer.key(
+            create_environ(HTTP_AUTHORIZATION='basic YTph'))
+        key_b = self.coalescer.key(
+            create_environ(HTTP_AUTHORIZATION='basic Yjpi'))
+        self.assertNotEqual(key_a, key_b)
+        self.assertEquals(key_a, self.coalescer.key(
+            create_environ(HTTP_AUTHORIZATION='basic YTph')))
+        # Credentials are never stored in plain text
+        self.assertNotIn('basic YTph', key_a)
+
+    def test_call_shares_inflight_result(self):
+        """
+        Verify concurrent identical requests share a single app call.
+        """
+        release = threading.Event()
+        calls = []
+
+        def app(environ, start_response):
+            calls.append(environ)
+            release.wait(5)
+            start_response('200 OK', [('content-type', 'application/json')])
+            return [b'[]']
+
+        environ = create_environ()
+        key = self.coalescer.key(environ)
+        results = []
+        start_responses = []
+
+        def request():
+            start_response = mock.MagicMock()
+            start_responses.append(start_response)
+            results.append(self.coalescer(
+                key, app, dict(environ), start_response))
+
+        call = coalesce._InflightCall()
+        call.done = QueuedEvent(4)
+        threads = [threading.Thread(target=request) for x in range(5)]
+        with mock.patch.object(coalesce, '_InflightCall', return_value=call):
+            for thread in threads:
+                thread.start()
+            # Wait until every follower is queued behind the leader
+            self.assertTrue(call.done.queued.wait(5))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEquals(1, len(calls))
+        self.assertEquals([[b'[]']] * 5, results)
+        for start_response in start_responses:
+            start_response.assert_called_once_with('200 OK', mock.ANY)
+        self.assertEquals({}, self.coalescer._inflight)
+
+    def test_call_shares_exceptions(self):
+        """
+        Verify an exception raised by the app is raised to the caller.
+        """
+        app = mock.MagicMock(side_effect=Exception('test'))
+        environ = create_environ()
+        self.assertRaises(
+            Exception, self.coalescer,
+            self.coalescer.key(environ), app, environ, mock.MagicMock())
+        self.assertEquals({}, self.coalescer._inflight)
+
+    def test_call_with_hung_leader(self):
+        """
+        Verify a follower calls the app itself when the leader hangs.
+        """
+        self.coalescer = RequestCoalescer(wait_timeout=0.01)
+        release = threading.Event()
+        started = threading.Event()
+
+        def app(environ, start_response):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            start_response('200 OK', [])
+            return [b'[]']
+
+        environ = create_environ()
+        key = self.coalescer.key(environ)
+        leader = threading.Thread(
+            target=self.coalescer,
+            args=(key, app, dict(environ), mock.MagicMock()))
+        leader.start()
+        try:
+            self.assertTrue(started.wait(5))
+            start_response = mock.MagicMock()
+            self.assertEquals(
+                [b'[]'], self.coalescer(key, app, environ, start_response))
+            start_response.assert_called_once_with('200 OK', [])
+        finally:
+            release.set()
+            leader.join(5)
+        self.assertEquals({}, self.coalescer._inflight)
@@ -18,6 +18,8 @@ Test for commissaire_http.handlers module.
 
 from . import TestCase
 from commissaire_http import handlers
+from commissaire_http.bus.accounting import BusBudgetError
+from commissaire_http.constants import JSONRPC_ERRORS
 
 UID = '123'
 
@@ -72,3 +74,13 @@ class Test_create_jsonrpc_error(TestCase):
         self.assertEquals(1, result['error']['code'])
         self.assertEquals('test', result['error']['message'])
         self.assertEquals(str(Exception), result['error']['data']['exception'])
+
+    def test_create_jsonrpc_error_with_bus_budget_error(self):
+        """
+        Ensure create_jsonrpc_error keeps bus budget errors recognizable.
+        """
+        result = handlers.create_jsonrpc_error(
+            {'id': UID}, BusBudgetError('test'),
+            JSONRPC_ERRORS['INTERNAL_ERROR'])
+        self.assertEquals(
+            JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED'], result['error']['code'])
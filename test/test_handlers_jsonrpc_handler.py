@@ -19,6 +19,7 @@ Test for commissaire_http.handlers.JSONRPC_Handler.
 from . import TestCase, mock
 
 from commissaire import constants as C
+from commissaire_http import handlers
 from commissaire_http.handlers import JSONRPC_Handler
 
 
@@ -96,6 +97,19 @@ class Test_JSONRPC_Handler(TestCase):
             body = self.jsonrpc_handler(self.environ, self.start_response)
             self.start_response.assert_called_once_with('409 Conflict', mock.ANY)
 
+    def test_error_bus_budget_exceeded(self):
+        """
+        Verify 'BUS_BUDGET_EXCEEDED' error code triggers a 503 status.
+        """
+        with mock.patch('commissaire_http.handlers.get_params') as get_params:
+            get_params.return_value = {}
+            self.json_error['error']['code'] = C.JSONRPC_ERRORS['BUS_BUDGET_EXCEEDED']
+            self.jsonrpc_handler.handler.return_value = self.json_error
+            body = self.jsonrpc_handler(self.environ, self.start_response)
+            self.start_response.assert_called_once_with(
+                '503 Service Unavailable', mock.ANY)
+            self.assertEquals([b'Bus Budget Exceeded'], body)
+
     def test_error_other(self):
         """
         Verify other error codes raise an Exception.
@@ -174,3 +188,26 @@ class Test_JSONRPC_Handler(TestCase):
             self.assertRaises(
                 Exception, self.jsonrpc_handler,
                 self.environ, self.start_response)
+
+    def test_records_metrics(self):
+        """
+        Verify handler latency and outcomes are recorded.
+        """
+        outcomes = (
+            (self.json_result, 'result'),
+            (self.json_error, 'not_found'))
+        self.json_error['error']['code'] = C.JSONRPC_ERRORS['NOT_FOUND']
+        seconds = handlers.HANDLER_SECONDS.labels('mock_handler')
+        count = seconds.snapshot()[2]
+        with mock.patch('commissaire_http.handlers.get_params') as get_params:
+            get_params.return_value = {}
+            for response, outcome in outcomes:
+                counter = handlers.HANDLER_RESPONSES.labels(
+                    'mock_handler', outcome)
+                before = counter.value
+                self.jsonrpc_handler.handler.return_value = response
+                self.jsonrpc_handler(self.environ, self.start_response)
+                self.assertEquals(before + 1, counter.value)
+        self.assertEquals(count + 2, seconds.snapshot()[2])
+        self.assertEquals(
+            0, handlers.HANDLER_IN_FLIGHT.labels('mock_handler').value)
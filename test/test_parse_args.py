@@ -18,11 +18,11 @@ Test for commissaire_http.parse_args
 
 import sys
 
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 
 from . import TestCase
 
-from commissaire_http import Namespace, parse_args
+from commissaire_http import Namespace, parse_args, parse_bus_budget
 
 
 class TestParseArgs(TestCase):
@@ -45,3 +45,13 @@ class TestParseArgs(TestCase):
         ns = parse_args(self.parser)
         self.assertIs(Namespace, type(ns))
         self.assertEquals('test', ns.bus_exchange)
+
+    def test_parse_bus_budget(self):
+        """
+        Verify bus budgets parse into a route and a call count.
+        """
+        self.assertEquals(
+            ('/api/v0/cluster/{name}/', 5),
+            parse_bus_budget('/api/v0/cluster/{name}/=5'))
+        for value in ('/api/v0/cluster/', '=5', '/x/=many'):
+            self.assertRaises(ArgumentTypeError, parse_bus_budget, value)
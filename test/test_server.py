@@ -16,13 +16,24 @@
 Test for commissaire_http.server
 """
 
+import os
+import socket
+import stat
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
 from unittest import mock
 
 from . import TestCase
 
 from commissaire.util.config import ConfigurationError
 
+from commissaire_http import (
+    AdminHttpServer, CommissaireHttpServer, CommissaireRequestHandler)
 from commissaire_http.authentication import AuthenticationManager
+from commissaire_http.bus import accounting
 from commissaire_http.server import cli
 from commissaire_http.dispatcher import Dispatcher
 
@@ -77,3 +88,134 @@ class TestInjectAuthentication(TestCase):
             ConfigurationError,
             cli.inject_authentication,
             {'commissaire_http.doesnotexist': {}})
+
+
+class TestCommissaireRequestHandler(TestCase):
+    """
+    Tests for the CommissaireRequestHandler class.
+    """
+
+    def test_get_environ_with_client_certificate(self):
+        """
+        Verify the client certificate is looked up once per connection.
+        """
+        handler = CommissaireRequestHandler.__new__(CommissaireRequestHandler)
+        handler.request = mock.MagicMock()
+        cert = {'subject': ()}
+        with mock.patch(
+                'wsgiref.simple_server.WSGIRequestHandler.get_environ',
+                side_effect=lambda: {}), mock.patch(
+                    'commissaire_http.get_peer_identity',
+                    return_value=(cert, 'abc')) as _identity:
+            for _ in range(2):
+                env = handler.get_environ()
+                self.assertEquals(cert, env['SSL_CLIENT_VERIFY'])
+                self.assertEquals('abc', env['SSL_CLIENT_FINGERPRINT'])
+            _identity.assert_called_once_with(handler.request)
+
+    def test_log_request_with_bus_account(self):
+        """
+        Verify the access log includes the bus calls of the request.
+        """
+        handler = CommissaireRequestHandler.__new__(CommissaireRequestHandler)
+        handler.requestline = 'GET / HTTP/1.0'
+        account = accounting.BusAccount()
+        account.record_request('storage.get')
+        handler._environ = {accounting.ENVIRON_KEY: account}
+        with mock.patch.object(handler, 'log_message') as _log_message:
+            handler.log_request(200, 2)
+        _log_message.assert_called_once_with(
+            '"%s" %s %s %s', 'GET / HTTP/1.0', '200', '2',
+            'bus=1{storage.get=1}')
+
+
+class TestCommissaireHttpServer(TestCase):
+    """
+    Tests for the CommissaireHttpServer class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a dispatcher echoing the client address.
+        """
+        def dispatch(environ, start_response):
+            start_response('200 OK', [])
+            return [repr(environ['REMOTE_ADDR']).encode('utf-8')]
+
+        self.dispatcher = mock.MagicMock(dispatch=dispatch)
+
+    def request(self, server, sock):
+        """
+        Serves one request from a connected socket and returns the body.
+        """
+        thread = threading.Thread(target=server._httpd.handle_request)
+        thread.start()
+        with sock:
+            sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+            response = b''
+            chunk = sock.recv(4096)
+            while chunk:
+                response += chunk
+                chunk = sock.recv(4096)
+        thread.join()
+        return response.split(b'\r\n\r\n', 1)[1]
+
+    def test_unix_socket(self):
+        """
+        Verify the server listens on a Unix socket.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'commissaire.sock')
+        # A stale socket from a previous run is replaced
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(path)
+        stale.close()
+
+        server = CommissaireHttpServer(
+            None, None, self.dispatcher, unix_socket=path,
+            unix_socket_mode='0600', listen_sockets=[])
+        self.assertEquals(0o600, stat.S_IMODE(os.stat(path).st_mode))
+        client = socket.socket(socket.AF_UNIX)
+        client.connect(path)
+        self.assertEquals(b"''", self.request(server, client))
+        server._httpd.server_close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_passed_socket(self):
+        """
+        Verify the server serves on passed in listening sockets.
+        """
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        server = CommissaireHttpServer(
+            None, None, self.dispatcher, listen_sockets=[listener])
+        self.assertIs(listener, server._httpd.socket)
+        client = socket.create_connection(listener.getsockname())
+        self.assertEquals(b"'127.0.0.1'", self.request(server, client))
+        server._httpd.server_close()
+
+
+class TestAdminHttpServer(TestCase):
+    """
+    Tests for the AdminHttpServer class.
+    """
+
+    def test_serves_metrics(self):
+        """
+        Verify the admin listener serves metrics and 404s anything else.
+        """
+        server = AdminHttpServer('127.0.0.1', 0)
+        server.start()
+        try:
+            url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            with urllib.request.urlopen(url + '/metrics') as response:
+                self.assertEquals(
+                    'text/plain; version=0.0.4; charset=utf-8',
+                    response.headers['content-type'])
+                self.assertIn(b'# TYPE ', response.read())
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(url + '/nope')
+            self.assertEquals(404, error.exception.code)
+            error.exception.close()
+        finally:
+            server.shutdown()
@@ -0,0 +1,96 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.cache module.
+"""
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.util.cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+    """
+    Tests for the TTLCache class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class with a fake clock.
+        """
+        self.now = 1000.0
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def test_get_and_set(self):
+        """
+        Verify values can be stored and retrieved.
+        """
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', 1)
+        self.assertEquals(1, self.cache.get('a'))
+
+    def test_get_with_expired_entry(self):
+        """
+        Verify expired entries are misses and removed.
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=30)
+        self.now += 10
+        self.assertEquals('miss', self.cache.get('a', 'miss'))
+        self.assertEquals(2, self.cache.get('b'))
+        self.assertEquals(1, len(self.cache))
+
+    def test_set_evicts_least_recently_used(self):
+        """
+        Verify the least recently used entry is evicted when full.
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEquals(1, self.cache.get('a'))
+        self.assertEquals(3, self.cache.get('c'))
+
+    def test_set_with_zero_maxsize(self):
+        """
+        Verify a maxsize of 0 disables the cache.
+        """
+        self.cache.maxsize = 0
+        self.cache.set('a', 1)
+        self.assertEquals(0, len(self.cache))
+
+    def test_pop_and_clear(self):
+        """
+        Verify pop and clear remove entries.
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEquals(1, self.cache.pop('a'))
+        self.assertIsNone(self.cache.pop('a'))
+        self.cache.clear()
+        self.assertEquals(0, len(self.cache))
+
+    def test_discard_if(self):
+        """
+        Verify entries matching a predicate are removed.
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEquals(1, self.cache.discard_if(lambda value: value > 1))
+        self.assertEquals(1, self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
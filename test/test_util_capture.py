@@ -0,0 +1,127 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.capture module.
+"""
+
+import json
+import os
+import tempfile
+
+from . import TestCase, create_environ, mock
+
+from commissaire_http.util import capture
+
+
+class TestSanitizeQuery(TestCase):
+    """
+    Tests for the sanitize_query function.
+    """
+
+    def test_sanitize_query(self):
+        """
+        Verify values of sensitive looking parameters are redacted.
+        """
+        self.assertEquals('', capture.sanitize_query(None))
+        self.assertEquals(
+            'status=active&api_token=REDACTED&Password=REDACTED',
+            capture.sanitize_query(
+                'status=active&api_token=abc&Password=secret'))
+
+
+class TestTrafficCapture(TestCase):
+    """
+    Tests for the TrafficCapture middleware.
+    """
+
+    def setUp(self):
+        """
+        Sets up an app and a capture file.
+        """
+        def app(environ, start_response):
+            start_response('201 Created', [('content-type', 'text/plain')])
+            return [b'ok']
+
+        self.app = app
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.start_response = mock.MagicMock()
+
+    def tearDown(self):
+        """
+        Removes the capture file.
+        """
+        os.unlink(self.path)
+
+    def test_capture(self):
+        """
+        Verify request metadata is captured without credentials.
+        """
+        middleware = capture.TrafficCapture(
+            self.app, self.path,
+            clock=mock.MagicMock(side_effect=[99.0, 100.0, 100.25, 100.25]))
+        environ = create_environ('/api/v0/host/10.0.0.1/', headers={
+            'REQUEST_METHOD': 'PUT',
+            'QUERY_STRING': 'token=abc',
+            'CONTENT_LENGTH': '42',
+            'HTTP_AUTHORIZATION': 'Basic dXNlcjpwYXNz',
+        })
+        self.assertEquals([b'ok'], middleware(environ, self.start_response))
+        self.start_response.assert_called_once_with('201 Created', mock.ANY)
+        middleware.close()
+
+        requests = capture.read_capture(self.path)
+        self.assertEquals([{
+            't': 100.0, 'm': 'PUT', 'p': '/api/v0/host/10.0.0.1/',
+            'q': 'token=REDACTED', 'b': 42, 'a': ['basic'], 's': 201,
+            'd': 250.0}], requests)
+        with open(self.path) as capture_file:
+            self.assertNotIn('dXNlcjpwYXNz', capture_file.read())
+
+    def test_sample_rate(self):
+        """
+        Verify requests outside of the sample are not captured.
+        """
+        middleware = capture.TrafficCapture(
+            self.app, self.path, sample_rate=0.0)
+        middleware(create_environ(), self.start_response)
+        middleware.close()
+        self.assertEquals([], capture.read_capture(self.path))
+
+    def test_close_at_exit(self):
+        """
+        Verify the capture is closed at exit, flushing pending writes.
+        """
+        with mock.patch('atexit.register') as register:
+            middleware = capture.TrafficCapture(
+                self.app, self.path, clock=mock.MagicMock(return_value=0.0))
+        register.assert_called_once_with(middleware.close)
+        middleware(create_environ(), self.start_response)
+        self.assertEquals([], capture.read_capture(self.path))
+        with mock.patch('atexit.unregister') as unregister:
+            middleware.close()
+        unregister.assert_called_once_with(middleware.close)
+        self.assertEquals(1, len(capture.read_capture(self.path)))
+
+    def test_read_capture(self):
+        """
+        Verify captures are read in order, skipping bad lines.
+        """
+        with open(self.path, 'w') as capture_file:
+            capture_file.write('\n'.join([
+                json.dumps({'t': 2, 'm': 'GET'}), 'not json',
+                json.dumps([1]), json.dumps({'t': 1, 'm': 'PUT'})]))
+        self.assertEquals(
+            [1, 2], [r['t'] for r in capture.read_capture(self.path)])
@@ -0,0 +1,98 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.circuitbreaker module.
+"""
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.util.circuitbreaker import (
+    CircuitBreaker, CircuitOpenError)
+
+
+class TestCircuitBreaker(TestCase):
+    """
+    Tests for the CircuitBreaker class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class with a fake clock.
+        """
+        self.now = 1000.0
+        self.breaker = CircuitBreaker(
+            'test', failure_threshold=2, reset_timeout=10,
+            clock=lambda: self.now)
+
+    def test_opens_after_threshold(self):
+        """
+        Verify the circuit opens after consecutive failures.
+        """
+        self.breaker.failure()
+        self.assertEquals(CircuitBreaker.CLOSED, self.breaker.state)
+        self.breaker.failure()
+        self.assertEquals(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        """
+        Verify a success resets the consecutive failure count.
+        """
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertEquals(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_half_open_allows_single_trial(self):
+        """
+        Verify a single trial call is allowed after the reset timeout.
+        """
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 10
+        self.assertEquals(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEquals(CircuitBreaker.OPEN, self.breaker.state)
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.success()
+        self.assertEquals(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_late_failures_do_not_extend(self):
+        """
+        Verify failures of calls made before the circuit opened do not
+        restart the reset timeout.
+        """
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 5
+        self.breaker.failure()
+        self.now += 5
+        self.assertEquals(CircuitBreaker.HALF_OPEN, self.breaker.state)
+
+    def test_call(self):
+        """
+        Verify call records results and fails fast when open.
+        """
+        self.assertEquals(1, self.breaker.call(lambda: 1))
+        func = mock.MagicMock(side_effect=OSError)
+        for _ in range(2):
+            self.assertRaises(OSError, self.breaker.call, func)
+        self.assertRaises(CircuitOpenError, self.breaker.call, func)
+        self.assertEquals(2, func.call_count)
@@ -0,0 +1,79 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.executor module.
+"""
+
+import threading
+
+from . import TestCase
+
+from commissaire_http.util import executor
+
+
+class TestBoundedExecutor(TestCase):
+    """
+    Tests for the BoundedExecutor class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class before each run.
+        """
+        self.executor = executor.BoundedExecutor(
+            'test', max_workers=1, queue_timeout=0.01)
+
+    def tearDown(self):
+        """
+        Shuts down the executor after each run.
+        """
+        self.executor.shutdown()
+
+    def test_run(self):
+        """
+        Verify run returns the result of the callable.
+        """
+        self.assertEquals(3, self.executor.run(sum, (1, 2)))
+        self.assertTrue(executor.TASK_SECONDS.labels('test').snapshot()[2])
+
+    def test_run_when_saturated(self):
+        """
+        Verify run fails fast when no slot frees up in time.
+        """
+        release = threading.Event()
+        thread = threading.Thread(
+            target=self.executor.run, args=(release.wait, 5))
+        thread.start()
+        try:
+            while self.executor._slots._value:
+                pass
+            rejected = executor.REJECTED.labels('test').value
+            self.assertRaises(
+                executor.ExecutorSaturatedError,
+                self.executor.run, sum, (1, 2))
+            self.assertEquals(
+                rejected + 1, executor.REJECTED.labels('test').value)
+            self.assertEquals(
+                0, executor.QUEUE_DEPTH.labels('test').value)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_invalid_kind(self):
+        """
+        Verify unknown pool kinds are rejected.
+        """
+        self.assertRaises(
+            ValueError, executor.BoundedExecutor, 'test', kind='fiber')
@@ -0,0 +1,209 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.log module.
+"""
+
+import json
+import logging
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.util import log
+
+
+class Unformattable:
+    """
+    Object which fails the test if it is ever formatted.
+    """
+
+    def __str__(self):
+        raise AssertionError('Formatted while debug logging was off')
+
+
+class TestDebug(TestCase):
+    """
+    Tests for the debug function.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh logger before each run.
+        """
+        self.logger = logging.getLogger('test_util_log')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handler = mock.MagicMock(level=logging.NOTSET)
+        self.logger.handlers = [self.handler]
+
+    def tearDown(self):
+        """
+        Resets the thread sampling state after each run.
+        """
+        log.set_sampled(False)
+
+    def test_debug_does_not_format_when_disabled(self):
+        """
+        Verify debug never formats its arguments when debug is off.
+        """
+        log.debug(self.logger, 'value: {}', Unformattable())
+        self.assertEquals(0, self.handler.handle.call_count)
+
+    def test_debug_formats_when_enabled(self):
+        """
+        Verify debug emits the formatted message when debug is on.
+        """
+        self.logger.setLevel(logging.DEBUG)
+        log.debug(self.logger, 'value: {}', 'test')
+        record = self.handler.handle.call_args[0][0]
+        self.assertEquals('value: test', record.getMessage())
+
+    def test_debug_emits_when_sampled(self):
+        """
+        Verify debug emits for a sampled request even if debug is off.
+        """
+        log.set_sampled(True)
+        self.assertTrue(log.is_debug(self.logger))
+        log.debug(self.logger, 'value: {}', 'test')
+        record = self.handler.handle.call_args[0][0]
+        self.assertEquals(logging.DEBUG, record.levelno)
+        self.assertEquals('value: test', record.getMessage())
+
+    def test_lazy_call(self):
+        """
+        Verify LazyCall arguments are only computed when emitted.
+        """
+        func = mock.MagicMock(return_value=['a', 'b'])
+        log.debug(self.logger, 'value: {}', log.LazyCall(func, 'x'))
+        self.assertEquals(0, func.call_count)
+
+        self.logger.setLevel(logging.DEBUG)
+        log.debug(self.logger, 'value: {}', log.LazyCall(sorted, {'b', 'a'}))
+        record = self.handler.handle.call_args[0][0]
+        self.assertEquals("value: ['a', 'b']", record.getMessage())
+
+
+class TestRouteDebugSampler(TestCase):
+    """
+    Tests for the RouteDebugSampler class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class before each run.
+        """
+        self.sampler = log.RouteDebugSampler()
+
+    def test_sample_with_unknown_route(self):
+        """
+        Verify routes without a rate are never sampled.
+        """
+        self.assertFalse(self.sampler.sample('/api/v0/hosts/'))
+
+    def test_sample_with_rates(self):
+        """
+        Verify rates of 1.0 always and 0 never sample.
+        """
+        self.sampler.set_rate('/api/v0/hosts/', 1.0)
+        self.assertTrue(self.sampler.sample('/api/v0/hosts/'))
+        self.sampler.set_rate('/api/v0/hosts/', 0)
+        self.assertFalse(self.sampler.sample('/api/v0/hosts/'))
+        self.assertEquals({}, self.sampler.rates)
+
+    def test_sample_with_partial_rate(self):
+        """
+        Verify partial rates sample based on random.random.
+        """
+        self.sampler.set_rate('/api/v0/hosts/', 0.5)
+        with mock.patch('random.random', return_value=0.1):
+            self.assertTrue(self.sampler.sample('/api/v0/hosts/'))
+        with mock.patch('random.random', return_value=0.9):
+            self.assertFalse(self.sampler.sample('/api/v0/hosts/'))
+
+
+class TestLogLimiter(TestCase):
+    """
+    Tests for the LogLimiter class.
+    """
+
+    def test_warn(self):
+        """
+        Verify messages past the limit are suppressed and counted.
+        """
+        now = [0]
+        logger = mock.MagicMock()
+        limiter = log.LogLimiter(
+            logger, max_messages=2, period=60, description='things',
+            clock=lambda: now[0])
+        for i in range(5):
+            limiter.warn(str(i))
+        self.assertEquals(
+            [mock.call('0'), mock.call('1')], logger.warn.call_args_list)
+        now[0] += 60
+        logger.reset_mock()
+        limiter.warn('5')
+        self.assertEquals(
+            [mock.call('Suppressed 3 things.'), mock.call('5')],
+            logger.warn.call_args_list)
+
+
+class TestDebugLogApp(TestCase):
+    """
+    Tests for the debug_log_app WSGI app.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh sampler before each run.
+        """
+        self.sampler = log.RouteDebugSampler()
+
+    def call(self, method, query=''):
+        """
+        Calls the app and returns the status and decoded body.
+        """
+        start_response = mock.MagicMock()
+        body = log.debug_log_app(
+            {'REQUEST_METHOD': method, 'QUERY_STRING': query},
+            start_response, self.sampler)
+        return start_response.call_args[0][0], body[0]
+
+    def test_control(self):
+        """
+        Verify route rates are set, reported and removed.
+        """
+        status, body = self.call(
+            'POST', 'route=/api/v0/host/{address}/&rate=0.25')
+        self.assertEquals('200 OK', status)
+        self.assertEquals(
+            {'/api/v0/host/{address}/': 0.25}, json.loads(body.decode()))
+        self.call('POST', 'route=/api/v0/hosts/&rate=1')
+        self.assertTrue(self.sampler.sample('/api/v0/hosts/'))
+
+        self.assertEquals('400 Bad Request', self.call('POST', 'rate=1')[0])
+        self.assertEquals(
+            '400 Bad Request', self.call('POST', 'route=/&rate=x')[0])
+
+        status, body = self.call('DELETE', 'route=/api/v0/hosts/')
+        self.assertEquals(
+            {'/api/v0/host/{address}/': 0.25}, json.loads(body.decode()))
+        self.call('DELETE')
+        self.assertEquals({}, self.sampler.rates)
+        self.assertEquals(
+            {}, json.loads(self.call('GET')[1].decode()))
+
+        self.assertEquals('405 Method Not Allowed', self.call('PUT')[0])
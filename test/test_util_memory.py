@@ -0,0 +1,145 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.memory module.
+"""
+
+import json
+
+from . import TestCase, mock
+
+from commissaire_http.util import memory
+
+#: Objects kept alive by leaky_handler
+LEAKED = []
+
+
+def leaky_handler():
+    """
+    Allocates objects which stay alive.
+    """
+    LEAKED.extend(bytearray(1024) for x in range(100))
+
+
+class TestMemoryDiagnostics(TestCase):
+    """
+    Tests for the MemoryDiagnostics class.
+    """
+
+    def setUp(self):
+        """
+        Sets up diagnostics knowing where leaky_handler lives.
+        """
+        self.diagnostics = memory.MemoryDiagnostics(max_snapshots=2)
+        code = leaky_handler.__code__
+        self.diagnostics.route_sites = {
+            code.co_filename: [
+                (code.co_firstlineno, code.co_firstlineno + 4, '/leak/')]}
+
+    def tearDown(self):
+        """
+        Stops tracing and frees leaked objects.
+        """
+        self.diagnostics.stop()
+        del LEAKED[:]
+
+    def test_diff(self):
+        """
+        Verify growth is found and attributed to the route.
+        """
+        self.diagnostics.start()
+        self.assertTrue(self.diagnostics.tracing)
+        first = self.diagnostics.snapshot()
+        leaky_handler()
+        second = self.diagnostics.snapshot()
+        diff = self.diagnostics.diff(first, second)
+        self.assertEquals('/leak/', diff['top'][0]['route'])
+        self.assertGreaterEqual(diff['top'][0]['count_diff'], 100)
+        self.assertGreaterEqual(diff['routes']['/leak/'], 100 * 1024)
+
+    def test_snapshots_are_bounded(self):
+        """
+        Verify the oldest snapshots are dropped and stop clears them.
+        """
+        self.diagnostics.start()
+        ids = [self.diagnostics.snapshot() for x in range(3)]
+        self.assertEquals(ids[1:], self.diagnostics.snapshot_ids)
+        self.assertRaises(KeyError, self.diagnostics.diff, ids[0], ids[2])
+        self.diagnostics.stop()
+        self.assertFalse(self.diagnostics.tracing)
+        self.assertEquals([], self.diagnostics.snapshot_ids)
+
+    def test_snapshot_requires_tracing(self):
+        """
+        Verify snapshots need tracing to be started.
+        """
+        self.assertRaises(RuntimeError, self.diagnostics.snapshot)
+
+
+class TestMemoryApp(TestCase):
+    """
+    Tests for the memory_app WSGI app.
+    """
+
+    def setUp(self):
+        """
+        Sets up diagnostics to control.
+        """
+        self.diagnostics = memory.MemoryDiagnostics()
+
+    def tearDown(self):
+        """
+        Stops tracing.
+        """
+        self.diagnostics.stop()
+
+    def call(self, method, query=''):
+        """
+        Calls the app and returns the status and body.
+        """
+        start_response = mock.MagicMock()
+        body = memory.memory_app(
+            {'REQUEST_METHOD': method, 'QUERY_STRING': query},
+            start_response, self.diagnostics)
+        return start_response.call_args[0][0], body[0]
+
+    def test_control(self):
+        """
+        Verify tracing is started, snapshots diffed and tracing stopped.
+        """
+        self.assertEquals(
+            '400 Bad Request', self.call('POST', 'action=snapshot')[0])
+        self.assertEquals(
+            '200 OK', self.call('POST', 'action=start&frames=5')[0])
+        ids = [
+            json.loads(self.call('POST', 'action=snapshot')[1].decode())[
+                'snapshot'] for x in range(2)]
+
+        status, body = self.call(
+            'GET', 'first={}&second={}&limit=1'.format(*ids))
+        self.assertEquals('200 OK', status)
+        diff = json.loads(body.decode())
+        self.assertLessEqual(len(diff['top']), 1)
+        self.assertTrue(diff['tracing'])
+
+        self.assertEquals(
+            '400 Bad Request', self.call('GET', 'first=1&second=99')[0])
+        self.assertEquals('400 Bad Request', self.call('POST', 'action=x')[0])
+        self.assertEquals('405 Method Not Allowed', self.call('PUT')[0])
+
+        status, body = self.call('POST', 'action=stop')
+        state = json.loads(body.decode())
+        self.assertFalse(state['tracing'])
+        self.assertEquals([], state['snapshots'])
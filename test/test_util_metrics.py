@@ -0,0 +1,140 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.metrics module.
+"""
+
+import threading
+
+from . import TestCase, mock
+
+from commissaire_http.util import metrics
+
+
+class TestMetrics(TestCase):
+    """
+    Tests for the metric classes.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh registry before each run.
+        """
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        """
+        Verify counters add up increments from many threads.
+        """
+        counter = self.registry.counter('test_total', 'Test.', ('route',))
+
+        def work():
+            for x in range(10000):
+                counter.labels('/').inc()
+
+        threads = [threading.Thread(target=work) for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(40000, counter.labels('/').value)
+
+    def test_gauge(self):
+        """
+        Verify gauges go up, down and can be set.
+        """
+        gauge = self.registry.gauge('test_gauge', 'Test.')
+        gauge.inc(3)
+        gauge.dec()
+        self.assertEquals(2, gauge.labels().value)
+        gauge.set(10)
+        gauge.inc()
+        self.assertEquals(11, gauge.labels().value)
+
+    def test_histogram(self):
+        """
+        Verify histograms count observations into cumulative buckets.
+        """
+        histogram = self.registry.histogram(
+            'test_seconds', 'Test.', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        buckets, total, count = histogram.labels().snapshot()
+        self.assertEquals(
+            [(0.1, 2), (1, 3), (float('inf'), 4)], buckets)
+        self.assertAlmostEqual(5.65, total)
+        self.assertEquals(4, count)
+
+    def test_labels_with_wrong_count(self):
+        """
+        Verify labels raises when given the wrong number of values.
+        """
+        counter = self.registry.counter('test_total', 'Test.', ('route',))
+        self.assertRaises(ValueError, counter.labels)
+
+    def test_registry_get_or_create(self):
+        """
+        Verify the registry returns existing metrics and rejects type clashes.
+        """
+        counter = self.registry.counter('test_total', 'Test.')
+        self.assertIs(counter, self.registry.counter('test_total', 'Test.'))
+        self.assertRaises(
+            ValueError, self.registry.gauge, 'test_total', 'Test.')
+        self.assertEquals([counter], self.registry.metrics())
+
+    def test_render(self):
+        """
+        Verify metrics render in the Prometheus text format.
+        """
+        counter = self.registry.counter(
+            'test_total', 'Test\\ing.', ('route',))
+        counter.labels('/a"b\n').inc(2)
+        histogram = self.registry.histogram(
+            'test_seconds', 'Test.', buckets=(0.1,))
+        histogram.observe(0.05)
+        self.registry.gauge('test_gauge', 'Test.')
+        self.assertEquals(
+            '# HELP test_gauge Test.\n'
+            '# TYPE test_gauge gauge\n'
+            '# HELP test_seconds Test.\n'
+            '# TYPE test_seconds histogram\n'
+            'test_seconds_bucket{le="0.1"} 1\n'
+            'test_seconds_bucket{le="+Inf"} 1\n'
+            'test_seconds_sum 0.05\n'
+            'test_seconds_count 1\n'
+            '# HELP test_total Test\\\\ing.\n'
+            '# TYPE test_total counter\n'
+            'test_total{route="/a\\"b\\n"} 2\n',
+            metrics.render(self.registry))
+
+    def test_metrics_app(self):
+        """
+        Verify the metrics app serves GET and HEAD only.
+        """
+        start_response = mock.MagicMock()
+        body = metrics.metrics_app({'REQUEST_METHOD': 'GET'}, start_response)
+        start_response.assert_called_once_with('200 OK', [
+            ('content-type', metrics.CONTENT_TYPE),
+            ('content-length', str(len(body[0])))])
+        self.assertEquals(metrics.render().encode('utf-8'), body[0])
+
+        start_response = mock.MagicMock()
+        self.assertEquals([], metrics.metrics_app(
+            {'REQUEST_METHOD': 'HEAD'}, start_response))
+
+        start_response = mock.MagicMock()
+        metrics.metrics_app({'REQUEST_METHOD': 'POST'}, start_response)
+        start_response.assert_called_once_with(
+            '405 Method Not Allowed', mock.ANY)
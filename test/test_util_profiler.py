@@ -0,0 +1,192 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.profiler module.
+"""
+
+import json
+import os
+import signal
+import tempfile
+import threading
+
+from . import TestCase, mock
+
+from commissaire_http.util import profiler
+
+
+def busy_loop(done):
+    """
+    Keeps a thread busy until done is set.
+    """
+    while not done.is_set():
+        sum(range(100))
+
+
+class TestSamplingProfiler(TestCase):
+    """
+    Tests for the SamplingProfiler class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a profiler writing to a temporary directory.
+        """
+        self.profiler = profiler.SamplingProfiler(
+            interval=0.001, output_dir=tempfile.mkdtemp())
+
+    def test_frame_name(self):
+        """
+        Verify frame names can not break the collapsed format.
+        """
+        code = mock.MagicMock(co_qualname='A.b c;d')
+        self.assertEquals(
+            'mod:A.b_c:d', profiler.frame_name(code, 'mod'))
+
+    def test_begin_request_when_inactive(self):
+        """
+        Verify requests are not registered outside of a profile.
+        """
+        self.assertFalse(self.profiler.begin_request('/'))
+        self.assertEquals({}, self.profiler._threads)
+
+    def test_profile(self):
+        """
+        Verify stacks of profiled requests are collected by route.
+        """
+        done = threading.Event()
+
+        def request():
+            self.assertTrue(self.profiler.begin_request('/busy/'))
+            try:
+                busy_loop(done)
+            finally:
+                self.profiler.end_request()
+
+        path = self.profiler.start(duration=10)
+        self.assertRaises(profiler.ProfilerBusyError, self.profiler.start)
+        worker = threading.Thread(target=request)
+        worker.start()
+        try:
+            # Wait for the first sample
+            while not self.profiler._names:
+                done.wait(0.01)
+            self.profiler.stop()
+        finally:
+            done.set()
+            worker.join()
+        self.assertFalse(self.profiler.active)
+        with open(path) as profile:
+            lines = profile.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('/busy/;'))
+        self.assertIn(':busy_loop', stack)
+        self.assertGreater(int(count), 0)
+        # Only the server may read the profile and nothing is left over
+        self.assertEquals(0o600, os.stat(path).st_mode & 0o777)
+        self.assertEquals(
+            [os.path.basename(path)], os.listdir(self.profiler.output_dir))
+
+    def test_signal_handler(self):
+        """
+        Verify the signal starts a profile and ends it early.
+        """
+        previous = signal.getsignal(signal.SIGUSR2)
+        try:
+            profiler.install_signal_handler(self.profiler, duration=10)
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(self.profiler.active)
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.profiler.stop()
+            self.assertFalse(self.profiler.active)
+            self.assertTrue(os.path.exists(self.profiler.path))
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+    def test_signal_handler_error(self):
+        """
+        Verify a profile which can not start is logged, not raised.
+        """
+        self.profiler.output_dir = os.path.join(
+            self.profiler.output_dir, 'missing')
+        previous = signal.getsignal(signal.SIGUSR2)
+        try:
+            profiler.install_signal_handler(self.profiler, duration=10)
+            with mock.patch.object(self.profiler.logger, 'error') as error:
+                os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertEquals(1, error.call_count)
+            self.assertFalse(self.profiler.active)
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+
+class TestProfilerApp(TestCase):
+    """
+    Tests for the profiler_app WSGI app.
+    """
+
+    def setUp(self):
+        """
+        Sets up a profiler writing to a temporary directory.
+        """
+        self.profiler = profiler.SamplingProfiler(
+            output_dir=tempfile.mkdtemp())
+
+    def call(self, method, query=''):
+        """
+        Calls the app and returns the status and decoded body.
+        """
+        start_response = mock.MagicMock()
+        body = profiler.profiler_app(
+            {'REQUEST_METHOD': method, 'QUERY_STRING': query},
+            start_response, self.profiler)
+        return start_response.call_args[0][0], body[0]
+
+    def test_control(self):
+        """
+        Verify profiles are started, reported and stopped.
+        """
+        status, body = self.call('GET')
+        self.assertEquals('200 OK', status)
+        self.assertFalse(json.loads(body.decode())['active'])
+
+        self.assertEquals(
+            '400 Bad Request', self.call('POST', 'seconds=x')[0])
+
+        status, body = self.call('POST', 'seconds=10&rate=0.5')
+        self.assertEquals('202 Accepted', status)
+        state = json.loads(body.decode())
+        self.assertTrue(state['active'])
+        self.assertEquals(0.5, state['sample_rate'])
+        self.assertEquals('409 Conflict', self.call('POST')[0])
+
+        status, body = self.call('DELETE')
+        self.assertFalse(json.loads(body.decode())['active'])
+        self.assertTrue(os.path.exists(state['path']))
+
+        self.assertEquals('405 Method Not Allowed', self.call('PUT')[0])
+
+    def test_start_error(self):
+        """
+        Verify a profile which can not start is answered with a 500.
+        """
+        self.profiler.output_dir = os.path.join(
+            self.profiler.output_dir, 'missing')
+        with mock.patch.object(self.profiler.logger, 'error'):
+            status, body = self.call('POST')
+        self.assertEquals('500 Internal Server Error', status)
+        self.assertIn(b'Unable to start profile', body)
+        self.assertFalse(self.profiler.active)
@@ -0,0 +1,129 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.proxy module.
+"""
+
+from unittest import mock
+
+from . import TestCase, create_environ
+
+from commissaire_http.authentication import httpauthclientcert
+from commissaire_http.util.proxy import TrustedProxies, parse_dn
+
+#: Headers a proxy sends for a verified client certificate
+CERT_HEADERS = {
+    'HTTP_X_SSL_CLIENT_VERIFY': 'SUCCESS',
+    'HTTP_X_SSL_CLIENT_S_DN': 'CN=system:master-proxy,O=system:master',
+    'HTTP_X_SSL_CLIENT_FINGERPRINT': 'AB:CD',
+}
+
+
+class TestParseDn(TestCase):
+    """
+    Tests for the parse_dn function.
+    """
+
+    def test_parse_dn(self):
+        """
+        Verify distinguished names parse into the getpeercert() structure.
+        """
+        self.assertEquals(
+            ((('organizationName', 'a,b'),),
+             (('commonName', 'host'), ('userId', 'x'))),
+            parse_dn(r'CN=host+UID=x,O=a\,b'))
+        self.assertRaises(ValueError, parse_dn, 'nonsense')
+
+
+class TestTrustedProxies(TestCase):
+    """
+    Tests for the TrustedProxies class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh instance of the class before each run.
+        """
+        self.app = mock.MagicMock(return_value=[])
+        self.proxies = TrustedProxies(
+            self.app, ['10.0.0.0/24', 'unix'])
+
+    def call(self, remote_addr, headers):
+        """
+        Calls the middleware and returns the environ the app received.
+        """
+        headers = dict(headers, REMOTE_ADDR=remote_addr)
+        self.proxies(create_environ(headers=headers), mock.MagicMock())
+        return self.app.call_args[0][0]
+
+    def test_trusted_proxy_fills_environ(self):
+        """
+        Verify headers from trusted proxies fill the client fields.
+        """
+        headers = dict(
+            CERT_HEADERS, HTTP_X_FORWARDED_FOR='192.0.2.1, 10.0.0.2')
+        environ = self.call('10.0.0.1', headers)
+        self.assertEquals('192.0.2.1', environ['REMOTE_ADDR'])
+        self.assertEquals('abcd', environ['SSL_CLIENT_FINGERPRINT'])
+
+        # The same fields HTTPClientCertAuth reads for in process TLS
+        auth = httpauthclientcert.HTTPClientCertAuth(
+            None, cn='system:master-proxy')
+        self.assertTrue(auth.authenticate(environ, mock.MagicMock()))
+
+    def test_unix_socket_peer(self):
+        """
+        Verify Unix socket peers are trusted when configured.
+        """
+        headers = dict(CERT_HEADERS)
+        del headers['HTTP_X_SSL_CLIENT_FINGERPRINT']
+        environ = self.call('', headers)
+        self.assertEquals(
+            'system:master-proxy',
+            environ['SSL_CLIENT_VERIFY']['subject'][-1][0][1])
+        self.assertTrue(environ['SSL_CLIENT_FINGERPRINT'].startswith('dn-'))
+
+    def test_unverified_certificate(self):
+        """
+        Verify certificates the proxy did not verify are ignored.
+        """
+        environ = self.call('10.0.0.1', dict(
+            CERT_HEADERS, HTTP_X_SSL_CLIENT_VERIFY='FAILED:expired'))
+        self.assertIsNone(environ['SSL_CLIENT_VERIFY'])
+        self.assertIsNone(environ['SSL_CLIENT_FINGERPRINT'])
+
+    def test_untrusted_peer_headers_dropped(self):
+        """
+        Verify headers from anyone but a trusted proxy are removed.
+        """
+        headers = dict(CERT_HEADERS, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        environ = self.call('192.0.2.1', headers)
+        self.assertEquals('192.0.2.1', environ['REMOTE_ADDR'])
+        for key in headers:
+            self.assertNotIn(key, environ)
+        self.assertNotIn('SSL_CLIENT_VERIFY', environ)
+
+    def test_get_client_address(self):
+        """
+        Verify the client is the last address which is not a proxy.
+        """
+        self.assertEquals(
+            '192.0.2.2', self.proxies.get_client_address(
+                '192.0.2.1, 192.0.2.2, 10.0.0.5', '10.0.0.1'))
+        self.assertEquals(
+            '10.0.0.5', self.proxies.get_client_address(
+                'junk, 10.0.0.5', '10.0.0.1'))
+        self.assertEquals(
+            '10.0.0.1', self.proxies.get_client_address('junk', '10.0.0.1'))
@@ -0,0 +1,124 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.replay module.
+"""
+
+import json
+import threading
+
+from argparse import ArgumentTypeError
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from . import TestCase
+
+from commissaire_http.util import replay
+
+
+class QuietHandler(WSGIRequestHandler):
+    """
+    Request handler which does not log.
+    """
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReplay(TestCase):
+    """
+    Tests for the replay functions.
+    """
+
+    def test_make_body(self):
+        """
+        Verify bodies are valid JSON of the captured size.
+        """
+        self.assertIsNone(replay.make_body(0))
+        body = replay.make_body(100)
+        self.assertEquals(100, len(body))
+        json.loads(body.decode())
+
+    def test_schedule(self):
+        """
+        Verify offsets are relative to the first request and scaled.
+        """
+        requests = [{'t': 10.0}, {'t': 11.0}, {'t': 14.0}]
+        self.assertEquals(
+            [0.0, 0.5, 2.0],
+            [offset for offset, _ in replay.schedule(requests, 2.0)])
+        self.assertEquals(
+            [0.0, 0.0, 0.0],
+            [offset for offset, _ in replay.schedule(requests, 0)])
+        self.assertEquals([], replay.schedule([]))
+
+    def test_parse_header(self):
+        """
+        Verify headers parse into a name and value.
+        """
+        self.assertEquals(
+            ('Authorization', 'Basic abc'),
+            replay.parse_header('Authorization: Basic abc'))
+        self.assertRaises(ArgumentTypeError, replay.parse_header, 'nope')
+
+
+class TestReplayer(TestCase):
+    """
+    Tests for the Replayer class.
+    """
+
+    def test_unsupported_url(self):
+        """
+        Verify only http and https urls are accepted.
+        """
+        self.assertRaises(ValueError, replay.Replayer, 'ftp://127.0.0.1')
+
+    def test_replay(self):
+        """
+        Verify captured requests are sent with their path, query and a
+        body of their size.
+        """
+        received = []
+
+        def app(environ, start_response):
+            received.append((
+                environ['REQUEST_METHOD'], environ['PATH_INFO'],
+                environ['QUERY_STRING'], environ.get('CONTENT_LENGTH') or None,
+                environ.get('HTTP_AUTHORIZATION')))
+            start_response('200 OK', [('content-type', 'text/plain')])
+            return [b'ok']
+
+        server = make_server('127.0.0.1', 0, app, handler_class=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            replayer = replay.Replayer(
+                'http://127.0.0.1:{}/'.format(server.server_address[1]),
+                concurrency=2, headers={'Authorization': 'Basic abc'})
+            elapsed = replayer.replay(replay.schedule([
+                {'t': 1.0, 'm': 'GET', 'p': '/api/v0/hosts/', 'q': 'a=1'},
+                {'t': 1.01, 'm': 'PUT', 'p': '/api/v0/host/10.0.0.1/',
+                 'b': 20},
+            ]))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEquals(sorted([
+            ('GET', '/api/v0/hosts/', 'a=1', None, 'Basic abc'),
+            ('PUT', '/api/v0/host/10.0.0.1/', '', '20', 'Basic abc'),
+        ]), sorted(received))
+        summary = replayer.summary(elapsed)
+        self.assertEquals(2, summary['requests'])
+        self.assertEquals({'200': 2}, summary['statuses'])
@@ -0,0 +1,63 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.systemd module.
+"""
+
+import os
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.util import systemd
+
+
+class TestListenSockets(TestCase):
+    """
+    Tests for the listen_sockets function.
+    """
+
+    def test_listen_sockets(self):
+        """
+        Verify sockets passed to this process are returned.
+        """
+        environ = {'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '2'}
+        with mock.patch.dict('os.environ', environ), \
+                mock.patch('os.set_inheritable') as _set_inheritable, \
+                mock.patch('socket.socket') as _socket:
+            self.assertEquals(2, len(systemd.listen_sockets()))
+            _socket.assert_has_calls([
+                mock.call(fileno=3), mock.call(fileno=4)])
+            _set_inheritable.assert_has_calls([
+                mock.call(3, False), mock.call(4, False)])
+            self.assertNotIn('LISTEN_FDS', os.environ)
+
+    def test_listen_sockets_for_other_process(self):
+        """
+        Verify sockets passed to another process are ignored.
+        """
+        environ = {'LISTEN_PID': str(os.getpid() + 1), 'LISTEN_FDS': '1'}
+        with mock.patch.dict('os.environ', environ), \
+                mock.patch('socket.socket') as _socket:
+            self.assertEquals([], systemd.listen_sockets())
+            self.assertFalse(_socket.called)
+
+    def test_listen_sockets_without_activation(self):
+        """
+        Verify no sockets are returned without socket activation.
+        """
+        with mock.patch.dict('os.environ', clear=True):
+            self.assertEquals([], systemd.listen_sockets())
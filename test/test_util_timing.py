@@ -0,0 +1,130 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.timing module.
+"""
+
+from . import TestCase, create_environ, mock
+
+from commissaire_http.util import timing
+
+
+class TestRequestTimer(TestCase):
+    """
+    Tests for the RequestTimer class.
+    """
+
+    def test_header_and_summary(self):
+        """
+        Verify phases are reported in order with the bus call count.
+        """
+        clock = mock.MagicMock(side_effect=[0.0, 0.010, 0.010])
+        timer = timing.RequestTimer(clock=clock)
+        timer.add('bus', 0.002)
+        timer.add('auth', 0.001)
+        timer.add('bus', 0.003)
+        self.assertEquals(
+            'auth;dur=1.000, bus;dur=5.000;desc="2 calls", total;dur=10.000',
+            timer.header())
+        self.assertEquals('auth=1.0ms bus=5.0ms/2', timer.summary())
+
+    def test_summary_while_adding(self):
+        """
+        Verify a summary can be made from another thread in the middle
+        of an add.
+        """
+        timer = timing.RequestTimer()
+        timer.add('auth', 0.001)
+        # add() records the duration before the count
+        timer.durations['custom'] = 0.002
+        self.assertEquals('auth=1.0ms custom=2.0ms', timer.summary())
+
+
+class TestTimed(TestCase):
+    """
+    Tests for the timed context manager.
+    """
+
+    def test_timed(self):
+        """
+        Verify timed records into the current timer only.
+        """
+        with timing.timed('route'):
+            pass
+        timer = timing.RequestTimer()
+        timing.set_current(timer)
+        try:
+            with timing.timed('route'):
+                pass
+        finally:
+            timing.set_current(None)
+        self.assertEquals({'route': 1}, timer.counts)
+        self.assertIsNone(timing.current())
+
+
+class TestServerTiming(TestCase):
+    """
+    Tests for the ServerTiming middleware.
+    """
+
+    def setUp(self):
+        """
+        Sets up an app making two bus calls.
+        """
+        def app(environ, start_response):
+            self.assertIs(environ[timing.ENVIRON_KEY], timing.current())
+            start_response('200 OK', [('content-type', 'text/plain')])
+            for x in range(2):
+                with timing.timed('bus'):
+                    pass
+            return [b'ok']
+
+        self.app = app
+        self.start_response = mock.MagicMock()
+
+    def get_headers(self):
+        """
+        Returns the headers passed to start_response as a dict.
+        """
+        self.start_response.assert_called_once_with('200 OK', mock.ANY)
+        return dict(self.start_response.call_args[0][1])
+
+    def test_debug_header(self):
+        """
+        Verify the Server-Timing header is returned on request.
+        """
+        middleware = timing.ServerTiming(self.app, debug_header=True)
+        environ = create_environ(headers={'HTTP_X_COMMISSAIRE_TIMING': '1'})
+        self.assertEquals([b'ok'], middleware(environ, self.start_response))
+        self.assertIn(
+            'desc="2 calls"', self.get_headers()['Server-Timing'])
+        self.assertIsNone(timing.current())
+
+    def test_debug_header_disabled(self):
+        """
+        Verify the debug header is ignored unless enabled.
+        """
+        middleware = timing.ServerTiming(self.app)
+        environ = create_environ(headers={'HTTP_X_COMMISSAIRE_TIMING': '1'})
+        middleware(environ, self.start_response)
+        self.assertNotIn('Server-Timing', self.get_headers())
+
+    def test_sample_rate(self):
+        """
+        Verify sampled requests get the Server-Timing header.
+        """
+        middleware = timing.ServerTiming(self.app, sample_rate=1.0)
+        middleware(create_environ(), self.start_response)
+        self.assertIn('Server-Timing', self.get_headers())
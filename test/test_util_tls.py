@@ -0,0 +1,90 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.tls module.
+"""
+
+import hashlib
+
+from unittest import mock
+
+from . import TestCase
+
+from commissaire_http.util.cache import TTLCache
+from commissaire_http.util.tls import get_common_names, get_peer_identity
+
+#: Reusable parsed certificate
+CERT = {'subject': (
+    (('organizationName', 'system:master'),),
+    (('commonName', 'system:master-proxy'),))}
+
+
+def create_socket(der=b'der'):
+    """
+    Creates a fake TLS socket with a client certificate.
+    """
+    sock = mock.MagicMock()
+
+    def getpeercert(binary_form=False):
+        return der if binary_form else CERT
+
+    sock.getpeercert.side_effect = getpeercert
+    return sock
+
+
+class TestGetCommonNames(TestCase):
+    """
+    Tests for the get_common_names function.
+    """
+
+    def test_get_common_names(self):
+        """
+        Verify common names are extracted from the subject.
+        """
+        self.assertEquals(
+            ('system:master-proxy', ), get_common_names(CERT))
+        self.assertEquals((), get_common_names({}))
+
+
+class TestGetPeerIdentity(TestCase):
+    """
+    Tests for the get_peer_identity function.
+    """
+
+    def test_get_peer_identity_caches_by_fingerprint(self):
+        """
+        Verify certificates are parsed once per fingerprint.
+        """
+        cache = TTLCache()
+        fingerprint = hashlib.sha256(b'der').hexdigest()
+        for _ in range(2):
+            sock = create_socket()
+            self.assertEquals(
+                (CERT, fingerprint), get_peer_identity(sock, cache))
+        # Only the binary form was requested the second time
+        sock.getpeercert.assert_called_once_with(binary_form=True)
+
+    def test_get_peer_identity_without_certificate(self):
+        """
+        Verify plain sockets and missing certificates have no identity.
+        """
+        self.assertEquals(
+            (None, None), get_peer_identity(create_socket(der=None)))
+        sock = mock.MagicMock(getpeercert=mock.MagicMock(
+            side_effect=AttributeError))
+        self.assertEquals((None, None), get_peer_identity(sock))
+        sock = mock.MagicMock(getpeercert=mock.MagicMock(
+            side_effect=ValueError))
+        self.assertEquals((None, None), get_peer_identity(sock))
@@ -0,0 +1,173 @@
+# Copyright (C) 2016  Red Hat, Inc
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Test cases for the commissaire_http.util.watchdog module.
+"""
+
+import threading
+
+from . import TestCase, create_environ, mock
+
+from commissaire_http.bus import accounting
+from commissaire_http.util import timing, watchdog
+
+
+class TestRequestWatchdog(TestCase):
+    """
+    Tests for the RequestWatchdog class.
+    """
+
+    def setUp(self):
+        """
+        Sets up a watchdog without a thread and a blocked request.
+        """
+        self.watchdog = watchdog.RequestWatchdog(threshold=0)
+        self.watchdog.running = True
+        self.registered = threading.Event()
+        self.done = threading.Event()
+
+    def tearDown(self):
+        """
+        Releases blocked requests.
+        """
+        self.done.set()
+
+    def blocked_request(self, route='/api/v0/host/{address}/status/'):
+        """
+        Starts a request blocked in a bus call until done is set.
+        """
+        environ = create_environ('/api/v0/host/10.0.0.1/status/')
+        environ['REQUEST_METHOD'] = 'GET'
+
+        def request():
+            account = accounting.BusAccount(route)
+            environ[accounting.ENVIRON_KEY] = account
+            environ[timing.ENVIRON_KEY] = timing.RequestTimer()
+            account.record_request('storage.get').finish()
+            account.record_request('container.get_node_status')
+            self.watchdog.begin_request(environ, route)
+            self.registered.set()
+            try:
+                self.done.wait()
+            finally:
+                self.watchdog.end_request()
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.registered.wait()
+        self.registered.clear()
+        return thread
+
+    def test_begin_request_when_stopped(self):
+        """
+        Verify requests are not registered while stopped.
+        """
+        self.watchdog.running = False
+        self.assertFalse(self.watchdog.begin_request({}, '/'))
+
+    def test_start_without_threshold(self):
+        """
+        Verify the watchdog needs a threshold.
+        """
+        self.assertRaises(ValueError, watchdog.RequestWatchdog().start)
+
+    def test_report(self):
+        """
+        Verify slow requests are reported once with stack and bus calls.
+        """
+        thread = self.blocked_request()
+        with mock.patch.object(self.watchdog.logger, 'warn') as warn:
+            self.assertEquals(1, self.watchdog.check())
+            self.assertEquals(0, self.watchdog.check())
+        self.done.set()
+        thread.join()
+        report = warn.call_args[0][0]
+        self.assertIn(
+            'Request GET /api/v0/host/10.0.0.1/status/ '
+            '(/api/v0/host/{address}/status/)', report)
+        self.assertIn('storage.get took', report)
+        self.assertIn('container.get_node_status in flight', report)
+        self.assertIn('Phases so far:', report)
+        self.assertIn('self.done.wait()', report)
+        self.assertEquals({}, self.watchdog._requests)
+
+    def test_rate_limit(self):
+        """
+        Verify reports past the limit are counted but not written.
+        """
+        self.watchdog.reports.max_messages = 1
+        slow = watchdog.SLOW_REQUESTS.labels('/limited/')
+        before = slow.value
+        threads = [self.blocked_request('/limited/') for x in range(2)]
+        with mock.patch.object(self.watchdog.logger, 'warn') as warn:
+            self.assertEquals(1, self.watchdog.check())
+            self.assertEquals(1, warn.call_count)
+            # The next period mentions what was suppressed
+            self.watchdog.reports.period = 0
+            self.watchdog.reports.allow()
+        self.done.set()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(before + 2, slow.value)
+        self.assertEquals(
+            'Suppressed 1 slow request reports.', warn.call_args[0][0])
+
+    def test_end_request(self):
+        """
+        Verify finished slow requests are logged with the phase breakdown.
+        """
+        environ = create_environ('/api/v0/hosts/')
+        environ['REQUEST_METHOD'] = 'GET'
+        environ[timing.ENVIRON_KEY] = timing.RequestTimer()
+        environ[timing.ENVIRON_KEY].add('bus', 0.5)
+        slow = watchdog.SLOW_REQUESTS.labels('/api/v0/hosts/')
+        before = slow.value
+        self.watchdog.begin_request(environ, '/api/v0/hosts/')
+        with mock.patch.object(self.watchdog.logger, 'warn') as warn:
+            self.watchdog.end_request('200')
+        message = warn.call_args[0][0]
+        self.assertIn('Slow request GET /api/v0/hosts/ 200 took', message)
+        self.assertIn('bus=', message)
+        self.assertEquals(before + 1, slow.value)
+        self.assertEquals({}, self.watchdog._requests)
+
+    def test_end_request_under_threshold(self):
+        """
+        Verify fast requests are not logged when they finish.
+        """
+        self.watchdog.threshold = 60
+        self.watchdog.begin_request(create_environ(), '/')
+        with mock.patch.object(self.watchdog.logger, 'warn') as warn:
+            self.watchdog.end_request('200')
+        self.assertFalse(warn.called)
+
+    def test_thread(self):
+        """
+        Verify the watchdog thread reports slow requests.
+        """
+        self.watchdog = watchdog.RequestWatchdog(interval=0.01)
+        reported = threading.Event()
+        with mock.patch.object(
+                self.watchdog.logger, 'warn',
+                side_effect=lambda message: reported.set()):
+            self.watchdog.start(threshold=0.01)
+            thread = self.blocked_request()
+            try:
+                self.assertTrue(reported.wait(5))
+            finally:
+                self.done.set()
+                thread.join()
+                self.watchdog.stop()
+        self.assertFalse(self.watchdog.running)